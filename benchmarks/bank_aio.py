@@ -0,0 +1,126 @@
+"""
+Throughput of the bank server served by its thread pool and by grpc.aio
+(--aio), at different write-ahead log commit windows.
+
+For each commit window and mode a fresh bank server is started in a
+scratch directory (so that its logs don't go to server/logs), with the
+default fsync durability and admission control off. A grpc.aio client then
+issues a fixed number of FetchBalance or Credit RPCs straight at the bank,
+with a given number in flight. Run from the repository root:
+
+    python3 benchmarks/bank_aio.py --commit-windows-ms 2,20 --concurrency 64,512
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+INITIAL_BALANCE = 1e9
+NUM_CHANNELS = 8
+MODES = {
+    "threads": [],
+    "aio": ["--aio"]
+}
+RPCS = ["FetchBalance", "Credit"]
+
+
+def startBank(port, work_dir, commit_window_ms, extra_args):
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    command = [
+        sys.executable, str(repo_dir / "server" / "bank_server.py"),
+        f"--port={port}",
+        f"--data-dir={work_dir / 'data'}",
+        f"--wal-commit-window-ms={commit_window_ms}",
+        "--snapshot-interval-s=0",
+        "--admission-control=off",
+        *extra_args
+    ]
+    bank = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=lambda: [None for _ in bank.stdout], daemon=True).start()
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank
+
+
+def createAccount(port):
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        response = bank_grpc.BankStub(channel).CreateNewClient(bank_pb2.CreateNewClientRequest(username="bench", password="bench", initial_balance=INITIAL_BALANCE))
+        if response.err_code != 0:
+            raise RuntimeError(f"Could not create account: {response.text}")
+        return response.account_number
+
+
+async def generateLoad(port, account_number, rpc, num_requests, concurrency):
+    # (RPCs per second, failed RPCs)
+    channels = [grpc.aio.insecure_channel(f"localhost:{port}", options=[("grpc.use_local_subchannel_pool", 1)]) for _ in range(NUM_CHANNELS)]
+    stubs = [bank_grpc.BankStub(channel) for channel in channels]
+    remaining = num_requests
+    failed = 0
+
+    async def loop(index):
+        nonlocal remaining, failed
+        stub = stubs[index % len(stubs)]
+        while remaining > 0:
+            remaining -= 1
+            try:
+                if rpc == "FetchBalance":
+                    await stub.FetchBalance(bank_pb2.FetchBalanceRequest(account_number=account_number))
+                else:
+                    await stub.Credit(bank_pb2.AmountTransferRequest(receiver_username="bench", receiver_acc_no=account_number, amount=1, type="deposit"))
+            except grpc.RpcError:
+                failed += 1
+
+    start_time = time.monotonic()
+    await asyncio.gather(*(loop(index) for index in range(concurrency)))
+    elapsed = time.monotonic() - start_time
+    for channel in channels:
+        await channel.close()
+    return num_requests / elapsed, failed
+
+
+def measure(port, commit_window_ms, mode, args):
+    # {(rpc, concurrency): (RPCs per second, failed RPCs)} for one bank
+    work_dir = Path(tempfile.mkdtemp(prefix="bank_aio_benchmark_"))
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    bank = startBank(port, work_dir, commit_window_ms, MODES[mode])
+    try:
+        account_number = createAccount(port)
+        return {
+            (rpc, concurrency): asyncio.run(generateLoad(port, account_number, rpc, args.requests, concurrency))
+            for rpc in RPCS for concurrency in args.concurrency
+        }
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the throughput of the threaded and grpc.aio bank server")
+    parser.add_argument("--port", type=int, default=50066, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--commit-windows-ms", default="2,20", help="Comma separated --wal-commit-window-ms values")
+    parser.add_argument("--concurrency", default="64,512", help="Comma separated numbers of RPCs in flight")
+    parser.add_argument("--requests", type=int, default=20000, help="RPCs per measurement")
+    args = parser.parse_args()
+    args.concurrency = [int(concurrency) for concurrency in args.concurrency.split(",")]
+
+    print(f"{'window ms':>9}  {'rpc':<12}  {'in flight':>9}  {'threads rpc/s':>13}  {'aio rpc/s':>9}  failed")
+    for commit_window_ms in [float(window) for window in args.commit_windows_ms.split(",")]:
+        results = {mode: measure(args.port, commit_window_ms, mode, args) for mode in MODES}
+        for rpc in RPCS:
+            for concurrency in args.concurrency:
+                (threads, threads_failed), (aio, aio_failed) = results["threads"][rpc, concurrency], results["aio"][rpc, concurrency]
+                print(f"{commit_window_ms:>9g}  {rpc:<12}  {concurrency:>9}  {threads:>13.0f}  {aio:>9.0f}  {threads_failed + aio_failed or '-'}")
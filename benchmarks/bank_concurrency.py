@@ -0,0 +1,132 @@
+"""
+Stress test of concurrent Credit and Debit calls on one account. For each
+server mode a fresh bank server is started, and many threads credit and
+debit the same account at once. The final balance must equal the initial
+balance plus the sum of the successful operations, both while the bank
+runs and after it restarts and replays its log. Exits with an error if it
+doesn't. Run from the repository root:
+
+    python3 benchmarks/bank_concurrency.py --threads 32 --operations 500
+"""
+import argparse
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+INITIAL_BALANCE = 1e6
+# Whole amounts, so that the expected balance is exact
+MAX_AMOUNT = 100
+SERVER_MODES = {
+    "threads": [],
+    "workers": ["--workers=2"],
+    "aio": ["--aio"],
+    "workers-aio": ["--workers=2", "--aio"]
+}
+
+
+def startBank(port, data_dir, mode):
+    command = [
+        sys.executable, "server/bank_server.py",
+        f"--port={port}",
+        f"--data-dir={data_dir}",
+        "--wal-durability=os-buffered",
+        "--admission-control=off",
+        "--request-log-sample-rate=0",
+        *SERVER_MODES[mode]
+    ]
+    bank = subprocess.Popen(command, cwd=repo_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank
+
+
+def stopBank(bank):
+    bank.terminate()
+    bank.wait()
+
+
+def hammer(stub, username, account_number, operations, seed, totals, lock):
+    # Alternates credits and debits of random amounts; adds up those that succeeded
+    rng = random.Random(seed)
+    net = 0
+    for index in range(operations):
+        amount = rng.randint(1, MAX_AMOUNT)
+        if index % 2 == 0:
+            response = stub.Credit(bank_pb2.AmountTransferRequest(receiver_username=username, receiver_acc_no=account_number, amount=amount, type="deposit"))
+            net += amount if response.err_code == 0 else 0
+        else:
+            response = stub.Debit(bank_pb2.AmountTransferRequest(sender_username=username, sender_acc_no=account_number, amount=amount, type="withdraw"))
+            net -= amount if response.err_code == 0 else 0
+    with lock:
+        totals.append(net)
+
+
+def fetchBalance(port, account_number):
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        return bank_grpc.BankStub(channel).FetchBalance(bank_pb2.FetchBalanceRequest(account_number=account_number)).balance
+
+
+def run(port, mode, args):
+    data_dir = tempfile.mkdtemp(prefix="bank_concurrency_")
+    bank = startBank(port, data_dir, mode)
+    try:
+        with grpc.insecure_channel(f"localhost:{port}") as channel:
+            stub = bank_grpc.BankStub(channel)
+            response = stub.CreateNewClient(bank_pb2.CreateNewClientRequest(username="stress", password="stress", initial_balance=INITIAL_BALANCE))
+            if response.err_code != 0:
+                raise RuntimeError(f"Could not create account: {response.text}")
+            account_number = response.account_number
+
+            totals = []
+            lock = threading.Lock()
+            threads = [
+                threading.Thread(target=hammer, args=(stub, "stress", account_number, args.operations, index, totals, lock))
+                for index in range(args.threads)
+            ]
+            start_time = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start_time
+
+        expected = INITIAL_BALANCE + sum(totals)
+        final = fetchBalance(port, account_number)
+        stopBank(bank)
+        bank = startBank(port, data_dir, mode)
+        recovered = fetchBalance(port, account_number)
+        return args.threads * args.operations / elapsed, expected, final, recovered
+    finally:
+        stopBank(bank)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the balance of one account after concurrent credits and debits")
+    parser.add_argument("--modes", default=",".join(SERVER_MODES), help="Comma separated server modes: " + ", ".join(SERVER_MODES))
+    parser.add_argument("--port", type=int, default=50064, help="Port for the bank servers started by the test")
+    parser.add_argument("--threads", type=int, default=32, help="Threads calling the bank at once")
+    parser.add_argument("--operations", type=int, default=500, help="Credits and debits per thread")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'mode':<11}  {'ops/s':>7}  {'expected':>10}  {'final':>10}  {'recovered':>10}  result")
+    for mode in args.modes.split(","):
+        throughput, expected, final, recovered = run(args.port, mode, args)
+        ok = final == expected and recovered == expected
+        failed = failed or not ok
+        print(f"{mode:<11}  {throughput:>7.0f}  {expected:>10.0f}  {final:>10.0f}  {recovered:>10.0f}  {'ok' if ok else 'MISMATCH'}")
+    if failed:
+        sys.exit("Final balance doesn't match the operations")
@@ -0,0 +1,78 @@
+"""
+Latency of looking up an account in a bank as the number of accounts
+grows: the username and account number indexes of Bank, the FetchBalance
+and Credit RPC handlers that use them, and, for comparison, the linear
+scan over Bank.clients that lookups used to do. Runs in process, without
+a gateway or a write-ahead log. Run from the repository root:
+
+    python3 benchmarks/bank_lookup.py --accounts 1000,10000,100000,1000000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import bank_pb2
+import bank_server
+from loguru import logger
+
+# The scan is only timed up to this many accounts, where it already takes milliseconds
+MAX_SCANNED_ACCOUNTS = 100000
+
+
+def addClients(bank, count):
+    with bank.lock:
+        for account_number in range(len(bank.clients) + 1, count + 1):
+            client = bank_server.Client(f"user{account_number}", "pw", account_number, bank.account_locks.lockFor(account_number), bank.ledger)
+            client.setBalance(100)
+            bank.addClient(client)
+
+
+def timePerCall(call, arguments):
+    start_time = time.perf_counter()
+    for argument in arguments:
+        call(argument)
+    return (time.perf_counter() - start_time) / len(arguments)
+
+
+def scanByUsername(bank, username):
+    for client in bank.clients:
+        if client.getUsername() == username:
+            return client
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure account lookup latency against the number of accounts")
+    parser.add_argument("--accounts", default="1000,10000,100000,1000000", help="Comma separated account counts")
+    parser.add_argument("--lookups", type=int, default=100000, help="Lookups timed per account count")
+    parser.add_argument("--scans", type=int, default=200, help="Linear scans timed per account count")
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        bank = bank_server.Bank(0, data_dir)
+        bank_server.MyBank = bank
+        servicer = bank_server.BankServicer()
+
+        print(f"{'accounts':>9}  {'username us':>11}  {'account us':>10}  {'FetchBalance us':>15}  {'Credit us':>9}  {'scan us':>9}")
+        for count in [int(count) for count in args.accounts.split(",")]:
+            addClients(bank, count)
+            account_numbers = [random.randint(1, count) for _ in range(args.lookups)]
+            usernames = [f"user{account_number}" for account_number in account_numbers]
+            fetches = [bank_pb2.FetchBalanceRequest(account_number=str(account_number)) for account_number in account_numbers]
+            credits = [bank_pb2.AmountTransferRequest(receiver_username=username, amount=1, type="deposit") for username in usernames]
+
+            by_username = timePerCall(bank.getClientByUsername, usernames)
+            by_account = timePerCall(bank.getClientByAccountNumber, account_numbers)
+            fetch = timePerCall(lambda request: servicer.FetchBalance(request, None), fetches)
+            credit = timePerCall(servicer.applyCredit, credits)
+            scan = "-"
+            if count <= MAX_SCANNED_ACCOUNTS:
+                scan = f"{timePerCall(lambda username: scanByUsername(bank, username), usernames[:args.scans]) * 1e6:.1f}"
+            print(f"{count:>9}  {by_username * 1e6:>11.2f}  {by_account * 1e6:>10.2f}  {fetch * 1e6:>15.2f}  {credit * 1e6:>9.2f}  {scan:>9}")
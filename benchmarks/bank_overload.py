@@ -0,0 +1,140 @@
+"""
+Behaviour of the bank server under more load than it can serve, for each
+--admission-control mode.
+
+For each mode a fresh thread-pool bank server is started in a scratch
+directory, with a --wal-commit-window-ms that caps it at a few hundred
+Credits per second. An open-loop grpc.aio client then sends Credit RPCs at
+a fixed rate above that, each with a deadline, whether or not earlier ones
+have been answered. For each mode it reports the successful RPCs per
+second and their latency, how many missed their deadline and how many were
+rejected with RESOURCE_EXHAUSTED and how quickly. The queue depth and
+rejection counts the bank logs every 10 seconds are printed after the
+table. Run from the repository root:
+
+    python3 benchmarks/bank_overload.py --rate 700 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+from admission_control import ADMISSION_CONTROL_MODES
+
+INITIAL_BALANCE = 1e9
+NUM_CHANNELS = 8
+
+
+def startBank(port, work_dir, mode, args):
+    # Returns the bank process and the list its admission stats lines are collected in
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    command = [
+        sys.executable, str(repo_dir / "server" / "bank_server.py"),
+        f"--port={port}",
+        f"--data-dir={work_dir / 'data'}",
+        f"--wal-commit-window-ms={args.commit_window_ms}",
+        f"--admission-control={mode}",
+        "--snapshot-interval-s=0",
+        "--request-log-sample-rate=0"
+    ]
+    bank = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    stats_lines = []
+    threading.Thread(target=lambda: stats_lines.extend(line.strip() for line in bank.stdout if "admission:" in line), daemon=True).start()
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank, stats_lines
+
+
+def createAccount(port):
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        response = bank_grpc.BankStub(channel).CreateNewClient(bank_pb2.CreateNewClientRequest(username="bench", password="bench", initial_balance=INITIAL_BALANCE))
+        if response.err_code != 0:
+            raise RuntimeError(f"Could not create account: {response.text}")
+        return response.account_number
+
+
+async def generateLoad(port, account_number, args):
+    # {status code name: sorted latencies of the RPCs that ended with it}
+    channels = [grpc.aio.insecure_channel(f"localhost:{port}", options=[("grpc.use_local_subchannel_pool", 1)]) for _ in range(NUM_CHANNELS)]
+    stubs = [bank_grpc.BankStub(channel) for channel in channels]
+    latencies = {}
+
+    async def credit(stub):
+        start_time = time.perf_counter()
+        try:
+            await stub.Credit(bank_pb2.AmountTransferRequest(receiver_username="bench", receiver_acc_no=account_number, amount=1, type="deposit"),
+                              timeout=args.deadline_s)
+            code = "OK"
+        except grpc.RpcError as e:
+            code = e.code().name
+        latencies.setdefault(code, []).append(time.perf_counter() - start_time)
+
+    calls = []
+    start_time = time.monotonic()
+    for index in range(int(args.rate * args.duration)):
+        await asyncio.sleep(max(0, start_time + index / args.rate - time.monotonic()))
+        calls.append(asyncio.ensure_future(credit(stubs[index % len(stubs)])))
+    await asyncio.gather(*calls)
+    for channel in channels:
+        await channel.close()
+    return {code: sorted(values) for code, values in latencies.items()}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(port, mode, args):
+    work_dir = Path(tempfile.mkdtemp(prefix="admission_benchmark_"))
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    bank, stats_lines = startBank(port, work_dir, mode, args)
+    try:
+        account_number = createAccount(port)
+        latencies = asyncio.run(generateLoad(port, account_number, args))
+        return latencies, stats_lines
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how the bank server sheds load it can't serve")
+    parser.add_argument("--modes", default="off,adaptive", help="Comma separated --admission-control modes: " + ", ".join(ADMISSION_CONTROL_MODES))
+    parser.add_argument("--port", type=int, default=50067, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--rate", type=float, default=700, help="Credit RPCs sent per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per mode")
+    parser.add_argument("--deadline-s", type=float, default=1, help="Deadline of each RPC")
+    parser.add_argument("--commit-window-ms", type=float, default=20, help="--wal-commit-window-ms of the bank, which bounds its throughput")
+    args = parser.parse_args()
+
+    all_stats_lines = {}
+    print(f"{'mode':<9}  {'OK/s':>5}  {'OK p50 ms':>9}  {'OK p99 ms':>9}  {'deadline':>8}  {'rejected':>8}  {'reject p50 ms':>13}  other")
+    for mode in args.modes.split(","):
+        latencies, all_stats_lines[mode] = measure(args.port, mode, args)
+        ok = latencies.pop("OK", [])
+        deadline_exceeded = latencies.pop("DEADLINE_EXCEEDED", [])
+        rejected = latencies.pop("RESOURCE_EXHAUSTED", [])
+        other = {code: len(values) for code, values in latencies.items()}
+        reject_p50 = f"{percentile(rejected, 0.5) * 1000:.1f}" if rejected else "-"
+        print(f"{mode:<9}  {len(ok) / args.duration:>5.0f}  {percentile(ok, 0.5) * 1000:>9.1f}  {percentile(ok, 0.99) * 1000:>9.1f}  "
+              f"{len(deadline_exceeded):>8}  {len(rejected):>8}  {reject_p50:>13}  {other or '-'}")
+    for mode, stats_lines in all_stats_lines.items():
+        print(f"\nBank log with --admission-control={mode}:")
+        for line in stats_lines:
+            print(f"  {line}")
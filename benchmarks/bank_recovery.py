@@ -0,0 +1,107 @@
+"""
+Recovery time of a bank against the size of its ledger.
+
+For each size a bank is populated in process: accounts are opened and
+credited through the same code as the RPCs, writing a write-ahead log.
+Recovery is then timed twice: replaying the whole log, as after a crash
+before the first snapshot, and loading a snapshot followed by a short log
+tail, as --recover and a normal restart do. Run from the repository root:
+
+    python3 benchmarks/bank_recovery.py --accounts 10000,100000,1000000
+"""
+import argparse
+import gc
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import bank_pb2
+import bank_server
+from loguru import logger
+
+BANK_PORT = 0
+
+
+def openBank(data_dir):
+    bank = bank_server.Bank(BANK_PORT, data_dir)
+    bank.setWriteAheadLog(bank_server.WriteAheadLog(data_dir, f"bank_{BANK_PORT}", durability="os-buffered"))
+    return bank
+
+
+def credit(servicer, username, amount):
+    response, _ = servicer.applyCredit(bank_pb2.AmountTransferRequest(receiver_username=username, amount=amount, type="deposit"))
+    if response.err_code != 0:
+        raise RuntimeError(f"Could not credit {username}: {response.text}")
+
+
+def populate(data_dir, num_accounts, credits_per_account):
+    bank = openBank(data_dir)
+    bank.recover()
+    bank.wal.open()
+    bank_server.MyBank = bank
+    servicer = bank_server.BankServicer()
+    for index in range(num_accounts):
+        bank.openAccount(f"user{index}", "pw", 100)
+    for _ in range(credits_per_account):
+        for index in range(num_accounts):
+            credit(servicer, f"user{index}", 1)
+    bank.wal.close()
+
+
+def timeRecovery(data_dir):
+    # (seconds, log records replayed, recovered bank)
+    bank = openBank(data_dir)
+    start_time = time.perf_counter()
+    num_records = bank.recover()
+    return time.perf_counter() - start_time, num_records, bank
+
+
+def snapshotWithTail(bank, tail_records):
+    # Writes a snapshot of a recovered bank, then logs tail_records more credits after it
+    bank.wal.open()
+    bank.writeSnapshot()
+    bank_server.MyBank = bank
+    servicer = bank_server.BankServicer()
+    clients = bank.getAllClients()
+    for index in range(tail_records):
+        credit(servicer, clients[index % len(clients)].getUsername(), 1)
+    bank.wal.close()
+
+
+def directorySize(data_dir, pattern):
+    return sum(path.stat().st_size for path in Path(data_dir).glob(pattern))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure bank recovery time against ledger size")
+    parser.add_argument("--accounts", default="10000,100000,1000000", help="Comma separated account counts")
+    parser.add_argument("--credits-per-account", type=int, default=2, help="Statement entries added to each account")
+    parser.add_argument("--tail", type=int, default=10000, help="Log records written after the snapshot")
+    args = parser.parse_args()
+    logger.remove()
+
+    print(f"{'accounts':>9}  {'records':>9}  {'log MB':>7}  {'replay s':>8}  {'snapshot MB':>11}  {'snapshot+tail s':>15}")
+    for num_accounts in [int(count) for count in args.accounts.split(",")]:
+        data_dir = tempfile.mkdtemp(prefix="bank_recovery_")
+        try:
+            populate(data_dir, num_accounts, args.credits_per_account)
+            log_size = directorySize(data_dir, "*.wal")
+            gc.collect()
+
+            replay_time, num_records, bank = timeRecovery(data_dir)
+            snapshotWithTail(bank, args.tail)
+            del bank
+            gc.collect()
+
+            snapshot_time, _, bank = timeRecovery(data_dir)
+            snapshot_size = directorySize(data_dir, "*.snapshot")
+            del bank
+            gc.collect()
+            print(f"{num_accounts:>9}  {num_records:>9}  {log_size / 1e6:>7.1f}  {replay_time:>8.2f}  {snapshot_size / 1e6:>11.1f}  {snapshot_time:>15.2f}")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,81 @@
+"""
+Time from launching a bank server until it answers its first RPC.
+
+Each run starts a fresh bank server on its own data directory and polls it
+with FetchBalance until one call gets a response. Runs are repeated without
+a payment gateway and with --gatewayport pointing at a port nobody listens
+on, as in a cluster where the gateway isn't up yet. Run from the
+repository root:
+
+    python3 benchmarks/bank_startup.py --runs 10
+"""
+import argparse
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+POLL_INTERVAL_S = 0.005
+POLL_TIMEOUT_S = 0.1
+STARTUP_TIMEOUT_S = 60
+
+
+def unusedPort():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def timeToFirstRpc(port, gateway_port, extra_args):
+    data_dir = tempfile.mkdtemp(prefix="bank_startup_")
+    command = [
+        sys.executable, "server/bank_server.py",
+        f"--port={port}",
+        f"--gatewayport={gateway_port}",
+        f"--data-dir={data_dir}",
+        *extra_args
+    ]
+    start_time = time.monotonic()
+    bank = subprocess.Popen(command, cwd=repo_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.monotonic() - start_time < STARTUP_TIMEOUT_S:
+            if bank.poll() is not None:
+                raise RuntimeError(f"Bank server exited with code {bank.returncode}")
+            # A new channel per attempt; one that failed to connect backs off before retrying
+            with grpc.insecure_channel(f"localhost:{port}") as channel:
+                try:
+                    bank_grpc.BankStub(channel).FetchBalance(bank_pb2.FetchBalanceRequest(account_number="0"), timeout=POLL_TIMEOUT_S)
+                    return time.monotonic() - start_time
+                except grpc.RpcError:
+                    pass
+            time.sleep(POLL_INTERVAL_S)
+        raise RuntimeError(f"Bank server didn't answer within {STARTUP_TIMEOUT_S}s")
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the time until a freshly started bank server answers an RPC")
+    parser.add_argument("--port", type=int, default=50072, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="Bank server starts per scenario")
+    parser.add_argument("--bank-args", default="", help="Extra arguments for the bank server, e.g. \"--aio\"")
+    args = parser.parse_args()
+
+    scenarios = [("no gateway", -1), ("unreachable gateway", unusedPort())]
+    print(f"{'scenario':<20}  {'median ms':>9}  {'min ms':>7}  {'max ms':>7}")
+    for name, gateway_port in scenarios:
+        times = [timeToFirstRpc(args.port, gateway_port, args.bank_args.split()) for _ in range(args.runs)]
+        print(f"{name:<20}  {statistics.median(times) * 1000:>9.0f}  {min(times) * 1000:>7.0f}  {max(times) * 1000:>7.0f}")
@@ -0,0 +1,107 @@
+"""
+Latency of a transfer between two accounts of the same bank, made with
+the bank's Transfer RPC and with the CheckClientExist, Debit and Credit
+calls the gateway used to make for it (and still makes for banks without
+Transfer). A fresh bank server is started in a scratch directory, so that
+its logs don't go to server/logs, and transfers are sent one at a time
+over one channel, as the gateway's pooled channel to the bank would.
+Run from the repository root:
+
+    python3 benchmarks/bank_transfer.py --transfers 500
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+TIMEOUT_S = 5
+INITIAL_BALANCE = 1e9
+
+
+def startBank(port, work_dir, extra_args):
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    command = [
+        sys.executable, str(repo_dir / "server" / "bank_server.py"),
+        f"--port={port}",
+        f"--data-dir={work_dir / 'data'}",
+        "--snapshot-interval-s=0",
+        *extra_args
+    ]
+    bank = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=lambda: [None for _ in bank.stdout], daemon=True).start()
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank
+
+
+def createAccount(stub, username):
+    response = stub.CreateNewClient(bank_pb2.CreateNewClientRequest(username=username, password="bench", initial_balance=INITIAL_BALANCE))
+    if response.err_code != 0:
+        raise RuntimeError(f"Could not create account {username}: {response.text}")
+    return response.account_number
+
+
+def checkResponse(response):
+    if response.err_code != 0:
+        raise RuntimeError(f"Request failed: {response.text}")
+
+
+def transferRpc(stub, sender, receiver):
+    checkResponse(stub.Transfer(bank_pb2.AmountTransferRequest(
+        sender_username=sender[0], sender_acc_no=sender[1], receiver_username=receiver[0], receiver_acc_no=receiver[1], amount=1, type="transfer"
+    ), timeout=TIMEOUT_S))
+
+
+def separateCalls(stub, sender, receiver):
+    checkResponse(stub.CheckClientExist(bank_pb2.CheckClientExistRequest(username=receiver[0], acc_no=receiver[1]), timeout=TIMEOUT_S))
+    fields = dict(sender_username=sender[0], sender_acc_no=sender[1], receiver_username=receiver[0], receiver_acc_no=receiver[1], amount=1, type="transfer")
+    checkResponse(stub.Debit(bank_pb2.AmountTransferRequest(**fields), timeout=TIMEOUT_S))
+    checkResponse(stub.Credit(bank_pb2.AmountTransferRequest(**fields), timeout=TIMEOUT_S))
+
+
+def timeTransfers(transfer, stub, sender, receiver, transfers):
+    latencies = []
+    for _ in range(transfers):
+        start_time = time.perf_counter()
+        transfer(stub, sender, receiver)
+        latencies.append(time.perf_counter() - start_time)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a same-bank transfer made with Transfer and with separate calls")
+    parser.add_argument("--port", type=int, default=50068, help="Port for the bank server started by the benchmark")
+    parser.add_argument("--transfers", type=int, default=500, help="Transfers timed per way")
+    parser.add_argument("--bank-args", default="", help="Extra arguments for the bank server, e.g. --wal-durability=os-buffered")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bank_transfer_benchmark_"))
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    bank = startBank(args.port, work_dir, args.bank_args.split())
+    try:
+        with grpc.insecure_channel(f"localhost:{args.port}") as channel:
+            stub = bank_grpc.BankStub(channel)
+            sender = ("bench_sender", createAccount(stub, "bench_sender"))
+            receiver = ("bench_receiver", createAccount(stub, "bench_receiver"))
+            print(f"{'way':<15}  {'RPCs':>4}  {'p50 ms':>7}  {'p99 ms':>7}")
+            for name, transfer, num_rpcs in [("Transfer", transferRpc, 1), ("separate calls", separateCalls, 3)]:
+                p50, p99 = timeTransfers(transfer, stub, sender, receiver, args.transfers)
+                print(f"{name:<15}  {num_rpcs:>4}  {p50 * 1000:>7.2f}  {p99 * 1000:>7.2f}")
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
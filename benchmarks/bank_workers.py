@@ -0,0 +1,138 @@
+"""
+Throughput of a bank server at different --workers counts.
+
+For each worker count a fresh bank server is started on its own data
+directory, a set of accounts is created and load processes issue a mix of
+FetchBalance, Credit and Debit RPCs directly against the bank for a fixed
+time. Run from the repository root:
+
+    python3 benchmarks/bank_workers.py --workers 1,2,4,8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+# Share of each RPC in the mix; the rest are debits
+FETCH_BALANCE_SHARE = 0.4
+CREDIT_SHARE = 0.3
+INITIAL_BALANCE = 1e9
+
+
+def startBank(port, num_workers, data_dir, wal_durability):
+    command = [
+        sys.executable, "server/bank_server.py",
+        f"--port={port}",
+        f"--workers={num_workers}",
+        f"--data-dir={data_dir}",
+        f"--wal-durability={wal_durability}",
+        "--snapshot-interval-s=0"
+    ]
+    bank = subprocess.Popen(command, cwd=repo_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank
+
+
+def createAccounts(port, num_accounts):
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        stub = bank_grpc.BankStub(channel)
+        accounts = []
+        for index in range(num_accounts):
+            username = f"bench{index}"
+            response = stub.CreateNewClient(bank_pb2.CreateNewClientRequest(username=username, password="bench", initial_balance=INITIAL_BALANCE))
+            if response.err_code != 0:
+                raise RuntimeError(f"Could not create account {username}: {response.text}")
+            accounts.append((username, response.account_number))
+        return accounts
+
+
+async def generateLoad(port, accounts, duration_s, concurrency, num_channels):
+    # Separate channels so that the kernel can hand their connections to different workers
+    channels = [grpc.aio.insecure_channel(f"localhost:{port}", options=[("grpc.use_local_subchannel_pool", 1)]) for _ in range(num_channels)]
+    stubs = [bank_grpc.BankStub(channel) for channel in channels]
+    deadline = time.monotonic() + duration_s
+    completed = 0
+
+    async def loop(index):
+        nonlocal completed
+        stub = stubs[index % len(stubs)]
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            username, account_number = rng.choice(accounts)
+            choice = rng.random()
+            if choice < FETCH_BALANCE_SHARE:
+                await stub.FetchBalance(bank_pb2.FetchBalanceRequest(account_number=account_number))
+            elif choice < FETCH_BALANCE_SHARE + CREDIT_SHARE:
+                await stub.Credit(bank_pb2.AmountTransferRequest(receiver_username=username, receiver_acc_no=account_number, amount=1, type="deposit"))
+            else:
+                await stub.Debit(bank_pb2.AmountTransferRequest(sender_username=username, sender_acc_no=account_number, amount=1, type="withdraw"))
+            completed += 1
+
+    await asyncio.gather(*(loop(index) for index in range(concurrency)))
+    for channel in channels:
+        await channel.close()
+    return completed
+
+
+def loadProcess(port, accounts, duration_s, concurrency, num_channels, results):
+    results.put(asyncio.run(generateLoad(port, accounts, duration_s, concurrency, num_channels)))
+
+
+def measure(port, num_workers, args):
+    data_dir = tempfile.mkdtemp(prefix="bank_benchmark_")
+    bank = startBank(port, num_workers, data_dir, args.wal_durability)
+    try:
+        accounts = createAccounts(port, args.accounts)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        load_processes = [
+            context.Process(target=loadProcess, args=(port, accounts, args.duration, args.concurrency, args.channels, results))
+            for _ in range(args.load_processes)
+        ]
+        start_time = time.monotonic()
+        for process in load_processes:
+            process.start()
+        completed = sum(results.get() for _ in load_processes)
+        elapsed = time.monotonic() - start_time
+        for process in load_processes:
+            process.join()
+        return completed / elapsed
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure bank server throughput at different worker counts")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma separated worker counts to measure")
+    parser.add_argument("--port", type=int, default=50062, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per worker count")
+    parser.add_argument("--accounts", type=int, default=1000, help="Number of accounts the load is spread over")
+    parser.add_argument("--load-processes", type=int, default=os.cpu_count(), help="Number of processes generating load")
+    parser.add_argument("--concurrency", type=int, default=64, help="RPCs in flight per load process")
+    parser.add_argument("--channels", type=int, default=8, help="Channels (connections) per load process")
+    parser.add_argument("--wal-durability", default="os-buffered", help="--wal-durability of the bank servers")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>7}  {'rpc/s':>10}  {'speedup':>7}")
+    for num_workers in [int(count) for count in args.workers.split(",")]:
+        throughput = measure(args.port, num_workers, args)
+        baseline = baseline or throughput
+        print(f"{num_workers:>7}  {throughput:>10.0f}  {throughput / baseline:>7.2f}")
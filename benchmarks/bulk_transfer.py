@@ -0,0 +1,171 @@
+"""
+Time of a BulkTransfer with many legs across two banks, and a check that
+it moved the right amounts.
+
+A fresh gateway and two bank servers are started in a scratch directory
+(so that their logs don't go to server/logs). A sender on the first bank
+pays receivers spread over both banks, one unit per leg. Every
+--refund-every-th leg names an account that doesn't exist, so its bank
+refuses it and the gateway refunds it, and one leg has a NaN amount, which
+the gateway must refuse without debiting anything. After each transfer
+the balances are read from the banks and compared with the legs. Exits
+with an error if they don't match. Run from the repository root:
+
+    python3 benchmarks/bulk_transfer.py --legs 10000 --runs 3
+"""
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+import payment_gateway_pb2
+import payment_gateway_pb2_grpc as payment_gateway_grpc
+
+TIMEOUT_S = 60
+# Balances are returned as 32-bit floats, which are exact for whole amounts up to 2^24
+INITIAL_BALANCE = 1e6
+AMOUNT = 1.0
+BANK_ARGS = ["--snapshot-interval-s=0", "--request-log-sample-rate=0"]
+GATEWAY_ARGS = ["--request-log-sample-rate=0"]
+
+
+def startProcess(script, work_dir, args):
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    process = subprocess.Popen([sys.executable, str(repo_dir / "server" / script), *args], cwd=work_dir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=lambda: [None for _ in process.stdout], daemon=True).start()
+    return process
+
+
+def credentials():
+    with open(repo_dir / "CA" / "ca.crt", "rb") as file:
+        return grpc.ssl_channel_credentials(root_certificates=file.read())
+
+
+def login(stub, username, password):
+    _, call = stub.Authenticate.with_call(
+        payment_gateway_pb2.AuthRequest(username=username, password=password),
+        metadata=[("authorization", "auth")], timeout=TIMEOUT_S
+    )
+    return [item for item in call.initial_metadata() if item[0] == "authorization"]
+
+
+def createClient(stub, admin_metadata, username, bank_id):
+    # Retries until the bank has registered with the gateway; returns the account number
+    deadline = time.monotonic() + 30
+    while True:
+        response = stub.AdminAccessCreateNewClient(payment_gateway_pb2.CreateNewClientRequest(
+            new_client_username=username, new_client_password="bench", new_client_bank_id=bank_id, initial_balance=INITIAL_BALANCE
+        ), metadata=admin_metadata, timeout=TIMEOUT_S)
+        if response.err_code == 0:
+            return response.account_number
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Could not create client {username}: {response.text}")
+        time.sleep(0.5)
+
+
+def fetchBalances(bank_stubs, accounts):
+    return {username: bank_stubs[bank_id].FetchBalance(bank_pb2.FetchBalanceRequest(account_number=account_number), timeout=TIMEOUT_S).balance
+            for username, (bank_id, account_number) in accounts.items()}
+
+
+def buildLegs(receivers, num_legs, refund_every):
+    # Returns the legs and the amount each receiver should get
+    names = list(receivers)
+    legs = []
+    expected = dict.fromkeys(names, 0.0)
+    for index in range(num_legs):
+        username = names[index % len(names)]
+        bank_id, account_number = receivers[username]
+        if refund_every and index % refund_every == refund_every - 1:
+            legs.append(payment_gateway_pb2.TransferLeg(receiver_username=f"nobody{index}", receiver_bank_id=bank_id, receiver_acc_no="0", amount=AMOUNT))
+        else:
+            legs.append(payment_gateway_pb2.TransferLeg(receiver_username=username, receiver_bank_id=bank_id, receiver_acc_no=account_number, amount=AMOUNT))
+            expected[username] += AMOUNT
+    legs.append(payment_gateway_pb2.TransferLeg(receiver_username=names[0], receiver_bank_id=receivers[names[0]][0],
+                                                receiver_acc_no=receivers[names[0]][1], amount=math.nan))
+    return legs, expected
+
+
+def run(args):
+    work_dir = Path(tempfile.mkdtemp(prefix="bulk_transfer_benchmark_"))
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    processes = [startProcess("payment_gateway.py", work_dir, [f"--port={args.gatewayport}", *GATEWAY_ARGS])]
+    try:
+        with grpc.secure_channel(f"localhost:{args.gatewayport}", credentials()) as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+            stub = payment_gateway_grpc.PaymentGatewayStub(channel)
+            admin_metadata = login(stub, *args.admin.split(":", 1))
+            # One bank at a time, so that they get ids 1 and 2
+            bank_ports = {}
+            accounts = {}
+            for bank_id, port in enumerate(args.bankports, start=1):
+                processes.append(startProcess("bank_server.py", work_dir, [f"--port={port}", f"--gatewayport={args.gatewayport}",
+                                                                           f"--data-dir={work_dir / f'data_{port}'}", *BANK_ARGS]))
+                bank_ports[bank_id] = port
+                if bank_id == 1:
+                    accounts["bench_sender"] = (bank_id, createClient(stub, admin_metadata, "bench_sender", bank_id))
+                for index in range(bank_id - 1, args.receivers, len(args.bankports)):
+                    accounts[f"bench_receiver{index}"] = (bank_id, createClient(stub, admin_metadata, f"bench_receiver{index}", bank_id))
+            receivers = {username: account for username, account in accounts.items() if username != "bench_sender"}
+            metadata = login(stub, "bench_sender", "bench")
+            bank_channels = [grpc.insecure_channel(f"localhost:{port}") for port in bank_ports.values()]
+            bank_stubs = {bank_id: bank_grpc.BankStub(bank_channel) for bank_id, bank_channel in zip(bank_ports, bank_channels)}
+
+            legs, expected = buildLegs(receivers, args.legs, args.refund_every)
+            total = sum(expected.values())
+            refunded = args.legs * AMOUNT - total
+            failed = False
+            print(f"{'run':>3}  {'legs':>6}  {'seconds':>7}  {'transferred':>11}  {'refunded':>8}  {'refused':>7}  balances")
+            for run_index in range(1, args.runs + 1):
+                before = fetchBalances(bank_stubs, accounts)
+                request = payment_gateway_pb2.BulkTransferRequest(legs=legs, idempotency_key=str(uuid.uuid4()))
+                start_time = time.perf_counter()
+                response = stub.BulkTransfer(request, metadata=metadata, timeout=TIMEOUT_S)
+                elapsed = time.perf_counter() - start_time
+                after = fetchBalances(bank_stubs, accounts)
+
+                refused = sum(1 for result in response.results if result.err_code == 1 and result.text == "Invalid amount")
+                ok = (response.err_code == 0 and response.total_transferred == total and response.total_refunded == refunded and refused == 1
+                      and after["bench_sender"] == before["bench_sender"] - total
+                      and all(after[username] == before[username] + amount for username, amount in expected.items()))
+                failed = failed or not ok
+                print(f"{run_index:>3}  {len(legs):>6}  {elapsed:>7.3f}  {response.total_transferred:>11.0f}  {response.total_refunded:>8.0f}  "
+                      f"{refused:>7}  {'ok' if ok else 'MISMATCH'}")
+            for bank_channel in bank_channels:
+                bank_channel.close()
+            return failed
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a BulkTransfer across two banks and check the balances it leaves")
+    parser.add_argument("--gatewayport", type=int, default=50096, help="Port for the gateway started by the benchmark")
+    parser.add_argument("--bankports", default="50097,50098", help="Comma separated ports for the two bank servers")
+    parser.add_argument("--admin", default="admin:admin", help="Admin credentials as username:password")
+    parser.add_argument("--legs", type=int, default=10000, help="Legs per transfer, besides the one with a NaN amount")
+    parser.add_argument("--receivers", type=int, default=100, help="Receiving accounts, spread over both banks")
+    parser.add_argument("--refund-every", type=int, default=100, help="Every n-th leg goes to an account that doesn't exist (0 for none)")
+    parser.add_argument("--runs", type=int, default=3, help="Transfers timed")
+    args = parser.parse_args()
+    args.bankports = [int(port) for port in args.bankports.split(",")]
+
+    if run(args):
+        sys.exit("Balances don't match the legs of the transfer")
@@ -0,0 +1,199 @@
+"""
+Throughput and latency of the payment gateway served by its thread pool
+and by grpc.aio (--aio), with many concurrent clients.
+
+For each mode a fresh gateway and bank server are started in a scratch
+directory (so that their logs don't go to server/logs). The bank waits
+--bank-commit-window-ms before each log sync, which makes every Deposit a
+slow bank call. Every simulated client sends a request each --interval-s
+seconds, alternating between CheckBalance and Deposit, each of which makes
+one call to the bank. Clients share a few TLS connections and logins per
+load process. Run from the repository root:
+
+    python3 benchmarks/gateway_concurrency.py --clients 1000 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import payment_gateway_pb2
+import payment_gateway_pb2_grpc as payment_gateway_grpc
+
+TIMEOUT_S = 30
+INITIAL_BALANCE = 1e9
+CHANNELS_PER_PROCESS = 8
+
+GATEWAY_ARGS = ["--request-log-sample-rate=0"]
+# The bank waits for its log on an event loop, so slow syncs don't cap it at its thread count
+BANK_ARGS = ["--aio", "--request-log-sample-rate=0"]
+SCENARIOS = [
+    ("threads", []),
+    ("aio", ["--aio"])
+]
+
+
+def startProcess(script, work_dir, args):
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    process = subprocess.Popen([sys.executable, str(repo_dir / "server" / script), *args], cwd=work_dir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=lambda: [None for _ in process.stdout], daemon=True).start()
+    return process
+
+
+def credentials():
+    with open(repo_dir / "CA" / "ca.crt", "rb") as file:
+        return grpc.ssl_channel_credentials(root_certificates=file.read())
+
+
+def login(stub, username, password):
+    _, call = stub.Authenticate.with_call(
+        payment_gateway_pb2.AuthRequest(username=username, password=password),
+        metadata=[("authorization", "auth")], timeout=TIMEOUT_S
+    )
+    return [item for item in call.initial_metadata() if item[0] == "authorization"]
+
+
+def createClients(port, admin, num_users):
+    # Waits for the bank to register, then creates the users the load logs in as
+    with grpc.secure_channel(f"localhost:{port}", credentials()) as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+        stub = payment_gateway_grpc.PaymentGatewayStub(channel)
+        admin_metadata = login(stub, *admin.split(":", 1))
+        usernames = [f"bench{index}" for index in range(num_users)]
+        deadline = time.monotonic() + 30
+        for username in usernames:
+            while True:
+                response = stub.AdminAccessCreateNewClient(payment_gateway_pb2.CreateNewClientRequest(
+                    new_client_username=username, new_client_password="bench", new_client_bank_id=1, initial_balance=INITIAL_BALANCE
+                ), metadata=admin_metadata, timeout=TIMEOUT_S)
+                if response.err_code == 0:
+                    break
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Could not create client {username}: {response.text}")
+                time.sleep(0.5)
+        return usernames
+
+
+async def generateLoad(port, usernames, duration_s, num_clients, interval_s):
+    channels = [
+        grpc.aio.secure_channel(f"localhost:{port}", credentials(), options=[("grpc.use_local_subchannel_pool", 1)])
+        for _ in range(CHANNELS_PER_PROCESS)
+    ]
+    stubs = [payment_gateway_grpc.PaymentGatewayStub(channel) for channel in channels]
+    logins = []
+    for index, username in enumerate(usernames):
+        call = stubs[index % len(stubs)].Authenticate(
+            payment_gateway_pb2.AuthRequest(username=username, password="bench"), metadata=[("authorization", "auth")], timeout=TIMEOUT_S
+        )
+        await call
+        logins.append([item for item in await call.initial_metadata() if item[0] == "authorization"])
+
+    deadline = time.monotonic() + duration_s
+    latencies = []
+    errors = {}
+
+    async def client(index):
+        stub = stubs[index % len(stubs)]
+        metadata = logins[index % len(logins)]
+        deposit = index % 2 == 1
+        # Clients are spread evenly over the interval; one that falls behind sends right away
+        next_time = time.monotonic() + interval_s * index / num_clients
+        while True:
+            await asyncio.sleep(max(0, next_time - time.monotonic()))
+            if time.monotonic() >= deadline:
+                break
+            next_time += interval_s
+            start_time = time.perf_counter()
+            try:
+                if deposit:
+                    await stub.Deposit(payment_gateway_pb2.TransferAmountRequest(amount=1), metadata=metadata, timeout=TIMEOUT_S)
+                else:
+                    await stub.CheckBalance(payment_gateway_pb2.CheckBalanceRequest(), metadata=metadata, timeout=TIMEOUT_S)
+                latencies.append(time.perf_counter() - start_time)
+            except grpc.RpcError as e:
+                errors[e.code().name] = errors.get(e.code().name, 0) + 1
+            deposit = not deposit
+
+    await asyncio.gather(*(client(index) for index in range(num_clients)))
+    for channel in channels:
+        await channel.close()
+    return latencies, errors
+
+
+def loadProcess(port, usernames, duration_s, num_clients, interval_s, results):
+    results.put(asyncio.run(generateLoad(port, usernames, duration_s, num_clients, interval_s)))
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(extra_args, args):
+    work_dir = Path(tempfile.mkdtemp(prefix="gateway_benchmark_"))
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    gateway = startProcess("payment_gateway.py", work_dir, [f"--port={args.gatewayport}", *GATEWAY_ARGS, *extra_args, *args.gateway_args.split()])
+    bank = startProcess("bank_server.py", work_dir, [f"--port={args.bankport}", f"--gatewayport={args.gatewayport}",
+                                                     f"--data-dir={work_dir / 'data'}", f"--wal-commit-window-ms={args.bank_commit_window_ms}",
+                                                     "--snapshot-interval-s=0", *BANK_ARGS, *args.bank_args.split()])
+    try:
+        usernames = createClients(args.gatewayport, args.admin, args.users)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        clients_per_process = args.clients // args.load_processes
+        load_processes = [
+            context.Process(target=loadProcess, args=(args.gatewayport, usernames, args.duration, clients_per_process, args.interval_s, results))
+            for _ in range(args.load_processes)
+        ]
+        for process in load_processes:
+            process.start()
+        latencies = []
+        errors = {}
+        for _ in load_processes:
+            process_latencies, process_errors = results.get()
+            latencies.extend(process_latencies)
+            for code, count in process_errors.items():
+                errors[code] = errors.get(code, 0) + count
+        for process in load_processes:
+            process.join()
+        latencies.sort()
+        if not latencies:
+            return 0, float("nan"), float("nan"), errors
+        return len(latencies) / args.duration, percentile(latencies, 0.5), percentile(latencies, 0.99), errors
+    finally:
+        for process in (gateway, bank):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the threaded and grpc.aio payment gateway under many concurrent clients")
+    parser.add_argument("--gatewayport", type=int, default=50091, help="Port for the gateways started by the benchmark")
+    parser.add_argument("--bankport", type=int, default=50092, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--admin", default="admin:admin", help="Admin credentials as username:password")
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent clients")
+    parser.add_argument("--interval-s", type=float, default=3, help="Seconds between the requests of each client")
+    parser.add_argument("--bank-commit-window-ms", type=float, default=100, help="Wait of the bank before each log sync, which every Deposit pays")
+    parser.add_argument("--users", type=int, default=20, help="Users the clients log in as")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per mode")
+    parser.add_argument("--load-processes", type=int, default=2, help="Number of processes generating load")
+    parser.add_argument("--gateway-args", default="", help="Extra arguments for the gateway")
+    parser.add_argument("--bank-args", default="", help="Extra arguments for the bank server")
+    args = parser.parse_args()
+
+    print(f"{'gateway':<8}  {'rpc/s':>7}  {'p50 ms':>8}  {'p99 ms':>8}  errors")
+    for name, extra_args in SCENARIOS:
+        throughput, p50, p99, errors = measure(extra_args, args)
+        print(f"{name:<8}  {throughput:>7.0f}  {p50 * 1000:>8.2f}  {p99 * 1000:>8.2f}  {errors or '-'}")
@@ -0,0 +1,101 @@
+"""
+Latency of each payment gateway RPC that calls a bank.
+
+Runs against a gateway with at least two banks registered (for example
+started with `make payment_gateway` and `make bank_server PORT=...`). It
+logs in as an admin, creates two clients on different banks and times
+sequential CheckBalance, Deposit, Withdraw and TransferAmount calls from
+one of them, and TransferAmount to a third client on the sender's bank.
+Run from the repository root:
+
+    python3 benchmarks/gateway_latency.py --gatewayport 50051 --calls 500
+"""
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import payment_gateway_pb2
+import payment_gateway_pb2_grpc as payment_gateway_grpc
+
+TIMEOUT_S = 5
+INITIAL_BALANCE = 1e9
+
+
+def login(stub, username, password):
+    _, call = stub.Authenticate.with_call(
+        payment_gateway_pb2.AuthRequest(username=username, password=password),
+        metadata=[("authorization", "auth")], timeout=TIMEOUT_S
+    )
+    return [item for item in call.initial_metadata() if item[0] == "authorization"]
+
+
+def createClient(stub, admin_metadata, username, bank_id):
+    response = stub.AdminAccessCreateNewClient(payment_gateway_pb2.CreateNewClientRequest(
+        new_client_username=username, new_client_password="bench", new_client_bank_id=bank_id, initial_balance=INITIAL_BALANCE
+    ), metadata=admin_metadata, timeout=TIMEOUT_S)
+    if response.err_code != 0:
+        raise RuntimeError(f"Could not create client {username}: {response.text}")
+    return response.account_number
+
+
+def timeCalls(function, make_request, metadata, calls):
+    latencies = []
+    for _ in range(calls):
+        request = make_request()
+        start_time = time.perf_counter()
+        response = function(request, metadata=metadata, timeout=TIMEOUT_S)
+        latencies.append(time.perf_counter() - start_time)
+        if response.err_code != 0:
+            raise RuntimeError(f"Request failed: {response.text}")
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the latency of gateway RPCs that call a bank")
+    parser.add_argument("--gatewayport", type=int, default=50051, help="Port of the payment gateway")
+    parser.add_argument("--admin", default="admin:admin", help="Admin credentials as username:password")
+    parser.add_argument("--banks", default="1,2", help="Bank ids of the sender and the receiver")
+    parser.add_argument("--calls", type=int, default=500, help="Calls per RPC")
+    args = parser.parse_args()
+
+    with open(repo_dir / "CA" / "ca.crt", "rb") as file:
+        credentials = grpc.ssl_channel_credentials(root_certificates=file.read())
+    with grpc.secure_channel(f"localhost:{args.gatewayport}", credentials) as channel:
+        stub = payment_gateway_grpc.PaymentGatewayStub(channel)
+        admin_metadata = login(stub, *args.admin.split(":", 1))
+        sender_bank, receiver_bank = [int(bank_id) for bank_id in args.banks.split(",")]
+        run_id = uuid.uuid4().hex[:8]
+        sender = f"bench_sender_{run_id}"
+        receiver = f"bench_receiver_{run_id}"
+        local_receiver = f"bench_local_receiver_{run_id}"
+        createClient(stub, admin_metadata, sender, sender_bank)
+        receiver_account = createClient(stub, admin_metadata, receiver, receiver_bank)
+        local_receiver_account = createClient(stub, admin_metadata, local_receiver, sender_bank)
+        metadata = login(stub, sender, "bench")
+
+        def amountRequest(**fields):
+            return lambda: payment_gateway_pb2.TransferAmountRequest(amount=1, idempotency_key=str(uuid.uuid4()), **fields)
+
+        rpcs = [
+            ("CheckBalance", stub.CheckBalance, payment_gateway_pb2.CheckBalanceRequest),
+            ("Deposit", stub.Deposit, amountRequest()),
+            ("Withdraw", stub.Withdraw, amountRequest()),
+            ("TransferAmount", stub.TransferAmount, amountRequest(
+                receiver_username=receiver, receiver_bank_id=receiver_bank, receiver_acc_no=receiver_account
+            )),
+            ("TransferAmount same bank", stub.TransferAmount, amountRequest(
+                receiver_username=local_receiver, receiver_bank_id=sender_bank, receiver_acc_no=local_receiver_account
+            ))
+        ]
+        print(f"{'rpc':<24}  {'p50 ms':>7}  {'p99 ms':>7}")
+        for name, function, make_request in rpcs:
+            p50, p99 = timeCalls(function, make_request, metadata, args.calls)
+            print(f"{name:<24}  {p50 * 1000:>7.2f}  {p99 * 1000:>7.2f}")
@@ -0,0 +1,72 @@
+"""
+Latency of the payment gateway's routing lookups as the number of banks
+and clients grows: getClient, getBankIdForClient, getBankPortById and
+isBankRegistered going through BankRoutingTable, and, for comparison, the
+scan over every bank's client list that getClient used to do. Runs in
+process, without banks or a gateway; the client looked up is the last one
+registered, the worst case of the scan. Run from the repository root:
+
+    python3 benchmarks/gateway_routing.py --sizes 2:100,10:10000,100:100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import payment_gateway
+from loguru import logger
+
+FIRST_BANK_PORT = 60000
+
+
+def buildRoutingTable(num_banks, num_clients):
+    # Clients are spread round robin over the banks; they all share one credential, hashed once
+    routing_table = payment_gateway.BankRoutingTable()
+    banks = [routing_table.registerBank(FIRST_BANK_PORT + index)[0] for index in range(num_banks)]
+    credential = payment_gateway.Credential.fromPassword("client", "bench")
+    for index in range(num_clients):
+        routing_table.addClient(banks[index % num_banks], f"user{index}", str(index + 1), credential)
+    return routing_table
+
+
+def timePerCall(call, argument, calls):
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        call(argument)
+    return (time.perf_counter() - start_time) / calls
+
+
+def scanForClient(routing_table, username):
+    for bank in routing_table.banks_by_id.values():
+        for client in bank.getAllClients():
+            if client.getUsername() == username:
+                return client
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure gateway routing lookup latency against the number of banks and clients")
+    parser.add_argument("--sizes", default="2:100,10:10000,100:100000", help="Comma separated banks:clients pairs")
+    parser.add_argument("--lookups", type=int, default=100000, help="Lookups timed per size and function")
+    parser.add_argument("--scans", type=int, default=20, help="Scans timed per size")
+    args = parser.parse_args()
+    logger.remove()
+    payment_gateway.credential_store = payment_gateway.CredentialStore()
+
+    print(f"{'banks':>5}  {'clients':>7}  {'getClient us':>12}  {'getBankIdForClient us':>21}  {'getBankPortById us':>18}  "
+          f"{'isBankRegistered us':>19}  {'scan us':>9}")
+    for size in args.sizes.split(","):
+        num_banks, num_clients = [int(count) for count in size.split(":")]
+        payment_gateway.routing_table = routing_table = buildRoutingTable(num_banks, num_clients)
+        username = f"user{num_clients - 1}"
+        bank_id = routing_table.getClient(username).getBankId()
+        get_client = timePerCall(payment_gateway.getClient, username, args.lookups)
+        get_bank_id = timePerCall(payment_gateway.getBankIdForClient, username, args.lookups)
+        get_port = timePerCall(payment_gateway.getBankPortById, bank_id, args.lookups)
+        is_registered = timePerCall(lambda port: payment_gateway.isBankRegistered(bank_port=port), FIRST_BANK_PORT + num_banks - 1, args.lookups)
+        scan = timePerCall(lambda name: scanForClient(routing_table, name), username, args.scans)
+        print(f"{num_banks:>5}  {num_clients:>7}  {get_client * 1e6:>12.2f}  {get_bank_id * 1e6:>21.2f}  {get_port * 1e6:>18.2f}  "
+              f"{is_registered * 1e6:>19.2f}  {scan * 1e6:>9.1f}")
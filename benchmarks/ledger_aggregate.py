@@ -0,0 +1,132 @@
+"""
+Time of the Aggregate computation over a bank's ledger, vectorized with
+NumPy as the Aggregate RPC does it, against the same computation as a
+pure Python loop over the rows. Runs in process: accounts are opened in a
+Bank and their statements filled with random entries the way a snapshot
+is loaded, so the rows land in the ledger like real ones. Also reports
+the memory taken per statement entry. Run from the repository root:
+
+    python3 benchmarks/ledger_aggregate.py --rows 50000000
+"""
+import argparse
+import gc
+import heapq
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import bank_server
+from loguru import logger
+
+START_TIME = 1.7e9
+
+
+def residentBytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def populate(bank, num_accounts, num_rows, days, seed):
+    # Spreads num_rows random entries over num_accounts new accounts
+    rng = np.random.default_rng(seed)
+    rows_per_account = num_rows // num_accounts
+    for index in range(num_accounts):
+        bank.openAccount(f"user{index}", "pw", 0)
+    for index, client in enumerate(bank.getAllClients()):
+        count = rows_per_account + (1 if index < num_rows % num_accounts else 0)
+        timestamps = np.sort(START_TIME + rng.random(count) * days * bank_server.SECONDS_PER_DAY)
+        types = rng.integers(0, len(bank_server.TRANSACTION_TYPES), count, dtype=np.uint8)
+        amounts = np.round(rng.exponential(100, count), 2)
+        counterparties = np.full(count, bank_server.NO_COUNTERPARTY, dtype=np.int32)
+        client.acc_statement.loadColumnBytes(timestamps.tobytes(), types.tobytes(), amounts.tobytes(), counterparties.tobytes())
+
+
+def aggregateLoop(ledger, account_number, start_time, end_time, top_n):
+    # Same result as ColumnarLedger.aggregate, one row at a time
+    incoming_types = bank_server.INCOMING_TRANSACTION_TYPES
+    total_in = 0.0
+    total_out = 0.0
+    count = 0
+    daily = {}
+    largest = []
+    for chunk in ledger._filledChunks():
+        columns = zip(chunk["timestamp"].tolist(), chunk["account"].tolist(), chunk["amount"].tolist(), chunk["type"].tolist())
+        for timestamp, account, amount, type_code in columns:
+            if account_number is not None and account != account_number:
+                continue
+            if timestamp < start_time or timestamp >= end_time:
+                continue
+            incoming = incoming_types[type_code]
+            if incoming:
+                total_in += amount
+            else:
+                total_out += amount
+            count += 1
+            day = int(timestamp // bank_server.SECONDS_PER_DAY)
+            volume_in, volume_out, num = daily.get(day, (0.0, 0.0, 0))
+            daily[day] = (volume_in + amount, volume_out, num + 1) if incoming else (volume_in, volume_out + amount, num + 1)
+            if top_n > 0:
+                entry = (amount, timestamp, account, type_code)
+                if len(largest) < top_n:
+                    heapq.heappush(largest, entry)
+                elif entry > largest[0]:
+                    heapq.heapreplace(largest, entry)
+    return {
+        "total_in": total_in,
+        "total_out": total_out,
+        "count": count,
+        "daily": sorted((day * bank_server.SECONDS_PER_DAY, *volumes) for day, volumes in daily.items()),
+        "largest": [(timestamp, account, amount, bank_server.TRANSACTION_TYPES[type_code])
+                    for amount, timestamp, account, type_code in sorted(largest, reverse=True)]
+    }
+
+
+def sameResult(first, second):
+    close = lambda a, b: math.isclose(a, b, rel_tol=1e-9)
+    return (close(first["total_in"], second["total_in"]) and close(first["total_out"], second["total_out"])
+            and first["count"] == second["count"] and first["largest"] == second["largest"]
+            and len(first["daily"]) == len(second["daily"])
+            and all(a[0] == b[0] and a[3] == b[3] and close(a[1], b[1]) and close(a[2], b[2]) for a, b in zip(first["daily"], second["daily"])))
+
+
+def timed(function, *arguments):
+    start_time = time.perf_counter()
+    result = function(*arguments)
+    return time.perf_counter() - start_time, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the vectorized Aggregate with a pure Python loop")
+    parser.add_argument("--rows", type=int, default=50000000, help="Statement entries in the ledger")
+    parser.add_argument("--accounts", type=int, default=100000, help="Accounts the entries are spread over")
+    parser.add_argument("--days", type=int, default=30, help="Days the entries are spread over")
+    parser.add_argument("--range-days", type=int, default=19, help="Days covered by the queried time range")
+    parser.add_argument("--top", type=int, default=5, help="Largest transactions asked for")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        bank = bank_server.Bank(0, data_dir)
+        gc.collect()
+        memory_before = residentBytes()
+        populate(bank, args.accounts, args.rows, args.days, args.seed)
+        gc.collect()
+        print(f"{args.rows} entries in {args.accounts} accounts, {(residentBytes() - memory_before) / args.rows:.1f} bytes per entry")
+
+        start_time = START_TIME + bank_server.SECONDS_PER_DAY
+        end_time = start_time + args.range_days * bank_server.SECONDS_PER_DAY
+        account_number = bank.getAllClients()[0].account_number
+        print(f"{'query':<12}  {'numpy s':>8}  {'python s':>9}  {'speedup':>7}  result")
+        for name, queried_account in [("bank", None), ("one account", account_number)]:
+            numpy_time, numpy_result = timed(bank.ledger.aggregate, queried_account, start_time, end_time, args.top)
+            loop_time, loop_result = timed(aggregateLoop, bank.ledger, queried_account, start_time, end_time, args.top)
+            match = "same" if sameResult(numpy_result, loop_result) else "DIFFERENT"
+            print(f"{name:<12}  {numpy_time:>8.3f}  {loop_time:>9.2f}  {loop_time / numpy_time:>7.0f}  {match}")
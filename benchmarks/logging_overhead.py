@@ -0,0 +1,139 @@
+"""
+Latency of bank RPCs with per-request logging on, sampled and off.
+
+For each scenario a fresh bank server is started in a scratch directory
+(so that its logs don't go to server/logs) and load processes issue Credit
+and FetchBalance RPCs for a fixed time, timing every call. The console
+output of the bank goes to a pipe that is drained, as it would be by a
+terminal. Run from the repository root:
+
+    python3 benchmarks/logging_overhead.py --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import grpc
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+import bank_pb2
+import bank_pb2_grpc as bank_grpc
+
+FETCH_BALANCE_SHARE = 0.5
+INITIAL_BALANCE = 1e9
+
+SCENARIOS = [
+    ("logging on", ["--request-log-sample-rate=1"]),
+    ("sampled 10%", ["--request-log-sample-rate=0.1"]),
+    ("logging off", ["--request-log-sample-rate=0"])
+]
+
+
+def startBank(port, work_dir, extra_args):
+    (work_dir / "server" / "logs").mkdir(parents=True)
+    command = [
+        sys.executable, str(repo_dir / "server" / "bank_server.py"),
+        f"--port={port}",
+        f"--data-dir={work_dir / 'data'}",
+        "--wal-durability=os-buffered",
+        "--snapshot-interval-s=0",
+        *extra_args
+    ]
+    env = dict(os.environ, PYTHONPATH=str(repo_dir / "generated"))
+    bank = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=lambda: [None for _ in bank.stdout], daemon=True).start()
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return bank
+
+
+def createAccounts(port, num_accounts):
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        stub = bank_grpc.BankStub(channel)
+        accounts = []
+        for index in range(num_accounts):
+            username = f"bench{index}"
+            response = stub.CreateNewClient(bank_pb2.CreateNewClientRequest(username=username, password="bench", initial_balance=INITIAL_BALANCE))
+            if response.err_code != 0:
+                raise RuntimeError(f"Could not create account {username}: {response.text}")
+            accounts.append((username, response.account_number))
+        return accounts
+
+
+async def generateLoad(port, accounts, duration_s, concurrency):
+    channel = grpc.aio.insecure_channel(f"localhost:{port}")
+    stub = bank_grpc.BankStub(channel)
+    deadline = time.monotonic() + duration_s
+    latencies = []
+
+    async def loop(index):
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            username, account_number = rng.choice(accounts)
+            start_time = time.perf_counter()
+            if rng.random() < FETCH_BALANCE_SHARE:
+                await stub.FetchBalance(bank_pb2.FetchBalanceRequest(account_number=account_number))
+            else:
+                await stub.Credit(bank_pb2.AmountTransferRequest(receiver_username=username, receiver_acc_no=account_number, amount=1, type="deposit"))
+            latencies.append(time.perf_counter() - start_time)
+
+    await asyncio.gather(*(loop(index) for index in range(concurrency)))
+    await channel.close()
+    return latencies
+
+
+def loadProcess(port, accounts, duration_s, concurrency, results):
+    results.put(asyncio.run(generateLoad(port, accounts, duration_s, concurrency)))
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(port, extra_args, args):
+    work_dir = Path(tempfile.mkdtemp(prefix="logging_benchmark_"))
+    bank = startBank(port, work_dir, extra_args)
+    try:
+        accounts = createAccounts(port, args.accounts)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        load_processes = [
+            context.Process(target=loadProcess, args=(port, accounts, args.duration, args.concurrency, results))
+            for _ in range(args.load_processes)
+        ]
+        for process in load_processes:
+            process.start()
+        latencies = sorted(latency for _ in load_processes for latency in results.get())
+        for process in load_processes:
+            process.join()
+        return len(latencies) / args.duration, percentile(latencies, 0.5), percentile(latencies, 0.99)
+    finally:
+        bank.terminate()
+        bank.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure bank RPC latency with request logging on, sampled and off")
+    parser.add_argument("--port", type=int, default=50082, help="Port for the bank servers started by the benchmark")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per scenario")
+    parser.add_argument("--accounts", type=int, default=100, help="Number of accounts the load is spread over")
+    parser.add_argument("--load-processes", type=int, default=1, help="Number of processes generating load")
+    parser.add_argument("--concurrency", type=int, default=16, help="RPCs in flight per load process")
+    parser.add_argument("--bank-args", default="", help="Extra arguments for the bank server, e.g. \"--aio\"")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<12}  {'rpc/s':>7}  {'p50 ms':>7}  {'p99 ms':>7}")
+    for name, extra_args in SCENARIOS:
+        throughput, p50, p99 = measure(args.port, extra_args + args.bank_args.split(), args)
+        print(f"{name:<12}  {throughput:>7.0f}  {p50 * 1000:>7.2f}  {p99 * 1000:>7.2f}")
@@ -0,0 +1,93 @@
+"""
+Cost and memory of the gateway's SessionStore when there are more logins
+than --max-sessions, against the plain dict of tokens the gateway used to
+keep every session in. Memory is what tracemalloc sees allocated by the
+logins and still held afterwards. Runs in process, without a gateway. Run
+from the repository root:
+
+    python3 benchmarks/session_store.py --logins 300000 --max-sessions 100000
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import payment_gateway
+from loguru import logger
+
+
+class SessionDict:
+    # How the gateway kept sessions before SessionStore: every login added a token, none was removed
+    def __init__(self):
+        self.sessions = {}
+
+    def create(self, role, username):
+        token = str(uuid.uuid4())
+        self.sessions[token] = (role, username)
+        return token
+
+    def lookup(self, token):
+        return self.sessions.get(token, (None, None))
+
+    def getStats(self):
+        return {"sessions": len(self.sessions), "evicted": 0}
+
+
+def login(store, usernames, count):
+    # Returns the tokens of the last len(usernames) logins
+    tokens = []
+    for index in range(count):
+        token = store.create("client", usernames[index % len(usernames)])
+        if index >= count - len(usernames):
+            tokens.append(token)
+    return tokens
+
+
+def timePerCall(call, arguments):
+    start_time = time.perf_counter()
+    for argument in arguments:
+        call(argument)
+    return (time.perf_counter() - start_time) / len(arguments)
+
+
+def measure(make_store, usernames, args):
+    # (stats, bytes held, seconds per login, seconds per lookup)
+    tracemalloc.start()
+    store = make_store()
+    login(store, usernames, args.logins)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+
+    store = make_store()
+    start_time = time.perf_counter()
+    tokens = login(store, usernames, args.logins)
+    create_time = (time.perf_counter() - start_time) / args.logins
+    lookup_time = timePerCall(store.lookup, tokens)
+    return store.getStats(), memory, create_time, lookup_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the gateway's session store against an unbounded dict")
+    parser.add_argument("--logins", type=int, default=300000, help="Logins, each creating a session")
+    parser.add_argument("--max-sessions", type=int, default=100000, help="--max-sessions of the store")
+    args = parser.parse_args()
+    logger.remove()
+    # Usernames come from the routing table in the gateway, so they aren't counted
+    usernames = [f"user{index}" for index in range(min(args.logins, args.max_sessions))]
+
+    stores = [
+        ("SessionStore", lambda: payment_gateway.SessionStore(max_sessions=args.max_sessions)),
+        ("dict (old)", SessionDict)
+    ]
+    print(f"{args.logins} logins")
+    print(f"{'store':<13}  {'sessions':>8}  {'evicted':>7}  {'memory MB':>9}  {'bytes/session':>13}  {'login us':>8}  {'lookup us':>9}")
+    for name, make_store in stores:
+        stats, memory, create_time, lookup_time = measure(make_store, usernames, args)
+        print(f"{name:<13}  {stats['sessions']:>8}  {stats['evicted']:>7}  {memory / 1e6:>9.1f}  {memory / stats['sessions']:>13.1f}  "
+              f"{create_time * 1e6:>8.2f}  {lookup_time * 1e6:>9.2f}")
@@ -0,0 +1,51 @@
+"""
+Cost of checking a session token, per request, for both --session-tokens
+modes: a lookup in the gateway's SessionStore and the verification of a
+signed token. Runs in process, without a gateway. Run from the repository
+root:
+
+    python3 benchmarks/session_tokens.py --sessions 100000
+"""
+import argparse
+import json
+import secrets
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import payment_gateway
+from loguru import logger
+
+
+def timeLookups(store, tokens, lookups):
+    start_time = time.perf_counter()
+    for index in range(lookups):
+        role, _ = store.lookup(tokens[index % len(tokens)])
+        if role is None:
+            raise RuntimeError("Valid token rejected")
+    return (time.perf_counter() - start_time) / lookups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cost of checking a session token")
+    parser.add_argument("--sessions", type=int, default=100000, help="Live sessions when measuring")
+    parser.add_argument("--lookups", type=int, default=200000, help="Tokens checked per mode")
+    args = parser.parse_args()
+    logger.remove()
+
+    store = payment_gateway.SessionStore(max_sessions=args.sessions)
+    store_tokens = [store.create("client", f"user{index}") for index in range(args.sessions)]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as keys_file:
+        json.dump({"current": "bench", "keys": {"bench": secrets.token_hex(32)}}, keys_file)
+    signed = payment_gateway.SignedSessionTokens(keys_file.name)
+    signed_tokens = [signed.create("client", f"user{index}") for index in range(min(args.sessions, 1000))]
+    Path(keys_file.name).unlink()
+
+    print(f"{'mode':<8}  {'us per check':>12}")
+    for name, tokens_store, tokens in [("store", store, store_tokens), ("signed", signed, signed_tokens)]:
+        print(f"{name:<8}  {timeLookups(tokens_store, tokens, args.lookups) * 1e6:>12.2f}")
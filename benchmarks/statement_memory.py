@@ -0,0 +1,94 @@
+"""
+Memory per statement entry and cost of the Credit write path, with
+statements kept as typed ledger rows that are only formatted when read,
+against the ANSI-coloured strings that Credit used to build and store for
+every entry. Memory is what the statements hold: ledger rows and row
+numbers, or the strings and the lists of them. Runs in process, without
+a write-ahead log: transfer credits go through BankServicer.applyCredit,
+and the old layout is rebuilt with the same strftime and f-string Credit
+used. Run from the repository root:
+
+    python3 benchmarks/statement_memory.py --entries 1000000
+"""
+import argparse
+import datetime
+import gc
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(repo_dir / "generated"))
+sys.path.append(str(repo_dir / "server"))
+import bank_pb2
+import bank_server
+from loguru import logger
+
+NUM_SENDERS = 100
+
+
+def creditRequests(num_accounts, count):
+    return [bank_pb2.AmountTransferRequest(receiver_username=f"user{index % num_accounts}", amount=index % 1000 + 0.5, type="transfer",
+                                           sender_username=f"sender{index % NUM_SENDERS}", sender_bank_id=2, sender_acc_no=str(index % NUM_SENDERS + 1))
+            for index in range(count)]
+
+
+def oldStatementEntry(request):
+    # What Credit stored for a transfer before statements were typed rows
+    formatted_time = datetime.datetime.now().strftime("%B %d, %Y - %H:%M:%S")
+    return (f"{bank_server.GREEN}{formatted_time} : {request.amount} credited from {request.sender_username}"
+            f" | Bank id: {request.sender_bank_id} | Acc No: {request.sender_acc_no}{bank_server.RESET}")
+
+
+def timePerCall(function, requests):
+    gc.collect()
+    start_time = time.perf_counter()
+    for request in requests:
+        function(request)
+    return (time.perf_counter() - start_time) / len(requests)
+
+
+def rowBytes(bank):
+    # Filled ledger rows plus every account's list of row numbers; the
+    # unfilled part of the last chunk is never touched, so takes no memory
+    ledger = bank.ledger
+    row_size = sum(column.itemsize for column in ledger.chunks[0].values())
+    return ledger.num_rows * row_size + sum(sys.getsizeof(client.acc_statement.rows) for client in bank.getAllClients())
+
+
+def stringBytes(statements):
+    return sum(sys.getsizeof(statement) + sum(sys.getsizeof(entry) for entry in statement) for statement in statements)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare statement memory and Credit cost of typed rows and formatted strings")
+    parser.add_argument("--entries", type=int, default=1000000, help="Transfer credits stored")
+    parser.add_argument("--accounts", type=int, default=1000, help="Accounts the credits are spread over")
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        bank = bank_server.Bank(0, data_dir)
+        bank_server.MyBank = bank
+        servicer = bank_server.BankServicer()
+        for index in range(args.accounts):
+            bank.openAccount(f"user{index}", "pw", 0)
+        requests = creditRequests(args.accounts, args.entries)
+
+        credit_time = timePerCall(servicer.applyCredit, requests)
+        row_bytes = rowBytes(bank) / args.entries
+        client = bank.getClientByUsername("user0")
+        start_time = time.perf_counter()
+        statement = bank.formatTransactions(client)
+        read_time = (time.perf_counter() - start_time) / len(statement)
+
+        old_statements = [[] for _ in range(args.accounts)]
+        old_time = timePerCall(lambda request: old_statements[int(request.receiver_username[4:])].append(oldStatementEntry(request)), requests)
+        string_bytes = stringBytes(old_statements) / args.entries
+
+        print(f"{args.entries} transfer credits over {args.accounts} accounts")
+        print(f"{'layout':<16}  {'bytes/entry':>11}  {'write us':>8}  {'read us':>7}")
+        print(f"{'typed rows':<16}  {row_bytes:>11.1f}  {credit_time * 1e6:>8.2f}  {read_time * 1e6:>7.2f}")
+        print(f"{'strings (old)':<16}  {string_bytes:>11.1f}  {old_time * 1e6:>8.2f}  {'-':>7}")
+        print("write us: a whole applyCredit call for typed rows, only building and storing the string for the old layout")
@@ -5,6 +5,7 @@ from pathlib import Path
 import requests
 import time
 import random
+import uuid
 
 # Get the absolute path of the current script
 script_dir = Path(__file__).parent
@@ -19,6 +20,14 @@ import payment_gateway_pb2_grpc as payment_gateway_grpc
 WAIT_TIME_FACTOR_S = 1  # Waiting time proportionality factor in seconds
 TIMEOUT_S = 2           # Timeout in seconds
 MAX_TRIES = 3
+# Failures worth retrying; anything else would fail the same way again
+RETRYABLE_STATUS_CODES = [
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.ABORTED
+]
+TRANSACTIONS_PAGE_SIZE = 50
 
 gateway_stub = None
 
@@ -46,8 +55,10 @@ class SessionManager:
 #     seconds = milliseconds / 1000
 #     time.sleep(seconds)
 
-# Wrapper for implementing idempotency for all types of request except 
-# authentication - it's case is handled separately in it's own function
+# Wrapper for retrying all types of request except authentication - it's
+# case is handled separately in it's own function. Requests moving money
+# must carry an idempotency key so that a retry can't move it twice.
+# Returns None once MAX_TRIES attempts failed.
 def send_request_get_response(function, request, metadata):
     tries = 0
     while True:
@@ -58,12 +69,15 @@ def send_request_get_response(function, request, metadata):
         try:
             response = function(request, metadata=metadata, timeout=time_to_wait_for_response_before_retry)
             return response
-        except Exception as e:
+        except grpc.RpcError as e:
+            if e.code() not in RETRYABLE_STATUS_CODES or tries >= MAX_TRIES:
+                print(f"RPC Failed: {e.details()}")
+                return None
             if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
                 print("Request failed, retrying...")
             else:
-                print(f"RPC Failes: {e}, retrying...")
-            continue
+                print(f"RPC Failed: {e.details()}, retrying...")
+                time.sleep(random.random() * WAIT_TIME_FACTOR_S * (2 ** tries))
 
 
 def clear_screen():
@@ -118,7 +132,9 @@ def check_balance():
     response  = send_request_get_response(gateway_stub.CheckBalance, request_obj, metadata)
     # response = gateway_stub.CheckBalance(request_obj, metadata=metadata)
 
-    if response.err_code == 1:
+    if response is None:
+        logger.error("Could not reach the payment gateway")
+    elif response.err_code == 1:
         logger.error(response.text)
     else:
         logger.info(f"Balance = {response.balance}")
@@ -204,10 +220,13 @@ def transfer_amount(receiver_username, receiver_bank_id, receiver_acc_no, amount
     request_obj.receiver_acc_no = receiver_acc_no
     request_obj.amount = float(amount_to_be_transferred)
     request_obj.type = "transfer"
+    request_obj.idempotency_key = str(uuid.uuid4())
 
-    response = gateway_stub.TransferAmount(request_obj, metadata=update_amount_in_metadata(amount_to_be_transferred))
+    response = send_request_get_response(gateway_stub.TransferAmount, request_obj, update_amount_in_metadata(amount_to_be_transferred))
 
-    if response.err_code == 1:
+    if response is None:
+        logger.error("Transfer status unknown, check your account statement")
+    elif response.err_code == 1:
         logger.error(response.text)
     else:
         logger.info(f"Transferred successfully remaining balance = {response.balance}")
@@ -219,9 +238,12 @@ def deposit(amount):
         return
     request_obj = payment_gateway_pb2.TransferAmountRequest()
     request_obj.amount = float(amount)
-    response = gateway_stub.Deposit(request_obj, metadata=update_amount_in_metadata(amount))
+    request_obj.idempotency_key = str(uuid.uuid4())
+    response = send_request_get_response(gateway_stub.Deposit, request_obj, update_amount_in_metadata(amount))
 
-    if response.err_code == 1:
+    if response is None:
+        logger.error("Deposit status unknown, check your account statement")
+    elif response.err_code == 1:
         logger.error(response.text)
     else:
         logger.info(f"Amount deposited successfully, final balance = {response.balance}")
@@ -234,26 +256,34 @@ def withdraw(amount):
     
     request_obj = payment_gateway_pb2.TransferAmountRequest()
     request_obj.amount = float(amount)
+    request_obj.idempotency_key = str(uuid.uuid4())
 
-    response = gateway_stub.Withdraw(request_obj, metadata=update_amount_in_metadata(amount))
+    response = send_request_get_response(gateway_stub.Withdraw, request_obj, update_amount_in_metadata(amount))
 
-    if response.err_code == 1:
+    if response is None:
+        logger.error("Withdrawal status unknown, check your account statement")
+    elif response.err_code == 1:
         logger.error(response.text)
     else:
         logger.info(f"Amount withdrawn successfully, final balance = {response.balance}")
     wait_for_enter()
 
 def get_account_statement():
-    request_obj = payment_gateway_pb2.TransactionHistoryRequest()
-    response = gateway_stub.GetTransactionHistory(request_obj, metadata=metadata)
-
-    if response.err_code == 1:
-        logger.error(response.text)
-    else:
-        transactions = response.transactions
-        for transaction in transactions:
-            print(transaction)
-            print()
+    request_obj = payment_gateway_pb2.TransactionHistoryPageRequest()
+    request_obj.cursor = 0
+    request_obj.page_size = TRANSACTIONS_PAGE_SIZE
+
+    # Pages are printed as they arrive instead of waiting for the whole history
+    try:
+        for page in gateway_stub.StreamTransactionHistory(request_obj, metadata=metadata):
+            if page.err_code == 1:
+                logger.error(page.text)
+                break
+            for transaction in page.transactions:
+                print(transaction)
+                print()
+    except grpc.RpcError as e:
+        logger.error(f"Failed to fetch account statement: {e.details()}")
     wait_for_enter()
 
 def validateInput(username=None, password=None, bank_id=None, account_number=None, balance=None):
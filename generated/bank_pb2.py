@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nbank.proto\x12\x04\x62\x61nk\"U\n\x16\x43reateNewClientRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x17\n\x0finitial_balance\x18\x03 \x01(\x02\"Q\n\x17\x43reateNewClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x03 \x01(\t\"V\n\x18\x43lientInformationRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\",\n\x19\x43lientInformationResponse\x12\x0f\n\x07present\x18\x01 \x01(\x08\"-\n\x13\x46\x65tchBalanceRequest\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x01 \x01(\t\"G\n\x14\x46\x65tchBalanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"5\n\x11\x41\x64\x64\x42\x61lanceRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x02\"4\n\x12\x41\x64\x64\x42\x61lanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\xcb\x01\n\x15\x41mountTransferRequest\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x17\n\x0fsender_username\x18\x02 \x01(\t\x12\x18\n\x10receiver_bank_id\x18\x03 \x01(\x05\x12\x16\n\x0esender_bank_id\x18\x04 \x01(\x05\x12\x17\n\x0freceiver_acc_no\x18\x05 \x01(\t\x12\x15\n\rsender_acc_no\x18\x06 \x01(\t\x12\x0e\n\x06\x61mount\x18\x07 \x01(\x02\x12\x0c\n\x04type\x18\x08 \x01(\t\"I\n\x16\x41mountTransferResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\";\n\x17\x43heckClientExistRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61\x63\x63_no\x18\x02 \x01(\t\":\n\x18\x43heckClientExistResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\'\n\x13TransactionsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"L\n\x14TransactionsResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t2\xd9\x04\n\x04\x42\x61nk\x12N\n\x0f\x43reateNewClient\x12\x1c.bank.CreateNewClientRequest\x1a\x1d.bank.CreateNewClientResponse\x12S\n\x10VerifyClientInfo\x12\x1e.bank.ClientInformationRequest\x1a\x1f.bank.ClientInformationResponse\x12\x45\n\x0c\x46\x65tchBalance\x12\x19.bank.FetchBalanceRequest\x1a\x1a.bank.FetchBalanceResponse\x12?\n\nAddBalance\x12\x17.bank.AddBalanceRequest\x1a\x18.bank.AddBalanceResponse\x12\x42\n\x05\x44\x65\x62it\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12\x43\n\x06\x43redit\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12H\n\x0fGetTransactions\x12\x19.bank.TransactionsRequest\x1a\x1a.bank.TransactionsResponse\x12Q\n\x10\x43heckClientExist\x12\x1d.bank.CheckClientExistRequest\x1a\x1e.bank.CheckClientExistResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nbank.proto\x12\x04\x62\x61nk\"U\n\x16\x43reateNewClientRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x17\n\x0finitial_balance\x18\x03 \x01(\x02\"Q\n\x17\x43reateNewClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x03 \x01(\t\"V\n\x18\x43lientInformationRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\",\n\x19\x43lientInformationResponse\x12\x0f\n\x07present\x18\x01 \x01(\x08\"-\n\x13\x46\x65tchBalanceRequest\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x01 \x01(\t\"G\n\x14\x46\x65tchBalanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"5\n\x11\x41\x64\x64\x42\x61lanceRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x02\"4\n\x12\x41\x64\x64\x42\x61lanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\xf9\x01\n\x15\x41mountTransferRequest\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x17\n\x0fsender_username\x18\x02 \x01(\t\x12\x18\n\x10receiver_bank_id\x18\x03 \x01(\x05\x12\x16\n\x0esender_bank_id\x18\x04 \x01(\x05\x12\x17\n\x0freceiver_acc_no\x18\x05 \x01(\t\x12\x15\n\rsender_acc_no\x18\x06 \x01(\t\x12\x0e\n\x06\x61mount\x18\x07 \x01(\x02\x12\x0c\n\x04type\x18\x08 \x01(\t\x12\x17\n\x0fidempotency_key\x18\t \x01(\t\x12\x13\n\x0btransfer_id\x18\n \x01(\t\"I\n\x16\x41mountTransferResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\";\n\x17\x43heckClientExistRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61\x63\x63_no\x18\x02 \x01(\t\":\n\x18\x43heckClientExistResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\'\n\x13TransactionsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"L\n\x14TransactionsResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t\"N\n\x17TransactionsPageRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\x04\x12\x11\n\tpage_size\x18\x03 \x01(\r\"o\n\x10TransactionsPage\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t\x12\x13\n\x0bnext_cursor\x18\x04 \x01(\x04\x12\x10\n\x08has_more\x18\x05 \x01(\x08\"_\n\x10\x41ggregateRequest\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x01 \x01(\t\x12\x12\n\nstart_time\x18\x02 \x01(\x01\x12\x10\n\x08\x65nd_time\x18\x03 \x01(\x01\x12\r\n\x05top_n\x18\x04 \x01(\r\"N\n\x0b\x44\x61ilyVolume\x12\x0b\n\x03\x64\x61y\x18\x01 \x01(\x03\x12\x10\n\x08total_in\x18\x02 \x01(\x01\x12\x11\n\ttotal_out\x18\x03 \x01(\x01\x12\r\n\x05\x63ount\x18\x04 \x01(\x04\"[\n\x10LargeTransaction\x12\x11\n\ttimestamp\x18\x01 \x01(\x01\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x0e\n\x06\x61mount\x18\x03 \x01(\x01\x12\x0c\n\x04type\x18\x04 \x01(\t\"\xb2\x01\n\x11\x41ggregateResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x10\n\x08total_in\x18\x03 \x01(\x01\x12\x11\n\ttotal_out\x18\x04 \x01(\x01\x12\r\n\x05\x63ount\x18\x05 \x01(\x04\x12 \n\x05\x64\x61ily\x18\x06 \x03(\x0b\x32\x11.bank.DailyVolume\x12\'\n\x07largest\x18\x07 \x03(\x0b\x32\x16.bank.LargeTransaction\"O\n\tCreditLeg\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x17\n\x0freceiver_acc_no\x18\x02 \x01(\t\x12\x0e\n\x06\x61mount\x18\x03 \x01(\x02\"\x93\x01\n\x11\x42ulkCreditRequest\x12\x17\n\x0fsender_username\x18\x01 \x01(\t\x12\x16\n\x0esender_bank_id\x18\x02 \x01(\x05\x12\x15\n\rsender_acc_no\x18\x03 \x01(\t\x12\x1d\n\x04legs\x18\x04 \x03(\x0b\x32\x0f.bank.CreditLeg\x12\x17\n\x0fidempotency_key\x18\x05 \x01(\t\"1\n\x0f\x43reditLegResult\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\\\n\x12\x42ulkCreditResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12&\n\x07results\x18\x03 \x03(\x0b\x32\x15.bank.CreditLegResult\")\n\x12ReservationRequest\x12\x13\n\x0btransfer_id\x18\x01 \x01(\t2\xcd\x08\n\x04\x42\x61nk\x12N\n\x0f\x43reateNewClient\x12\x1c.bank.CreateNewClientRequest\x1a\x1d.bank.CreateNewClientResponse\x12S\n\x10VerifyClientInfo\x12\x1e.bank.ClientInformationRequest\x1a\x1f.bank.ClientInformationResponse\x12\x45\n\x0c\x46\x65tchBalance\x12\x19.bank.FetchBalanceRequest\x1a\x1a.bank.FetchBalanceResponse\x12?\n\nAddBalance\x12\x17.bank.AddBalanceRequest\x1a\x18.bank.AddBalanceResponse\x12\x42\n\x05\x44\x65\x62it\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12\x43\n\x06\x43redit\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12H\n\x0fGetTransactions\x12\x19.bank.TransactionsRequest\x1a\x1a.bank.TransactionsResponse\x12Q\n\x10\x43heckClientExist\x12\x1d.bank.CheckClientExistRequest\x1a\x1e.bank.CheckClientExistResponse\x12M\n\x12StreamTransactions\x12\x1d.bank.TransactionsPageRequest\x1a\x16.bank.TransactionsPage0\x01\x12<\n\tAggregate\x12\x16.bank.AggregateRequest\x1a\x17.bank.AggregateResponse\x12?\n\nBulkCredit\x12\x17.bank.BulkCreditRequest\x1a\x18.bank.BulkCreditResponse\x12\x45\n\x08Transfer\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12\x44\n\x07Reserve\x12\x1b.bank.AmountTransferRequest\x1a\x1c.bank.AmountTransferResponse\x12K\n\x11\x43ommitReservation\x12\x18.bank.ReservationRequest\x1a\x1c.bank.AmountTransferResponse\x12J\n\x10\x41\x62ortReservation\x12\x18.bank.ReservationRequest\x1a\x1c.bank.AmountTransferResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -48,17 +48,39 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_ADDBALANCERESPONSE']._serialized_start=499
   _globals['_ADDBALANCERESPONSE']._serialized_end=551
   _globals['_AMOUNTTRANSFERREQUEST']._serialized_start=554
-  _globals['_AMOUNTTRANSFERREQUEST']._serialized_end=757
-  _globals['_AMOUNTTRANSFERRESPONSE']._serialized_start=759
-  _globals['_AMOUNTTRANSFERRESPONSE']._serialized_end=832
-  _globals['_CHECKCLIENTEXISTREQUEST']._serialized_start=834
-  _globals['_CHECKCLIENTEXISTREQUEST']._serialized_end=893
-  _globals['_CHECKCLIENTEXISTRESPONSE']._serialized_start=895
-  _globals['_CHECKCLIENTEXISTRESPONSE']._serialized_end=953
-  _globals['_TRANSACTIONSREQUEST']._serialized_start=955
-  _globals['_TRANSACTIONSREQUEST']._serialized_end=994
-  _globals['_TRANSACTIONSRESPONSE']._serialized_start=996
-  _globals['_TRANSACTIONSRESPONSE']._serialized_end=1072
-  _globals['_BANK']._serialized_start=1075
-  _globals['_BANK']._serialized_end=1676
+  _globals['_AMOUNTTRANSFERREQUEST']._serialized_end=803
+  _globals['_AMOUNTTRANSFERRESPONSE']._serialized_start=805
+  _globals['_AMOUNTTRANSFERRESPONSE']._serialized_end=878
+  _globals['_CHECKCLIENTEXISTREQUEST']._serialized_start=880
+  _globals['_CHECKCLIENTEXISTREQUEST']._serialized_end=939
+  _globals['_CHECKCLIENTEXISTRESPONSE']._serialized_start=941
+  _globals['_CHECKCLIENTEXISTRESPONSE']._serialized_end=999
+  _globals['_TRANSACTIONSREQUEST']._serialized_start=1001
+  _globals['_TRANSACTIONSREQUEST']._serialized_end=1040
+  _globals['_TRANSACTIONSRESPONSE']._serialized_start=1042
+  _globals['_TRANSACTIONSRESPONSE']._serialized_end=1118
+  _globals['_TRANSACTIONSPAGEREQUEST']._serialized_start=1120
+  _globals['_TRANSACTIONSPAGEREQUEST']._serialized_end=1198
+  _globals['_TRANSACTIONSPAGE']._serialized_start=1200
+  _globals['_TRANSACTIONSPAGE']._serialized_end=1311
+  _globals['_AGGREGATEREQUEST']._serialized_start=1313
+  _globals['_AGGREGATEREQUEST']._serialized_end=1408
+  _globals['_DAILYVOLUME']._serialized_start=1410
+  _globals['_DAILYVOLUME']._serialized_end=1488
+  _globals['_LARGETRANSACTION']._serialized_start=1490
+  _globals['_LARGETRANSACTION']._serialized_end=1581
+  _globals['_AGGREGATERESPONSE']._serialized_start=1584
+  _globals['_AGGREGATERESPONSE']._serialized_end=1762
+  _globals['_CREDITLEG']._serialized_start=1764
+  _globals['_CREDITLEG']._serialized_end=1843
+  _globals['_BULKCREDITREQUEST']._serialized_start=1846
+  _globals['_BULKCREDITREQUEST']._serialized_end=1993
+  _globals['_CREDITLEGRESULT']._serialized_start=1995
+  _globals['_CREDITLEGRESULT']._serialized_end=2044
+  _globals['_BULKCREDITRESPONSE']._serialized_start=2046
+  _globals['_BULKCREDITRESPONSE']._serialized_end=2138
+  _globals['_RESERVATIONREQUEST']._serialized_start=2140
+  _globals['_RESERVATIONREQUEST']._serialized_end=2181
+  _globals['_BANK']._serialized_start=2184
+  _globals['_BANK']._serialized_end=3285
 # @@protoc_insertion_point(module_scope)
@@ -74,6 +74,41 @@ class BankStub(object):
                 request_serializer=bank__pb2.CheckClientExistRequest.SerializeToString,
                 response_deserializer=bank__pb2.CheckClientExistResponse.FromString,
                 _registered_method=True)
+        self.StreamTransactions = channel.unary_stream(
+                '/bank.Bank/StreamTransactions',
+                request_serializer=bank__pb2.TransactionsPageRequest.SerializeToString,
+                response_deserializer=bank__pb2.TransactionsPage.FromString,
+                _registered_method=True)
+        self.Aggregate = channel.unary_unary(
+                '/bank.Bank/Aggregate',
+                request_serializer=bank__pb2.AggregateRequest.SerializeToString,
+                response_deserializer=bank__pb2.AggregateResponse.FromString,
+                _registered_method=True)
+        self.BulkCredit = channel.unary_unary(
+                '/bank.Bank/BulkCredit',
+                request_serializer=bank__pb2.BulkCreditRequest.SerializeToString,
+                response_deserializer=bank__pb2.BulkCreditResponse.FromString,
+                _registered_method=True)
+        self.Transfer = channel.unary_unary(
+                '/bank.Bank/Transfer',
+                request_serializer=bank__pb2.AmountTransferRequest.SerializeToString,
+                response_deserializer=bank__pb2.AmountTransferResponse.FromString,
+                _registered_method=True)
+        self.Reserve = channel.unary_unary(
+                '/bank.Bank/Reserve',
+                request_serializer=bank__pb2.AmountTransferRequest.SerializeToString,
+                response_deserializer=bank__pb2.AmountTransferResponse.FromString,
+                _registered_method=True)
+        self.CommitReservation = channel.unary_unary(
+                '/bank.Bank/CommitReservation',
+                request_serializer=bank__pb2.ReservationRequest.SerializeToString,
+                response_deserializer=bank__pb2.AmountTransferResponse.FromString,
+                _registered_method=True)
+        self.AbortReservation = channel.unary_unary(
+                '/bank.Bank/AbortReservation',
+                request_serializer=bank__pb2.ReservationRequest.SerializeToString,
+                response_deserializer=bank__pb2.AmountTransferResponse.FromString,
+                _registered_method=True)
 
 
 class BankServicer(object):
@@ -127,6 +162,52 @@ class BankServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamTransactions(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Aggregate(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BulkCredit(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Transfer(self, request, context):
+        """Debits the sender and credits the receiver, both accounts of this bank, in one step
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Reserve(self, request, context):
+        """Two steps of a transfer to another bank: Reserve takes the amount off the
+        sender's balance and holds it, then CommitReservation settles the hold once
+        the receiver is credited, or AbortReservation gives the money back
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CommitReservation(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AbortReservation(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_BankServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -170,6 +251,41 @@ def add_BankServicer_to_server(servicer, server):
                     request_deserializer=bank__pb2.CheckClientExistRequest.FromString,
                     response_serializer=bank__pb2.CheckClientExistResponse.SerializeToString,
             ),
+            'StreamTransactions': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamTransactions,
+                    request_deserializer=bank__pb2.TransactionsPageRequest.FromString,
+                    response_serializer=bank__pb2.TransactionsPage.SerializeToString,
+            ),
+            'Aggregate': grpc.unary_unary_rpc_method_handler(
+                    servicer.Aggregate,
+                    request_deserializer=bank__pb2.AggregateRequest.FromString,
+                    response_serializer=bank__pb2.AggregateResponse.SerializeToString,
+            ),
+            'BulkCredit': grpc.unary_unary_rpc_method_handler(
+                    servicer.BulkCredit,
+                    request_deserializer=bank__pb2.BulkCreditRequest.FromString,
+                    response_serializer=bank__pb2.BulkCreditResponse.SerializeToString,
+            ),
+            'Transfer': grpc.unary_unary_rpc_method_handler(
+                    servicer.Transfer,
+                    request_deserializer=bank__pb2.AmountTransferRequest.FromString,
+                    response_serializer=bank__pb2.AmountTransferResponse.SerializeToString,
+            ),
+            'Reserve': grpc.unary_unary_rpc_method_handler(
+                    servicer.Reserve,
+                    request_deserializer=bank__pb2.AmountTransferRequest.FromString,
+                    response_serializer=bank__pb2.AmountTransferResponse.SerializeToString,
+            ),
+            'CommitReservation': grpc.unary_unary_rpc_method_handler(
+                    servicer.CommitReservation,
+                    request_deserializer=bank__pb2.ReservationRequest.FromString,
+                    response_serializer=bank__pb2.AmountTransferResponse.SerializeToString,
+            ),
+            'AbortReservation': grpc.unary_unary_rpc_method_handler(
+                    servicer.AbortReservation,
+                    request_deserializer=bank__pb2.ReservationRequest.FromString,
+                    response_serializer=bank__pb2.AmountTransferResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'bank.Bank', rpc_method_handlers)
@@ -396,3 +512,192 @@ class Bank(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StreamTransactions(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/bank.Bank/StreamTransactions',
+            bank__pb2.TransactionsPageRequest.SerializeToString,
+            bank__pb2.TransactionsPage.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Aggregate(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/Aggregate',
+            bank__pb2.AggregateRequest.SerializeToString,
+            bank__pb2.AggregateResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BulkCredit(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/BulkCredit',
+            bank__pb2.BulkCreditRequest.SerializeToString,
+            bank__pb2.BulkCreditResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Transfer(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/Transfer',
+            bank__pb2.AmountTransferRequest.SerializeToString,
+            bank__pb2.AmountTransferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Reserve(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/Reserve',
+            bank__pb2.AmountTransferRequest.SerializeToString,
+            bank__pb2.AmountTransferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CommitReservation(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/CommitReservation',
+            bank__pb2.ReservationRequest.SerializeToString,
+            bank__pb2.AmountTransferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AbortReservation(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bank.Bank/AbortReservation',
+            bank__pb2.ReservationRequest.SerializeToString,
+            bank__pb2.AmountTransferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
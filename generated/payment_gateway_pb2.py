@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x15payment_gateway.proto\x12\x0epaymentgateway\"1\n\x0b\x41uthRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"<\n\x0c\x41uthResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0c\n\x04role\x18\x03 \x01(\t\"\xb7\x01\n\x16\x43reateNewClientRequest\x12\x16\n\x0e\x61\x64min_username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x64min_password\x18\x02 \x01(\t\x12\x1b\n\x13new_client_username\x18\x03 \x01(\t\x12\x1b\n\x13new_client_password\x18\x04 \x01(\t\x12\x1a\n\x12new_client_bank_id\x18\x05 \x01(\x05\x12\x17\n\x0finitial_balance\x18\x06 \x01(\x02\"Q\n\x17\x43reateNewClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x03 \x01(\t\"d\n\x15RegisterClientRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\x12\x0f\n\x07\x62\x61nk_id\x18\x04 \x01(\x05\"8\n\x16RegisterClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"#\n\x13RegisterBankRequest\x12\x0c\n\x04port\x18\x01 \x01(\x05\"B\n\x14RegisterBankResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\n\n\x02id\x18\x03 \x01(\x05\"\x15\n\x13\x43heckBalanceRequest\"G\n\x14\x43heckBalanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"5\n\x11\x41\x64\x64\x42\x61lanceRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x02\"4\n\x12\x41\x64\x64\x42\x61lanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\x83\x01\n\x15TransferAmountRequest\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x18\n\x10receiver_bank_id\x18\x02 \x01(\x05\x12\x17\n\x0freceiver_acc_no\x18\x03 \x01(\t\x12\x0e\n\x06\x61mount\x18\x04 \x01(\x02\x12\x0c\n\x04type\x18\x05 \x01(\t\"I\n\x16TransferAmountResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"\x1b\n\x19TransactionHistoryRequest\"R\n\x1aTransactionHistoryResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t2\xc7\x07\n\x0ePaymentGateway\x12I\n\x0c\x41uthenticate\x12\x1b.paymentgateway.AuthRequest\x1a\x1c.paymentgateway.AuthResponse\x12_\n\x0eRegisterClient\x12%.paymentgateway.RegisterClientRequest\x1a&.paymentgateway.RegisterClientResponse\x12Y\n\x0cRegisterBank\x12#.paymentgateway.RegisterBankRequest\x1a$.paymentgateway.RegisterBankResponse\x12Y\n\x0c\x43heckBalance\x12#.paymentgateway.CheckBalanceRequest\x1a$.paymentgateway.CheckBalanceResponse\x12m\n\x1a\x41\x64minAccessCreateNewClient\x12&.paymentgateway.CreateNewClientRequest\x1a\'.paymentgateway.CreateNewClientResponse\x12^\n\x15\x41\x64minAccessAddBalance\x12!.paymentgateway.AddBalanceRequest\x1a\".paymentgateway.AddBalanceResponse\x12_\n\x0eTransferAmount\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12X\n\x07\x44\x65posit\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12Y\n\x08Withdraw\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12n\n\x15GetTransactionHistory\x12).paymentgateway.TransactionHistoryRequest\x1a*.paymentgateway.TransactionHistoryResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x15payment_gateway.proto\x12\x0epaymentgateway\"1\n\x0b\x41uthRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"<\n\x0c\x41uthResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0c\n\x04role\x18\x03 \x01(\t\"\xb7\x01\n\x16\x43reateNewClientRequest\x12\x16\n\x0e\x61\x64min_username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x64min_password\x18\x02 \x01(\t\x12\x1b\n\x13new_client_username\x18\x03 \x01(\t\x12\x1b\n\x13new_client_password\x18\x04 \x01(\t\x12\x1a\n\x12new_client_bank_id\x18\x05 \x01(\x05\x12\x17\n\x0finitial_balance\x18\x06 \x01(\x02\"Q\n\x17\x43reateNewClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x03 \x01(\t\"d\n\x15RegisterClientRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x16\n\x0e\x61\x63\x63ount_number\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\x12\x0f\n\x07\x62\x61nk_id\x18\x04 \x01(\x05\"8\n\x16RegisterClientResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"#\n\x13RegisterBankRequest\x12\x0c\n\x04port\x18\x01 \x01(\x05\"S\n\x14RegisterBankResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\n\n\x02id\x18\x03 \x01(\x05\x12\x0f\n\x07lease_s\x18\x04 \x01(\x02\"0\n\x14\x42\x61nkHeartbeatRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04port\x18\x02 \x01(\x05\"H\n\x15\x42\x61nkHeartbeatResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07lease_s\x18\x03 \x01(\x02\"\x15\n\x13\x43heckBalanceRequest\"G\n\x14\x43heckBalanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"5\n\x11\x41\x64\x64\x42\x61lanceRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61mount\x18\x02 \x01(\x02\"4\n\x12\x41\x64\x64\x42\x61lanceResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\"\x9c\x01\n\x15TransferAmountRequest\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x18\n\x10receiver_bank_id\x18\x02 \x01(\x05\x12\x17\n\x0freceiver_acc_no\x18\x03 \x01(\t\x12\x0e\n\x06\x61mount\x18\x04 \x01(\x02\x12\x0c\n\x04type\x18\x05 \x01(\t\x12\x17\n\x0fidempotency_key\x18\x06 \x01(\t\"I\n\x16TransferAmountResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\"\x1b\n\x19TransactionHistoryRequest\"R\n\x1aTransactionHistoryResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t\"B\n\x1dTransactionHistoryPageRequest\x12\x0e\n\x06\x63ursor\x18\x01 \x01(\x04\x12\x11\n\tpage_size\x18\x02 \x01(\r\"u\n\x16TransactionHistoryPage\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x14\n\x0ctransactions\x18\x03 \x03(\t\x12\x13\n\x0bnext_cursor\x18\x04 \x01(\x04\x12\x10\n\x08has_more\x18\x05 \x01(\x08\"k\n\x0bTransferLeg\x12\x19\n\x11receiver_username\x18\x01 \x01(\t\x12\x18\n\x10receiver_bank_id\x18\x02 \x01(\x05\x12\x17\n\x0freceiver_acc_no\x18\x03 \x01(\t\x12\x0e\n\x06\x61mount\x18\x04 \x01(\x02\"Y\n\x13\x42ulkTransferRequest\x12)\n\x04legs\x18\x01 \x03(\x0b\x32\x1b.paymentgateway.TransferLeg\x12\x17\n\x0fidempotency_key\x18\x02 \x01(\t\"B\n\x11TransferLegResult\x12\r\n\x05index\x18\x01 \x01(\x05\x12\x10\n\x08\x65rr_code\x18\x02 \x01(\x05\x12\x0c\n\x04text\x18\x03 \x01(\t\"\xc5\x01\n\x14\x42ulkTransferResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x03 \x01(\x02\x12\x19\n\x11total_transferred\x18\x04 \x01(\x02\x12\x16\n\x0etotal_refunded\x18\x05 \x01(\x02\x12\x32\n\x07results\x18\x06 \x03(\x0b\x32!.paymentgateway.TransferLegResult\x12\x15\n\rtotal_pending\x18\x07 \x01(\x02\x32\xf5\t\n\x0ePaymentGateway\x12I\n\x0c\x41uthenticate\x12\x1b.paymentgateway.AuthRequest\x1a\x1c.paymentgateway.AuthResponse\x12_\n\x0eRegisterClient\x12%.paymentgateway.RegisterClientRequest\x1a&.paymentgateway.RegisterClientResponse\x12Y\n\x0cRegisterBank\x12#.paymentgateway.RegisterBankRequest\x1a$.paymentgateway.RegisterBankResponse\x12\\\n\rBankHeartbeat\x12$.paymentgateway.BankHeartbeatRequest\x1a%.paymentgateway.BankHeartbeatResponse\x12Y\n\x0c\x43heckBalance\x12#.paymentgateway.CheckBalanceRequest\x1a$.paymentgateway.CheckBalanceResponse\x12m\n\x1a\x41\x64minAccessCreateNewClient\x12&.paymentgateway.CreateNewClientRequest\x1a\'.paymentgateway.CreateNewClientResponse\x12^\n\x15\x41\x64minAccessAddBalance\x12!.paymentgateway.AddBalanceRequest\x1a\".paymentgateway.AddBalanceResponse\x12_\n\x0eTransferAmount\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12X\n\x07\x44\x65posit\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12Y\n\x08Withdraw\x12%.paymentgateway.TransferAmountRequest\x1a&.paymentgateway.TransferAmountResponse\x12n\n\x15GetTransactionHistory\x12).paymentgateway.TransactionHistoryRequest\x1a*.paymentgateway.TransactionHistoryResponse\x12s\n\x18StreamTransactionHistory\x12-.paymentgateway.TransactionHistoryPageRequest\x1a&.paymentgateway.TransactionHistoryPage0\x01\x12Y\n\x0c\x42ulkTransfer\x12#.paymentgateway.BulkTransferRequest\x1a$.paymentgateway.BulkTransferResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -46,23 +46,39 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_REGISTERBANKREQUEST']._serialized_start=583
   _globals['_REGISTERBANKREQUEST']._serialized_end=618
   _globals['_REGISTERBANKRESPONSE']._serialized_start=620
-  _globals['_REGISTERBANKRESPONSE']._serialized_end=686
-  _globals['_CHECKBALANCEREQUEST']._serialized_start=688
-  _globals['_CHECKBALANCEREQUEST']._serialized_end=709
-  _globals['_CHECKBALANCERESPONSE']._serialized_start=711
-  _globals['_CHECKBALANCERESPONSE']._serialized_end=782
-  _globals['_ADDBALANCEREQUEST']._serialized_start=784
-  _globals['_ADDBALANCEREQUEST']._serialized_end=837
-  _globals['_ADDBALANCERESPONSE']._serialized_start=839
-  _globals['_ADDBALANCERESPONSE']._serialized_end=891
-  _globals['_TRANSFERAMOUNTREQUEST']._serialized_start=894
-  _globals['_TRANSFERAMOUNTREQUEST']._serialized_end=1025
-  _globals['_TRANSFERAMOUNTRESPONSE']._serialized_start=1027
-  _globals['_TRANSFERAMOUNTRESPONSE']._serialized_end=1100
-  _globals['_TRANSACTIONHISTORYREQUEST']._serialized_start=1102
-  _globals['_TRANSACTIONHISTORYREQUEST']._serialized_end=1129
-  _globals['_TRANSACTIONHISTORYRESPONSE']._serialized_start=1131
-  _globals['_TRANSACTIONHISTORYRESPONSE']._serialized_end=1213
-  _globals['_PAYMENTGATEWAY']._serialized_start=1216
-  _globals['_PAYMENTGATEWAY']._serialized_end=2183
+  _globals['_REGISTERBANKRESPONSE']._serialized_end=703
+  _globals['_BANKHEARTBEATREQUEST']._serialized_start=705
+  _globals['_BANKHEARTBEATREQUEST']._serialized_end=753
+  _globals['_BANKHEARTBEATRESPONSE']._serialized_start=755
+  _globals['_BANKHEARTBEATRESPONSE']._serialized_end=827
+  _globals['_CHECKBALANCEREQUEST']._serialized_start=829
+  _globals['_CHECKBALANCEREQUEST']._serialized_end=850
+  _globals['_CHECKBALANCERESPONSE']._serialized_start=852
+  _globals['_CHECKBALANCERESPONSE']._serialized_end=923
+  _globals['_ADDBALANCEREQUEST']._serialized_start=925
+  _globals['_ADDBALANCEREQUEST']._serialized_end=978
+  _globals['_ADDBALANCERESPONSE']._serialized_start=980
+  _globals['_ADDBALANCERESPONSE']._serialized_end=1032
+  _globals['_TRANSFERAMOUNTREQUEST']._serialized_start=1035
+  _globals['_TRANSFERAMOUNTREQUEST']._serialized_end=1191
+  _globals['_TRANSFERAMOUNTRESPONSE']._serialized_start=1193
+  _globals['_TRANSFERAMOUNTRESPONSE']._serialized_end=1266
+  _globals['_TRANSACTIONHISTORYREQUEST']._serialized_start=1268
+  _globals['_TRANSACTIONHISTORYREQUEST']._serialized_end=1295
+  _globals['_TRANSACTIONHISTORYRESPONSE']._serialized_start=1297
+  _globals['_TRANSACTIONHISTORYRESPONSE']._serialized_end=1379
+  _globals['_TRANSACTIONHISTORYPAGEREQUEST']._serialized_start=1381
+  _globals['_TRANSACTIONHISTORYPAGEREQUEST']._serialized_end=1447
+  _globals['_TRANSACTIONHISTORYPAGE']._serialized_start=1449
+  _globals['_TRANSACTIONHISTORYPAGE']._serialized_end=1566
+  _globals['_TRANSFERLEG']._serialized_start=1568
+  _globals['_TRANSFERLEG']._serialized_end=1675
+  _globals['_BULKTRANSFERREQUEST']._serialized_start=1677
+  _globals['_BULKTRANSFERREQUEST']._serialized_end=1766
+  _globals['_TRANSFERLEGRESULT']._serialized_start=1768
+  _globals['_TRANSFERLEGRESULT']._serialized_end=1834
+  _globals['_BULKTRANSFERRESPONSE']._serialized_start=1837
+  _globals['_BULKTRANSFERRESPONSE']._serialized_end=2034
+  _globals['_PAYMENTGATEWAY']._serialized_start=2037
+  _globals['_PAYMENTGATEWAY']._serialized_end=3306
 # @@protoc_insertion_point(module_scope)
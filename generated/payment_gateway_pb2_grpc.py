@@ -49,6 +49,11 @@ class PaymentGatewayStub(object):
                 request_serializer=payment__gateway__pb2.RegisterBankRequest.SerializeToString,
                 response_deserializer=payment__gateway__pb2.RegisterBankResponse.FromString,
                 _registered_method=True)
+        self.BankHeartbeat = channel.unary_unary(
+                '/paymentgateway.PaymentGateway/BankHeartbeat',
+                request_serializer=payment__gateway__pb2.BankHeartbeatRequest.SerializeToString,
+                response_deserializer=payment__gateway__pb2.BankHeartbeatResponse.FromString,
+                _registered_method=True)
         self.CheckBalance = channel.unary_unary(
                 '/paymentgateway.PaymentGateway/CheckBalance',
                 request_serializer=payment__gateway__pb2.CheckBalanceRequest.SerializeToString,
@@ -84,6 +89,16 @@ class PaymentGatewayStub(object):
                 request_serializer=payment__gateway__pb2.TransactionHistoryRequest.SerializeToString,
                 response_deserializer=payment__gateway__pb2.TransactionHistoryResponse.FromString,
                 _registered_method=True)
+        self.StreamTransactionHistory = channel.unary_stream(
+                '/paymentgateway.PaymentGateway/StreamTransactionHistory',
+                request_serializer=payment__gateway__pb2.TransactionHistoryPageRequest.SerializeToString,
+                response_deserializer=payment__gateway__pb2.TransactionHistoryPage.FromString,
+                _registered_method=True)
+        self.BulkTransfer = channel.unary_unary(
+                '/paymentgateway.PaymentGateway/BulkTransfer',
+                request_serializer=payment__gateway__pb2.BulkTransferRequest.SerializeToString,
+                response_deserializer=payment__gateway__pb2.BulkTransferResponse.FromString,
+                _registered_method=True)
 
 
 class PaymentGatewayServicer(object):
@@ -107,6 +122,12 @@ class PaymentGatewayServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BankHeartbeat(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def CheckBalance(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -149,6 +170,18 @@ class PaymentGatewayServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamTransactionHistory(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BulkTransfer(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PaymentGatewayServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -167,6 +200,11 @@ def add_PaymentGatewayServicer_to_server(servicer, server):
                     request_deserializer=payment__gateway__pb2.RegisterBankRequest.FromString,
                     response_serializer=payment__gateway__pb2.RegisterBankResponse.SerializeToString,
             ),
+            'BankHeartbeat': grpc.unary_unary_rpc_method_handler(
+                    servicer.BankHeartbeat,
+                    request_deserializer=payment__gateway__pb2.BankHeartbeatRequest.FromString,
+                    response_serializer=payment__gateway__pb2.BankHeartbeatResponse.SerializeToString,
+            ),
             'CheckBalance': grpc.unary_unary_rpc_method_handler(
                     servicer.CheckBalance,
                     request_deserializer=payment__gateway__pb2.CheckBalanceRequest.FromString,
@@ -202,6 +240,16 @@ def add_PaymentGatewayServicer_to_server(servicer, server):
                     request_deserializer=payment__gateway__pb2.TransactionHistoryRequest.FromString,
                     response_serializer=payment__gateway__pb2.TransactionHistoryResponse.SerializeToString,
             ),
+            'StreamTransactionHistory': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamTransactionHistory,
+                    request_deserializer=payment__gateway__pb2.TransactionHistoryPageRequest.FromString,
+                    response_serializer=payment__gateway__pb2.TransactionHistoryPage.SerializeToString,
+            ),
+            'BulkTransfer': grpc.unary_unary_rpc_method_handler(
+                    servicer.BulkTransfer,
+                    request_deserializer=payment__gateway__pb2.BulkTransferRequest.FromString,
+                    response_serializer=payment__gateway__pb2.BulkTransferResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'paymentgateway.PaymentGateway', rpc_method_handlers)
@@ -294,6 +342,33 @@ class PaymentGateway(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def BankHeartbeat(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/paymentgateway.PaymentGateway/BankHeartbeat',
+            payment__gateway__pb2.BankHeartbeatRequest.SerializeToString,
+            payment__gateway__pb2.BankHeartbeatResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def CheckBalance(request,
             target,
@@ -482,3 +557,57 @@ class PaymentGateway(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StreamTransactionHistory(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/paymentgateway.PaymentGateway/StreamTransactionHistory',
+            payment__gateway__pb2.TransactionHistoryPageRequest.SerializeToString,
+            payment__gateway__pb2.TransactionHistoryPage.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BulkTransfer(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/paymentgateway.PaymentGateway/BulkTransfer',
+            payment__gateway__pb2.BulkTransferRequest.SerializeToString,
+            payment__gateway__pb2.BulkTransferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,312 @@
+import math
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from loguru import logger
+
+ADMISSION_CONTROL_MODES = ["adaptive", "fixed", "off"]
+DEFAULT_MAX_WORKERS = 10
+DEFAULT_MAX_CONCURRENT_RPCS = 100
+# Lower bound of the adaptive limit when there is no thread pool to size it by
+DEFAULT_MIN_LIMIT = 8
+ADMISSION_STATS_INTERVAL_S = 10
+# Samples averaged by the short and long term latency estimates
+SHORT_LATENCY_WINDOW = 10
+LONG_LATENCY_WINDOW = 600
+# How much slower than the long term latency requests may get before the limit shrinks
+LATENCY_TOLERANCE = 1.5
+LIMIT_SMOOTHING = 0.2
+
+OVERLOADED_MESSAGE = "Server overloaded, try again later"
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Concurrency limit driven by latency, after the gradient limiters of
+    Netflix's concurrency-limits library.
+
+    A slow moving average of latency stands for the latency without
+    queueing. When the recent average rises above it (by more than
+    LATENCY_TOLERANCE) the limit shrinks in proportion; otherwise it grows
+    by about sqrt(limit) per sample, which leaves room for a small queue.
+    """
+    def __init__(self, initial_limit, min_limit, max_limit):
+        self.lock = threading.Lock()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.short_latency = None
+        self.long_latency = None
+
+    def get(self):
+        return int(self.limit)
+
+    def update(self, latency, in_flight):
+        with self.lock:
+            if self.long_latency is None:
+                self.short_latency = self.long_latency = latency
+                return
+            self.short_latency += (latency - self.short_latency) * 2 / (SHORT_LATENCY_WINDOW + 1)
+            self.long_latency += (latency - self.long_latency) * 2 / (LONG_LATENCY_WINDOW + 1)
+            # Once load drops, let the baseline follow the lower latency quickly
+            if self.long_latency > 2 * self.short_latency:
+                self.long_latency *= 0.95
+
+            # Latency says nothing about a limit that isn't being used
+            if in_flight < self.limit / 2:
+                return
+            gradient = max(0.5, min(1.0, LATENCY_TOLERANCE * self.long_latency / self.short_latency))
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            new_limit = self.limit * (1 - LIMIT_SMOOTHING) + new_limit * LIMIT_SMOOTHING
+            self.limit = min(max(new_limit, self.min_limit), self.max_limit)
+
+
+class CountingThreadPoolExecutor(futures.ThreadPoolExecutor):
+    """
+    Thread pool that knows how many submitted calls wait for a thread and
+    how many are running. gRPC submits every accepted RPC, including ones
+    cancelled while queued, so the counts can't drift.
+
+    Rejected RPCs skip the queue: the admission interceptor calls
+    submitNextAsRejection() and the server submits that RPC right after,
+    on the same thread, so it goes to a separate single-thread pool.
+    """
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers)
+        self.count_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.rejection_executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="rejections")
+        self.submitting = threading.local()
+
+    def submitNextAsRejection(self):
+        self.submitting.rejection = True
+
+    def submit(self, fn, /, *args, **kwargs):
+        if getattr(self.submitting, "rejection", False):
+            self.submitting.rejection = False
+            return self.rejection_executor.submit(fn, *args, **kwargs)
+
+        with self.count_lock:
+            self.queued += 1
+        try:
+            return super().submit(self._run, fn, args, kwargs)
+        except BaseException:
+            with self.count_lock:
+                self.queued -= 1
+            raise
+
+    def _run(self, fn, args, kwargs):
+        with self.count_lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.count_lock:
+                self.running -= 1
+
+
+class AdmissionController:
+    """
+    Decides whether an arriving RPC is served or rejected right away with
+    RESOURCE_EXHAUSTED, so that queues stay short under bursts instead of
+    every caller's latency growing without bound.
+
+    With a CountingThreadPoolExecutor the load is every RPC queued for or
+    running on the pool; without one (grpc.aio) it is the RPCs running.
+    In "adaptive" mode the limit follows observed latency, in "fixed" mode
+    it stays at max_concurrent_rpcs and "off" only keeps the statistics.
+    """
+    def __init__(self, name, mode="adaptive", max_concurrent_rpcs=DEFAULT_MAX_CONCURRENT_RPCS, min_limit=DEFAULT_MIN_LIMIT, executor=None):
+        if mode not in ADMISSION_CONTROL_MODES:
+            raise ValueError(f"Unknown admission control mode: {mode}")
+        self.name = name
+        self.mode = mode
+        self.executor = executor
+        min_limit = min(min_limit, max_concurrent_rpcs)
+        if mode == "adaptive":
+            self.limiter = AdaptiveConcurrencyLimit(2 * min_limit, min_limit, max_concurrent_rpcs)
+        else:
+            self.limiter = AdaptiveConcurrencyLimit(max_concurrent_rpcs, max_concurrent_rpcs, max_concurrent_rpcs)
+
+        self.lock = threading.Lock()
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.reporter = threading.Thread(target=self._reportLoop, name=f"{name}-admission-stats", daemon=True)
+        self.reporter.start()
+
+    def inFlight(self):
+        if self.executor is not None:
+            return self.executor.queued + self.executor.running
+        return self.running
+
+    def queueDepth(self):
+        return self.executor.queued if self.executor is not None else 0
+
+    def tryAdmit(self):
+        with self.lock:
+            if self.mode != "off" and self.inFlight() >= self.limiter.get():
+                self.rejected += 1
+                return False
+            self.admitted += 1
+            return True
+
+    def hardLimit(self):
+        # For grpc's maximum_concurrent_rpcs: a backstop above the admission
+        # limit, leaving room for rejected RPCs on their way out and for
+        # bursts that arrive before any of them starts running (grpc.aio)
+        if self.mode == "off":
+            return None
+        return 2 * self.limiter.max_limit
+
+    def onStart(self):
+        # Only needed without an executor, which counts by itself
+        with self.lock:
+            self.running += 1
+
+    def onDone(self, latency=None):
+        if self.executor is None:
+            with self.lock:
+                self.running -= 1
+        if latency is not None and self.mode == "adaptive":
+            self.limiter.update(latency, self.inFlight())
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "limit": self.limiter.get(),
+                "in_flight": self.inFlight(),
+                "queue_depth": self.queueDepth(),
+                "admitted": self.admitted,
+                "rejected": self.rejected
+            }
+
+    def _reportLoop(self):
+        last_admitted = 0
+        last_rejected = 0
+        while True:
+            time.sleep(ADMISSION_STATS_INTERVAL_S)
+            stats = self.getStats()
+            if stats["admitted"] == last_admitted and stats["rejected"] == last_rejected:
+                continue
+            logger.info(f"{self.name} admission: limit = {stats['limit']}, in flight = {stats['in_flight']}, "
+                        f"queue depth = {stats['queue_depth']}, admitted = {stats['admitted'] - last_admitted}, "
+                        f"rejected = {stats['rejected'] - last_rejected} in the last {ADMISSION_STATS_INTERVAL_S}s")
+            last_admitted = stats["admitted"]
+            last_rejected = stats["rejected"]
+
+
+def _rejectUnary(request, context):
+    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, OVERLOADED_MESSAGE)
+
+
+def _rejectStream(request, context):
+    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, OVERLOADED_MESSAGE)
+    yield
+
+
+async def _rejectUnaryAsync(request, context):
+    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, OVERLOADED_MESSAGE)
+
+
+async def _rejectStreamAsync(request, context):
+    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, OVERLOADED_MESSAGE)
+    yield
+
+
+class AdmissionControlInterceptor(grpc.ServerInterceptor):
+    # Runs on the server's polling thread as an RPC arrives, before it is
+    # queued for the thread pool. Should be the first interceptor so that
+    # rejected RPCs cost as little as possible
+    def __init__(self, controller):
+        self.controller = controller
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        # The request isn't even deserialized when rejecting
+        if not self.controller.tryAdmit():
+            if self.controller.executor is not None:
+                self.controller.executor.submitNextAsRejection()
+            if handler.unary_stream is not None:
+                return grpc.unary_stream_rpc_method_handler(_rejectStream)
+            return grpc.unary_unary_rpc_method_handler(_rejectUnary)
+
+        # Streams are admitted but not timed; their duration isn't a sign of load
+        if handler.unary_unary is None:
+            return handler
+
+        arrival_time = time.monotonic()
+        behavior = handler.unary_unary
+        controller = self.controller
+
+        def timed_handler(request, servicer_context):
+            try:
+                return behavior(request, servicer_context)
+            finally:
+                controller.onDone(time.monotonic() - arrival_time)
+
+        return grpc.unary_unary_rpc_method_handler(
+            timed_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+
+class AsyncAdmissionControlInterceptor(grpc.aio.ServerInterceptor):
+    # AdmissionControlInterceptor for grpc.aio servers, which have no queue:
+    # the load is the number of RPCs running on the event loop
+    def __init__(self, controller):
+        self.controller = controller
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        if not self.controller.tryAdmit():
+            if handler.unary_stream is not None:
+                return grpc.unary_stream_rpc_method_handler(_rejectStreamAsync)
+            return grpc.unary_unary_rpc_method_handler(_rejectUnaryAsync)
+
+        arrival_time = time.monotonic()
+        controller = self.controller
+        if handler.unary_unary is not None:
+            behavior = handler.unary_unary
+
+            async def timed_handler(request, servicer_context):
+                controller.onStart()
+                try:
+                    return await behavior(request, servicer_context)
+                finally:
+                    controller.onDone(time.monotonic() - arrival_time)
+
+            return grpc.unary_unary_rpc_method_handler(
+                timed_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        if handler.unary_stream is not None:
+            behavior = handler.unary_stream
+
+            async def counted_stream_handler(request, servicer_context):
+                controller.onStart()
+                try:
+                    async for response in behavior(request, servicer_context):
+                        yield response
+                finally:
+                    controller.onDone()
+
+            return grpc.unary_stream_rpc_method_handler(
+                counted_stream_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+        return handler
@@ -5,11 +5,48 @@ import argparse
 import grpc
 import sys
 import datetime
-import requests
 import logging
+import threading
+import json
+import struct
+import time
+import zlib
+import mmap
+import gc
+import importlib
+from array import array
+from collections import OrderedDict
+import asyncio
+import heapq
+import multiprocessing
+import signal
+import atexit
+import socket
+import random
+import math
+import contextlib
+from multiprocessing import shared_memory
 
 from pathlib import Path
 
+class LazyModule:
+    """
+    Stands in for a module that is only imported when one of its
+    attributes is first used, so importing it doesn't delay startup.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            # import_module is thread-safe; the module is only executed once
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+# Only needed once there are transactions or shared state; preloaded after the port serves
+np = LazyModule("numpy")
+
 RED = '\033[0;31m'
 GREEN = '\033[0;32m'
 RESET = '\033[0m'
@@ -20,45 +57,1149 @@ script_dir = Path(__file__).parent
 sys.path.append("generated")
 import bank_pb2
 import bank_pb2_grpc as bank_grpc
-import payment_gateway_pb2
-import payment_gateway_pb2_grpc as payment_gateway_grpc
+from admission_control import (ADMISSION_CONTROL_MODES, DEFAULT_MAX_CONCURRENT_RPCS, DEFAULT_MAX_WORKERS, AdmissionController,
+                               AdmissionControlInterceptor, AsyncAdmissionControlInterceptor, CountingThreadPoolExecutor)
+from log_pipeline import (DEFAULT_LOG_BACKUPS, DEFAULT_LOG_MAX_BYTES, DEFAULT_LOG_QUEUE_SIZE, LogPipeline, unsampledHandler,
+                          unsampledHandlerAsync)
+from idempotency import (DEFAULT_IDEMPOTENCY_MAX_ENTRIES, DEFAULT_IDEMPOTENCY_TTL_S, IDEMPOTENCY_KEY_REUSED, IdempotencyCache,
+                         keyHash, requestFingerprint)
+
+DATA_DIR = script_dir / "data"
+# Registration with the gateway is retried in the background until it succeeds
+REGISTRATION_TIMEOUT_S = 2
+REGISTRATION_INITIAL_BACKOFF_S = 0.5
+REGISTRATION_MAX_BACKOFF_S = 30
+# The gateway's lease is renewed this many times per lease period, so one lost heartbeat doesn't expire it
+HEARTBEATS_PER_LEASE = 3
+# The gateway keeps one channel open to the bank and sends keepalive pings on it
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 5000)
+]
+ACCOUNT_NUMBER_BLOCK_SIZE = 1000
+NUM_ACCOUNT_LOCK_STRIPES = 256
+
+WAL_DURABILITY_MODES = ["fsync", "fdatasync", "os-buffered"]
+WAL_DEFAULT_COMMIT_WINDOW_MS = 2
+WAL_STATS_INTERVAL_S = 10
+# Every log record is framed as (lsn, payload length, crc32 of payload) + payload
+WAL_RECORD_HEADER = struct.Struct("<QII")
+
+SNAPSHOT_DEFAULT_INTERVAL_S = 300
+SNAPSHOT_MAGIC = b"BANKSNP4"
+# Snapshot layout: header, then per account a fixed-size entry followed by
+# its username, password and statement columns, then the counterparty
+# table, the reservation table and the live idempotency keys
+SNAPSHOT_HEADER = struct.Struct("<8sQQ")       # magic, snapshot lsn, number of accounts
+SNAPSHOT_ACCOUNT = struct.Struct("<QdQIII")    # account number, balance, last lsn, username length, password length, number of statements
+SNAPSHOT_COUNT = struct.Struct("<Q")           # number of counterparties, reservations or idempotency keys
+SNAPSHOT_COUNTERPARTY = struct.Struct("<iII")  # bank id, username length, account number length
+SNAPSHOT_RESERVATION = struct.Struct("<QqdiBQ") # transfer id hash, account number, amount, counterparty id, state, lsn
+SNAPSHOT_IDEMPOTENCY = struct.Struct("<QdQBdQ")  # key hash, Unix expiry time, fingerprint, err_code, balance, lsn
+
+# Kinds of statement entries; an entry stores the index into this list
+TRANSACTION_TYPES = ["deposit", "withdraw", "transfer_in", "transfer_out", "reimbursement", "bulk_transfer_out"]
+TRANSACTION_TYPE_CODES = {transaction_type: code for code, transaction_type in enumerate(TRANSACTION_TYPES)}
+TRANSACTION_FORMATS = [
+    GREEN + "{time} : {amount} deposited in account" + RESET,
+    RED + "{time} : {amount} withdrawn in account" + RESET,
+    GREEN + "{time} : {amount} credited from {username} | Bank id: {bank_id} | Acc No: {acc_no}" + RESET,
+    RED + "{time} : {amount} debited to {username} | Bank id: {bank_id} | Acc No: {acc_no}" + RESET,
+    GREEN + "{time} : {amount} recredited in account" + RESET,
+    RED + "{time} : {amount} debited for bulk transfer" + RESET
+]
+NO_COUNTERPARTY = -1
+
+# Transaction types that bring money into an account, indexed by type code
+INCOMING_TRANSACTION_TYPES = [transaction_type in ("deposit", "transfer_in", "reimbursement") for transaction_type in TRANSACTION_TYPES]
+LEDGER_CHUNK_ROWS = 1 << 20
+SECONDS_PER_DAY = 86400
+
+# Response text of Credit and Debit by err_code, for replaying cached results
+CREDIT_RESULT_TEXTS = ["Amount Credited", "Invalid amount"]
+DEBIT_RESULT_TEXTS = ["Amount Debited", "Not enough balance in account"]
+TRANSFER_RESULT_TEXTS = ["Amount Transferred", "Not enough balance in account"]
+RESERVE_RESULT_TEXTS = ["Amount Reserved", "Not enough balance in account"]
+RESERVATION_COMMITTED_TEXT = "Transfer committed"
+RESERVATION_ABORTED_TEXT = "Transfer aborted"
+NO_SUCH_RESERVATION_TEXT = "No such reservation"
+RESERVATION_TABLE_FULL_TEXT = "Too many transfers in progress"
+
+# States of a reservation made by Reserve
+RESERVATION_HELD = 0
+RESERVATION_COMMITTED = 1
+RESERVATION_ABORTED = 2
+# Kept by the receiver's bank for a transfer it credited, so that the credit is never repeated
+RESERVATION_CREDITED = 3
+# Account of an abort that arrived before its Reserve, which then refuses it
+NO_ACCOUNT = -1
+
+DEFAULT_TRANSACTIONS_PAGE_SIZE = 100
+MAX_TRANSACTIONS_PAGE_SIZE = 1000
+
+# Multi-process mode (--workers): capacities and field widths of the shared tables.
+# The tables get room for at least twice what the bank holds at startup; with
+# these defaults an empty bank needs about 42 MB, which fits Docker's 64 MB /dev/shm
+SHARED_DEFAULT_MAX_ACCOUNTS = 1 << 14
+SHARED_DEFAULT_MAX_TRANSACTIONS = 1 << 19
+SHARED_MEMORY_DIR = Path("/dev/shm")
+SHARED_USERNAME_BYTES = 64
+SHARED_PASSWORD_BYTES = 128
+SHARED_ACC_NO_BYTES = 32
+# Slots probed when looking up an idempotency key in the shared table
+SHARED_IDEMPOTENCY_PROBE_LENGTH = 8
+# Counters kept at the start of the shared block
+SHARED_HEADER_FIELDS = [
+    "num_accounts",
+    "num_counterparties",
+    "num_transactions",
+    "next_account_number",
+    "account_block_end",
+    "wal_next_lsn",
+    "wal_written_lsn",
+    "wal_durable_lsn",
+    "wal_segment_lsn",
+    "wal_syncing",
+    "wal_commits",
+    "wal_records",
+    "wal_failed"
+]
+
+
+class AccountNumberAllocator:
+    """
+    Hands out monotonically increasing account numbers.
+
+    Numbers are leased from disk in blocks: the end of the current block is
+    persisted before any number from it is handed out, so after a restart
+    allocation resumes past everything that may already have been used.
+    Unused numbers of a lease are skipped, never reused.
+    """
+    def __init__(self, path, block_size=ACCOUNT_NUMBER_BLOCK_SIZE):
+        self.path = Path(path)
+        self.block_size = block_size
+        self.lock = threading.Lock()
+
+        self.next_number = 1
+        if self.path.exists():
+            self.next_number = int(self.path.read_text().strip() or 1)
+        self.block_end = self.next_number
+
+    def _leaseUpTo(self, block_end):
+        # Persist the new high-water mark atomically before using it
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(block_end))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.block_end = block_end
+
+    def allocate(self):
+        with self.lock:
+            if self.next_number >= self.block_end:
+                self._leaseUpTo(self.next_number + self.block_size)
+            account_number = self.next_number
+            self.next_number += 1
+            return account_number
+
+
+class StripedLocks:
+    """
+    Fixed table of locks shared by all accounts.
+
+    An account maps to a stripe by its account number, so operations on
+    different accounts mostly run in parallel while operations on the same
+    account are serialized. Stripes are re-entrant so a servicer can hold an
+    account's lock around calls to Client methods that take it again.
+    """
+    def __init__(self, num_stripes=NUM_ACCOUNT_LOCK_STRIPES, lock_factory=threading.RLock):
+        self.stripes = [lock_factory() for _ in range(num_stripes)]
+
+    def stripeIndex(self, account_number):
+        return int(account_number) % len(self.stripes)
+
+    def lockFor(self, account_number):
+        return self.stripes[self.stripeIndex(account_number)]
+
+    def locksFor(self, *account_numbers):
+        # Locks for several accounts, in a global order so that callers
+        # acquiring them one after the other can't deadlock
+        indices = sorted({self.stripeIndex(account_number) for account_number in account_numbers})
+        return [self.stripes[index] for index in indices]
+
+
+def _resolveFuture(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _failFuture(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+
+class WriteAheadLogFailed(Exception):
+    # A write or sync of the log failed; the bank accepts no more changes
+    pass
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the operations that change bank state.
+
+    Request threads append records and then wait until they are durable.
+    A single background thread writes out everything appended during a
+    commit window and syncs it once (group commit), so the cost of a sync
+    is shared by all the RPCs in that batch.
+
+    The log is split into segments named after the first LSN they hold,
+    so segments fully covered by a snapshot can simply be deleted.
+
+    If a write or sync fails (disk full, I/O error) the flusher stops, as
+    nothing is known about what reached the disk. Every waiter, and every
+    later append, then raises WriteAheadLogFailed.
+    """
+    def __init__(self, directory, name, durability="fsync", commit_window_ms=WAL_DEFAULT_COMMIT_WINDOW_MS):
+        if durability not in WAL_DURABILITY_MODES:
+            raise ValueError(f"Unknown WAL durability mode: {durability}")
+        self.directory = Path(directory)
+        self.name = name
+        self.durability = durability
+        self.commit_window_s = commit_window_ms / 1000
+
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.flushed = threading.Condition(self.lock)
+        self.pending = []
+        self.next_lsn = 1
+        self.durable_lsn = 0
+        self.closed = False
+        self.error = None
+        # (lsn, sequence, future, event loop) of coroutines awaiting durability
+        self.async_waiters = []
+        self.async_waiter_sequence = 0
+
+        # Held by the flusher while writing so segments can be rotated safely
+        self.file_lock = threading.Lock()
+        self.file = None
+        self.written_lsn = 0
+        self.flusher = None
+
+        # Counters for reporting commit throughput
+        self.commits = 0
+        self.records_committed = 0
+
+    def _segmentPath(self, first_lsn):
+        return self.directory / f"{self.name}.{first_lsn:020d}.wal"
+
+    def _segments(self):
+        # (first lsn, path) of every segment, oldest first
+        segments = []
+        for path in self.directory.glob(f"{self.name}.*.wal"):
+            first_lsn = path.name[len(self.name) + 1:-len(".wal")]
+            if first_lsn.isdigit():
+                segments.append((int(first_lsn), path))
+        return sorted(segments)
+
+    def readRecords(self, after_lsn=0):
+        """
+        Yields (lsn, record) for every intact record with lsn > after_lsn.
+        A torn record at the end of a segment (crash in the middle of a
+        write) is cut off. Must be consumed fully before calling open().
+        """
+        segments = self._segments()
+        for index, (first_lsn, path) in enumerate(segments):
+            # Skip segments that end before after_lsn without reading them
+            if index + 1 < len(segments) and segments[index + 1][0] <= after_lsn + 1:
+                continue
+
+            valid_end = 0
+            with open(path, "rb") as f:
+                while True:
+                    header = f.read(WAL_RECORD_HEADER.size)
+                    if len(header) < WAL_RECORD_HEADER.size:
+                        break
+                    lsn, length, checksum = WAL_RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != checksum:
+                        break
+                    valid_end = f.tell()
+                    self.next_lsn = max(self.next_lsn, lsn + 1)
+                    if lsn > after_lsn:
+                        yield lsn, json.loads(payload)
+
+            if valid_end < path.stat().st_size:
+                logger.warning(f"Discarding torn tail of {path.name} after byte {valid_end}")
+                os.truncate(path, valid_end)
+
+        self.next_lsn = max(self.next_lsn, after_lsn + 1)
+        self.durable_lsn = self.written_lsn = self.next_lsn - 1
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.file = open(self._segmentPath(self.next_lsn), "ab")
+        self.flusher = threading.Thread(target=self._flushLoop, name="wal-flusher", daemon=True)
+        self.flusher.start()
+
+    def rotate(self):
+        # Starts a new segment; everything written so far stays in closed segments
+        with self.file_lock:
+            if self.file.tell() == 0:
+                return
+            self.file.close()
+            self.file = open(self._segmentPath(self.written_lsn + 1), "ab")
+
+    def truncateUpTo(self, lsn):
+        # Deletes closed segments holding only records with lsn <= the given one
+        with self.file_lock:
+            segments = self._segments()
+            for (_, path), (next_first_lsn, _) in zip(segments, segments[1:]):
+                if next_first_lsn - 1 <= lsn and path.name != Path(self.file.name).name:
+                    path.unlink()
+
+    def append(self, record):
+        """Queues a record and returns its LSN; the record is not durable until waitDurable(lsn) returns."""
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        with self.lock:
+            self._raiseIfFailed()
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.pending.append(WAL_RECORD_HEADER.pack(lsn, len(payload), zlib.crc32(payload)) + payload)
+            self.work_available.notify()
+        return lsn
+
+    def lastAssignedLsn(self):
+        with self.lock:
+            return self.next_lsn - 1
+
+    def _raiseIfFailed(self):
+        # Callers must hold self.lock
+        if self.error is not None:
+            raise WriteAheadLogFailed(f"Write-ahead log failed: {self.error}")
+
+    def waitDurable(self, lsn):
+        with self.lock:
+            while self.durable_lsn < lsn:
+                self._raiseIfFailed()
+                self.flushed.wait()
+
+    async def waitDurableAsync(self, lsn):
+        # Event loop friendly waitDurable: the flusher resolves the future
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.durable_lsn >= lsn:
+                return
+            self._raiseIfFailed()
+            future = loop.create_future()
+            self.async_waiter_sequence += 1
+            heapq.heappush(self.async_waiters, (lsn, self.async_waiter_sequence, future, loop))
+        await future
+
+    def _wakeAsyncWaiters(self):
+        # Callers must hold self.lock
+        while self.async_waiters and self.async_waiters[0][0] <= self.durable_lsn:
+            _, _, future, loop = heapq.heappop(self.async_waiters)
+            loop.call_soon_threadsafe(_resolveFuture, future)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "commits": self.commits,
+                "records": self.records_committed,
+                "durable_lsn": self.durable_lsn
+            }
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.work_available.notify()
+        if self.flusher is not None:
+            self.flusher.join()
+        with self.lock:
+            # Nothing more will be flushed; do not leave coroutines hanging
+            while self.async_waiters:
+                _, _, future, loop = heapq.heappop(self.async_waiters)
+                loop.call_soon_threadsafe(_resolveFuture, future)
+        if self.file is not None:
+            self.file.close()
+
+    def _sync(self):
+        self.file.flush()
+        if self.durability == "fsync":
+            os.fsync(self.file.fileno())
+        elif self.durability == "fdatasync":
+            getattr(os, "fdatasync", os.fsync)(self.file.fileno())
+
+    def _flushLoop(self):
+        last_report_time = time.monotonic()
+        last_report_commits = 0
+        last_report_records = 0
+
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.work_available.wait()
+                if self.closed and not self.pending:
+                    return
+
+            # Let concurrent RPCs join this batch
+            if self.commit_window_s > 0:
+                time.sleep(self.commit_window_s)
+
+            with self.lock:
+                batch = self.pending
+                self.pending = []
+                batch_lsn = self.next_lsn - 1
+
+            try:
+                with self.file_lock:
+                    self.file.write(b"".join(batch))
+                    self._sync()
+                    self.written_lsn = batch_lsn
+            except OSError as e:
+                logger.critical(f"Could not write the write-ahead log, no longer accepting changes: {e}")
+                with self.lock:
+                    self.error = e
+                    self.flushed.notify_all()
+                    error = WriteAheadLogFailed(f"Write-ahead log failed: {e}")
+                    while self.async_waiters:
+                        _, _, future, loop = heapq.heappop(self.async_waiters)
+                        loop.call_soon_threadsafe(_failFuture, future, error)
+                return
+
+            with self.lock:
+                self.durable_lsn = batch_lsn
+                self.commits += 1
+                self.records_committed += len(batch)
+                self.flushed.notify_all()
+                self._wakeAsyncWaiters()
+
+            now = time.monotonic()
+            if now - last_report_time >= WAL_STATS_INTERVAL_S:
+                elapsed = now - last_report_time
+                logger.info(f"WAL: {(self.commits - last_report_commits) / elapsed:.1f} commits/s, "
+                            f"{(self.records_committed - last_report_records) / elapsed:.1f} records/s")
+                last_report_time = now
+                last_report_commits = self.commits
+                last_report_records = self.records_committed
+
+
+class CounterpartyTable:
+    """
+    Interns (username, bank id, account number) of transfer counterparties,
+    so statement entries only store a small integer per transaction.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.entries = []
+
+    def intern(self, username, bank_id, acc_no):
+        key = (username, bank_id, acc_no)
+        counterparty_id = self.ids.get(key)
+        if counterparty_id is None:
+            with self.lock:
+                counterparty_id = self.ids.get(key)
+                if counterparty_id is None:
+                    counterparty_id = len(self.entries)
+                    self.entries.append(key)
+                    self.ids[key] = counterparty_id
+        return counterparty_id
+
+    def get(self, counterparty_id):
+        return self.entries[counterparty_id]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ReservationTableFull(Exception):
+    pass
+
+
+class ReservationTable:
+    """
+    Funds held by Reserve for transfers to other banks, by the 64-bit hash
+    of the transfer id. Values are (account number, amount, counterparty
+    id, state, lsn). Held entries stay until they are committed or aborted.
+    Settled entries are kept for ttl_s seconds, so that a retried commit or
+    abort, or a Reserve arriving after its abort, gets the same answer, and
+    are then dropped oldest first. The receiving bank of a transfer keeps a
+    RESERVATION_CREDITED entry under creditKeyHash() the same way.
+    """
+    def __init__(self, ttl_s=DEFAULT_IDEMPOTENCY_TTL_S):
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.settled = OrderedDict()    # key hash -> expiry time, in settle order
+
+    def _evictExpired(self, now):
+        while self.settled:
+            key_hash, expiry = next(iter(self.settled.items()))
+            if expiry > now:
+                break
+            del self.settled[key_hash]
+            del self.entries[key_hash]
+
+    def get(self, key_hash):
+        with self.lock:
+            return self.entries.get(key_hash)
+
+    def insertIfAbsent(self, key_hash, value):
+        # Returns the existing value, or None once value is inserted
+        with self.lock:
+            self._evictExpired(time.monotonic())
+            existing = self.entries.get(key_hash)
+            if existing is None:
+                self._put(key_hash, value)
+            return existing
+
+    def put(self, key_hash, value):
+        with self.lock:
+            self._put(key_hash, value)
+
+    def _put(self, key_hash, value):
+        self.entries[key_hash] = value
+        self.settled.pop(key_hash, None)
+        if value[3] != RESERVATION_HELD:
+            self.settled[key_hash] = time.monotonic() + self.ttl_s
+
+    def remove(self, key_hash):
+        with self.lock:
+            self.entries.pop(key_hash, None)
+            self.settled.pop(key_hash, None)
+
+    def items(self):
+        with self.lock:
+            return list(self.entries.items())
+
+
+def creditKeyHash(transfer_id):
+    # Reservation table key of the credit of a transfer at the receiver's bank
+    return keyHash(f"{transfer_id}/credit")
+
+
+def formatTransaction(timestamp, type_code, amount, counterparty_id, counterparties):
+    # Statement text of one entry
+    formatted_time = datetime.datetime.fromtimestamp(timestamp).strftime("%B %d, %Y - %H:%M:%S")
+    username, bank_id, acc_no = None, None, None
+    if counterparty_id != NO_COUNTERPARTY:
+        username, bank_id, acc_no = counterparties.get(counterparty_id)
+    return TRANSACTION_FORMATS[type_code].format(
+        time=formatted_time, amount=amount, username=username, bank_id=bank_id, acc_no=acc_no
+    )
+
+
+class LedgerStatement:
+    """
+    Append-only statement of one account: the numbers of the bank's
+    ColumnarLedger rows holding its entries, in order (8 bytes per entry
+    on top of the ledger row). Entries are only turned into text when they
+    are read.
+    """
+    __slots__ = ("ledger", "account_number", "rows")
+
+    def __init__(self, ledger, account_number):
+        self.ledger = ledger
+        self.account_number = account_number
+        self.rows = array("q")
+
+    def append(self, timestamp, transaction_type, amount, counterparty_id=NO_COUNTERPARTY):
+        self.rows.append(self.ledger.append(timestamp, self.account_number, amount, TRANSACTION_TYPE_CODES[transaction_type], counterparty_id))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def format(self, index, counterparties):
+        return self.ledger.format(self.rows[index], counterparties)
+
+    def columns(self, count):
+        # (timestamps, types, amounts, counterparties) of the first `count` entries
+        return self.ledger.gather(self.rows[:count])
+
+    def columnBytes(self, count):
+        # Raw bytes of the first `count` entries of every column, for snapshots
+        return [column.tobytes() for column in self.columns(count)]
+
+    def loadColumnBytes(self, timestamps, types, amounts, counterparties):
+        accounts = np.full(len(types), self.account_number, dtype=np.int64)
+        first_row = self.ledger.extend(accounts, np.frombuffer(timestamps, dtype=np.float64), np.frombuffer(amounts, dtype=np.float64),
+                                       np.frombuffer(types, dtype=np.uint8), np.frombuffer(counterparties, dtype=np.int32))
+        self.rows.extend(range(first_row, first_row + len(types)))
+
+
+class ColumnarLedger:
+    """
+    Bank-wide transaction store, kept as NumPy columns (timestamp,
+    account, amount, type, counterparty). It is the only copy of the
+    entries: account statements are lists of its rows. Columns grow in
+    fixed-size chunks, so appends never copy existing rows and aggregates
+    are computed chunk by chunk with vectorized operations.
+    """
+    def __init__(self, chunk_rows=LEDGER_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.num_rows = 0
+
+    def _newChunk(self):
+        return {
+            "timestamp": np.empty(self.chunk_rows, dtype=np.float64),
+            "account": np.empty(self.chunk_rows, dtype=np.int64),
+            "amount": np.empty(self.chunk_rows, dtype=np.float64),
+            "type": np.empty(self.chunk_rows, dtype=np.uint8),
+            "counterparty": np.empty(self.chunk_rows, dtype=np.int32)
+        }
+
+    def append(self, timestamp, account_number, amount, type_code, counterparty_id=NO_COUNTERPARTY):
+        # Returns the row written
+        with self.lock:
+            chunk_index, row = divmod(self.num_rows, self.chunk_rows)
+            if chunk_index == len(self.chunks):
+                self.chunks.append(self._newChunk())
+            chunk = self.chunks[chunk_index]
+            chunk["timestamp"][row] = timestamp
+            chunk["account"][row] = account_number
+            chunk["amount"][row] = amount
+            chunk["type"][row] = type_code
+            chunk["counterparty"][row] = counterparty_id
+            self.num_rows += 1
+            return self.num_rows - 1
+
+    def extend(self, accounts, timestamps, amounts, type_codes, counterparty_ids):
+        # Bulk append of rows, given as NumPy arrays; returns the first row written
+        with self.lock:
+            first_row = self.num_rows
+            start = 0
+            while start < len(timestamps):
+                chunk_index, row = divmod(self.num_rows, self.chunk_rows)
+                if chunk_index == len(self.chunks):
+                    self.chunks.append(self._newChunk())
+                chunk = self.chunks[chunk_index]
+                count = min(self.chunk_rows - row, len(timestamps) - start)
+                chunk["timestamp"][row:row + count] = timestamps[start:start + count]
+                chunk["account"][row:row + count] = accounts[start:start + count]
+                chunk["amount"][row:row + count] = amounts[start:start + count]
+                chunk["type"][row:row + count] = type_codes[start:start + count]
+                chunk["counterparty"][row:row + count] = counterparty_ids[start:start + count]
+                self.num_rows += count
+                start += count
+            return first_row
+
+    def format(self, row, counterparties):
+        # Statement text of one row; rows are never modified once written
+        chunk_index, row = divmod(row, self.chunk_rows)
+        chunk = self.chunks[chunk_index]
+        return formatTransaction(float(chunk["timestamp"][row]), int(chunk["type"][row]), float(chunk["amount"][row]),
+                                 int(chunk["counterparty"][row]), counterparties)
+
+    def gather(self, rows):
+        # (timestamps, types, amounts, counterparties) of the given rows, which are in ascending order
+        rows = np.frombuffer(rows, dtype=np.int64)
+        parts = [[], [], [], []]
+        start = 0
+        while start < len(rows):
+            chunk_index = int(rows[start]) // self.chunk_rows
+            chunk_start = chunk_index * self.chunk_rows
+            stop = int(np.searchsorted(rows, chunk_start + self.chunk_rows))
+            chunk = self.chunks[chunk_index]
+            offsets = rows[start:stop] - chunk_start
+            for part, column in zip(parts, ("timestamp", "type", "amount", "counterparty")):
+                part.append(chunk[column][offsets])
+            start = stop
+        dtypes = (np.float64, np.uint8, np.float64, np.int32)
+        return [np.concatenate(part) if part else np.empty(0, dtype=dtype) for part, dtype in zip(parts, dtypes)]
+
+    def _filledChunks(self):
+        # Views over the rows written so far; rows are never modified once written
+        with self.lock:
+            chunks = list(self.chunks)
+            num_rows = self.num_rows
+        for chunk in chunks:
+            rows = min(num_rows, self.chunk_rows)
+            if rows <= 0:
+                break
+            yield {column: values[:rows] for column, values in chunk.items()}
+            num_rows -= rows
+
+    def aggregate(self, account_number=None, start_time=None, end_time=None, top_n=0):
+        """
+        Totals in and out, per-day volume (UTC days) and the top_n largest
+        transactions among rows matching the account and [start_time, end_time).
+        """
+        total_in = 0.0
+        total_out = 0.0
+        count = 0
+        daily = {}
+        largest = []
+
+        for chunk in self._filledChunks():
+            mask = np.ones(len(chunk["timestamp"]), dtype=bool)
+            if account_number is not None:
+                mask &= chunk["account"] == account_number
+            if start_time is not None:
+                mask &= chunk["timestamp"] >= start_time
+            if end_time is not None:
+                mask &= chunk["timestamp"] < end_time
+            if not mask.any():
+                continue
+
+            timestamps = chunk["timestamp"][mask]
+            accounts = chunk["account"][mask]
+            amounts = chunk["amount"][mask]
+            types = chunk["type"][mask]
+            incoming = np.asarray(INCOMING_TRANSACTION_TYPES)[types]
+
+            amounts_in = np.where(incoming, amounts, 0.0)
+            amounts_out = np.where(incoming, 0.0, amounts)
+            total_in += amounts_in.sum()
+            total_out += amounts_out.sum()
+            count += len(amounts)
+
+            days = (timestamps // SECONDS_PER_DAY).astype(np.int64)
+            first_day = int(days.min())
+            day_index = days - first_day
+            day_in = np.bincount(day_index, weights=amounts_in)
+            day_out = np.bincount(day_index, weights=amounts_out)
+            day_count = np.bincount(day_index)
+            for offset in np.flatnonzero(day_count).tolist():
+                day = first_day + offset
+                volume_in, volume_out, num = day_in[offset], day_out[offset], int(day_count[offset])
+                previous = daily.get(day, (0.0, 0.0, 0))
+                daily[day] = (previous[0] + float(volume_in), previous[1] + float(volume_out), previous[2] + num)
+
+            if top_n > 0:
+                # Candidates from this chunk; merged across chunks below
+                if len(amounts) > top_n:
+                    candidates = np.argpartition(amounts, -top_n)[-top_n:]
+                else:
+                    candidates = np.arange(len(amounts))
+                largest.extend(zip(amounts[candidates].tolist(), timestamps[candidates].tolist(),
+                                   accounts[candidates].tolist(), types[candidates].tolist()))
+
+        largest = sorted(largest, reverse=True)[:top_n]
+        return {
+            "total_in": float(total_in),
+            "total_out": float(total_out),
+            "count": count,
+            "daily": sorted((day * SECONDS_PER_DAY, *volumes) for day, volumes in daily.items()),
+            "largest": [(timestamp, account, amount, TRANSACTION_TYPES[type_code]) for amount, timestamp, account, type_code in largest]
+        }
+
 
 class Bank:
-    def __init__(self, port):
+    def __init__(self, port, data_dir=DATA_DIR):
         self.id = -1
         self.port = port
+        self.data_dir = Path(data_dir)
         self.clients = []
+        # Indexes over self.clients so that lookups don't need a linear scan
+        self.clients_by_username = {}
+        self.clients_by_account_number = {}
+        self.lock = threading.Lock()
+        self.account_locks = StripedLocks()
+        self.account_number_allocator = AccountNumberAllocator(Path(data_dir) / f"bank_{port}_account_numbers")
+        self.snapshot_path = Path(data_dir) / f"bank_{port}.snapshot"
+        self.counterparties = CounterpartyTable()
+        self.ledger = ColumnarLedger()
+        self.wal = None
+        # (fingerprint, err_code, balance, lsn) of Credit, Debit and Transfer requests by hash of the idempotency key
+        self.idempotency = IdempotencyCache()
+        self.reservations = ReservationTable()
 
-    def generateUniqueAccountNumber(self):
-        if self.clients == []:
-            max_account_number = 0
+    def setWriteAheadLog(self, wal):
+        self.wal = wal
+
+    def setIdempotencyCache(self, cache):
+        self.idempotency = cache
+
+    def setReservationTable(self, reservations):
+        self.reservations = reservations
+
+    def logOperation(self, record, *clients):
+        # Called with the lock(s) of the affected account(s) held, so the log
+        # order matches the order in which the changes were applied
+        if self.wal is None:
+            return 0
+        lsn = self.wal.append(record)
+        for client in clients:
+            client.last_lsn = lsn
+        return lsn
+
+    def lockAccounts(self, *clients):
+        # Holds the locks of several accounts, taken in a global order
+        stack = contextlib.ExitStack()
+        for lock in self.account_locks.locksFor(*(client.account_number for client in clients)):
+            stack.enter_context(lock)
+        return stack
+
+    def waitDurable(self, lsn):
+        if self.wal is not None and lsn:
+            self.wal.waitDurable(lsn)
+
+    async def waitDurableAsync(self, lsn):
+        if self.wal is not None and lsn:
+            await self.wal.waitDurableAsync(lsn)
+
+    def recover(self):
+        """
+        Rebuilds clients, balances and statements from the latest snapshot
+        plus the part of the log written after it. Returns the number of
+        log records replayed.
+        """
+        snapshot_lsn = 0
+        if self.snapshot_path.exists():
+            snapshot_lsn = self.loadSnapshot(self.snapshot_path)
+
+        if self.wal is None:
+            return 0
+        num_records = 0
+        for lsn, record in self.wal.readRecords(after_lsn=snapshot_lsn):
+            self.applyLogRecord(lsn, record)
+            num_records += 1
+        return num_records
+
+    def applyLogRecord(self, lsn, record):
+        op = record["op"]
+        if op == "create":
+            account_number = record["account_number"]
+            if account_number in self.clients_by_account_number:
+                return
+            client = Client(record["username"], record["password"], account_number, self.account_locks.lockFor(account_number), self.ledger)
+            client.setBalance(record["balance"])
+            client.last_lsn = lsn
+            self.addClient(client)
+            return
+
+        if op == "transfer":
+            self.applyTransferRecord(lsn, record)
+            return
+
+        if op in ("reserve", "commit_reservation", "abort_reservation"):
+            self.applyReservationRecord(lsn, record)
+            return
+
+        client = self.clients_by_account_number[record["account_number"]]
+        if record.get("transfer_id") is not None:
+            self.applyCreditMarker(lsn, record, client)
+        # The snapshot may already include changes logged after it started
+        if client.last_lsn >= lsn:
+            return
+        if op == "credit":
+            client.balance += record["amount"]
+        elif op == "debit":
+            client.balance -= record["amount"]
         else:
-            max_account_number = max([client.account_number for client in self.clients])
-        return str(max_account_number + 1)
+            raise ValueError(f"Unknown log record: {op}")
+        if record.get("transaction") is not None:
+            self.recordTransaction(client, record["amount"], *record["transaction"])
+        client.last_lsn = lsn
+        # A retry arriving after a restart must still be recognised
+        if record.get("idempotency_key") is not None:
+            self.idempotency.put(keyHash(record["idempotency_key"]), (record["fingerprint"], 0, client.balance, lsn))
+
+    def applyTransferRecord(self, lsn, record):
+        # Both sides of a transfer within the bank are one record, so
+        # recovery never restores just one of them
+        sender = self.clients_by_account_number[record["sender_account_number"]]
+        receiver = self.clients_by_account_number[record["receiver_account_number"]]
+        apply_sender = sender.last_lsn < lsn
+        apply_receiver = receiver.last_lsn < lsn
+        if apply_sender:
+            sender.balance -= record["amount"]
+            self.recordTransaction(sender, record["amount"], *record["sender_transaction"])
+            sender.last_lsn = lsn
+        if apply_receiver:
+            receiver.balance += record["amount"]
+            self.recordTransaction(receiver, record["amount"], *record["receiver_transaction"])
+            receiver.last_lsn = lsn
+        if record.get("idempotency_key") is not None:
+            self.idempotency.put(keyHash(record["idempotency_key"]), (record["fingerprint"], 0, sender.balance, lsn))
+
+    def applyCreditMarker(self, lsn, record, client):
+        # Restores that a transfer was credited; the snapshot may hold it already
+        key_hash = creditKeyHash(record["transfer_id"])
+        marker = self.reservations.get(key_hash)
+        if marker is None or marker[4] < lsn:
+            self.reservations.put(key_hash, (client.account_number, record["amount"], NO_COUNTERPARTY, RESERVATION_CREDITED, lsn))
+
+    def applyReservationRecord(self, lsn, record):
+        # The snapshot may include the account and the reservation as of
+        # different points of the log, so each one is brought forward on its own
+        op = record["op"]
+        key_hash = keyHash(record["transfer_id"])
+        reservation = self.reservations.get(key_hash)
+        if record["account_number"] is None:
+            # Abort of a transfer that had nothing reserved
+            if reservation is None or reservation[4] < lsn:
+                self.reservations.put(key_hash, (NO_ACCOUNT, 0, NO_COUNTERPARTY, RESERVATION_ABORTED, lsn))
+            return
+
+        client = self.clients_by_account_number[record["account_number"]]
+        if client.last_lsn < lsn:
+            if op == "reserve":
+                client.balance -= record["amount"]
+            elif op == "abort_reservation":
+                client.balance += record["amount"]
+            else:
+                self.recordTransaction(client, record["amount"], *record["transaction"])
+            client.last_lsn = lsn
+        if reservation is not None and reservation[4] >= lsn:
+            return
+        if op == "reserve":
+            self.reservations.put(key_hash, (client.account_number, record["amount"], self.counterparties.intern(*record["counterparty"]),
+                                             RESERVATION_HELD, lsn))
+        else:
+            counterparty_id = reservation[2] if reservation is not None else NO_COUNTERPARTY
+            state = RESERVATION_COMMITTED if op == "commit_reservation" else RESERVATION_ABORTED
+            self.reservations.put(key_hash, (client.account_number, record["amount"], counterparty_id, state, lsn))
+
+    def recordTransaction(self, client, amount, timestamp, transaction_type, counterparty=None):
+        # Adds a statement entry; counterparty is [username, bank id, account number] for transfers
+        counterparty_id = NO_COUNTERPARTY
+        if counterparty is not None:
+            counterparty_id = self.counterparties.intern(*counterparty)
+        client.addTransaction(timestamp, transaction_type, amount, counterparty_id)
+
+    def countTransactions(self, client):
+        with client.lock:
+            return len(client.acc_statement)
+
+    def formatTransactions(self, client, start=0, stop=None):
+        # Entries are only ever appended, so entries below a count taken
+        # under the lock can be read without it
+        if stop is None:
+            stop = self.countTransactions(client)
+        statement = client.acc_statement
+        return [statement.format(index, self.counterparties) for index in range(start, stop)]
+
+    def writeSnapshot(self):
+        """
+        Writes every account to a new snapshot without pausing request
+        threads: each account is copied under its own lock and stamped with
+        the LSN of the last change it includes, so recovery knows which
+        log records after the snapshot's start are already reflected.
+        Log segments fully covered by the snapshot are deleted afterwards.
+        """
+        with self.lock:
+            clients = list(self.getAllClients())
+            snapshot_lsn = self.wal.lastAssignedLsn() if self.wal is not None else 0
+        if self.wal is not None:
+            self.wal.rotate()
+
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, snapshot_lsn, len(clients)))
+            for client in clients:
+                with client.lock:
+                    balance = client.balance
+                    last_lsn = client.last_lsn
+                    num_statements = len(client.acc_statement)
+                    columns = client.acc_statement.columnBytes(num_statements)
+
+                username = client.username.encode()
+                password = client.password.encode()
+                f.write(SNAPSHOT_ACCOUNT.pack(client.account_number, balance, last_lsn, len(username), len(password), num_statements))
+                f.write(username)
+                f.write(password)
+                for column in columns:
+                    f.write(column)
+
+            # Copied before the counterparties, so that those cover every
+            # counterparty referenced by an account or a reservation
+            reservations = self.reservations.items()
+            idempotency_entries = self.idempotency.expiringItems()
+            counterparties = list(self.counterparties.entries)
+            f.write(SNAPSHOT_COUNT.pack(len(counterparties)))
+            for username, bank_id, acc_no in counterparties:
+                username = username.encode()
+                acc_no = acc_no.encode()
+                f.write(SNAPSHOT_COUNTERPARTY.pack(bank_id, len(username), len(acc_no)))
+                f.write(username)
+                f.write(acc_no)
+            f.write(SNAPSHOT_COUNT.pack(len(reservations)))
+            for key_hash, reservation in reservations:
+                f.write(SNAPSHOT_RESERVATION.pack(key_hash, *reservation))
+            # Keys of records before the snapshot are no longer in the log
+            f.write(SNAPSHOT_COUNT.pack(len(idempotency_entries)))
+            for key_hash, expires_at, value in idempotency_entries:
+                f.write(SNAPSHOT_IDEMPOTENCY.pack(key_hash, expires_at, *value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        if self.wal is not None:
+            self.wal.truncateUpTo(snapshot_lsn)
+        return snapshot_lsn, len(clients)
+
+    def loadSnapshot(self, path):
+        # Returns the LSN the snapshot was started at. Loading creates
+        # millions of objects and no garbage, so the cyclic GC is paused
+        # instead of letting it rescan them over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            snapshot_lsn, clients = self._readSnapshot(path)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        # Build the indexes in bulk rather than one addClient call per account
+        self.clients.extend(clients)
+        self.clients_by_username.update((client.username, client) for client in clients)
+        self.clients_by_account_number.update((str(client.account_number), client) for client in clients)
+        return snapshot_lsn
+
+    def _readSnapshot(self, path):
+        unpack_account = SNAPSHOT_ACCOUNT.unpack_from
+        lock_for = self.account_locks.lockFor
+        # Bytes per entry of each statement column
+        column_sizes = [array(typecode).itemsize for typecode in "dBdi"]
+        clients = []
+        # Statement columns of all accounts, added to the ledger in one go
+        statement_columns = [[] for _ in column_sizes]
+        statement_counts = []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, snapshot_lsn, num_accounts = SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a bank snapshot")
+            offset = SNAPSHOT_HEADER.size
+            for _ in range(num_accounts):
+                account_number, balance, last_lsn, username_len, password_len, num_statements = unpack_account(data, offset)
+                offset += SNAPSHOT_ACCOUNT.size
+                username = data[offset:offset + username_len].decode()
+                offset += username_len
+                password = data[offset:offset + password_len].decode()
+                offset += password_len
+
+                client = Client(username, password, account_number, lock_for(account_number), self.ledger)
+                client.balance = balance
+                client.last_lsn = last_lsn
+                if num_statements > 0:
+                    for columns, column_size in zip(statement_columns, column_sizes):
+                        columns.append(data[offset:offset + column_size * num_statements])
+                        offset += column_size * num_statements
+                    statement_counts.append((client, num_statements))
+                clients.append(client)
+            self._loadStatements(statement_columns, statement_counts)
+
+            (num_counterparties,) = SNAPSHOT_COUNT.unpack_from(data, offset)
+            offset += SNAPSHOT_COUNT.size
+            for _ in range(num_counterparties):
+                bank_id, username_len, acc_no_len = SNAPSHOT_COUNTERPARTY.unpack_from(data, offset)
+                offset += SNAPSHOT_COUNTERPARTY.size
+                username = data[offset:offset + username_len].decode()
+                offset += username_len
+                acc_no = data[offset:offset + acc_no_len].decode()
+                offset += acc_no_len
+                self.counterparties.intern(username, bank_id, acc_no)
+
+            (num_reservations,) = SNAPSHOT_COUNT.unpack_from(data, offset)
+            offset += SNAPSHOT_COUNT.size
+            for _ in range(num_reservations):
+                key_hash, *reservation = SNAPSHOT_RESERVATION.unpack_from(data, offset)
+                offset += SNAPSHOT_RESERVATION.size
+                self.reservations.put(key_hash, tuple(reservation))
+
+            (num_idempotency_entries,) = SNAPSHOT_COUNT.unpack_from(data, offset)
+            offset += SNAPSHOT_COUNT.size
+            for _ in range(num_idempotency_entries):
+                key_hash, expires_at, *value = SNAPSHOT_IDEMPOTENCY.unpack_from(data, offset)
+                offset += SNAPSHOT_IDEMPOTENCY.size
+                self.idempotency.restore(key_hash, expires_at, tuple(value))
+        return snapshot_lsn, clients
+
+    def _loadStatements(self, statement_columns, statement_counts):
+        # Appends the snapshot's statements to the ledger, each account's entries in a row
+        if not statement_counts:
+            return
+        timestamps, types, amounts, counterparties = [b"".join(columns) for columns in statement_columns]
+        accounts = np.repeat(np.array([client.account_number for client, _ in statement_counts], dtype=np.int64),
+                             np.array([count for _, count in statement_counts], dtype=np.int64))
+        row = self.ledger.extend(accounts, np.frombuffer(timestamps, dtype=np.float64), np.frombuffer(amounts, dtype=np.float64),
+                                 np.frombuffer(types, dtype=np.uint8), np.frombuffer(counterparties, dtype=np.int32))
+        for client, count in statement_counts:
+            client.acc_statement.rows.extend(range(row, row + count))
+            row += count
+
+    def snapshotPeriodically(self, interval_s):
+        # Background loop; only snapshots when something was logged since the last one
+        last_snapshot_lsn = self.wal.lastAssignedLsn()
+        while True:
+            time.sleep(interval_s)
+            if self.wal.lastAssignedLsn() == last_snapshot_lsn:
+                continue
+            try:
+                start_time = time.monotonic()
+                last_snapshot_lsn, num_accounts = self.writeSnapshot()
+                logger.info(f"Snapshot of {num_accounts} accounts written in {time.monotonic() - start_time:.2f}s")
+            except Exception as e:
+                logger.error(f"Failed to write snapshot: {e}")
+
+    def generateUniqueAccountNumber(self):
+        return str(self.account_number_allocator.allocate())
 
     def createNewAccount(self, username, password, initial_balance=0):
+        err_code, output, lsn = self.openAccount(username, password, initial_balance)
+        self.waitDurable(lsn)
+        return err_code, output
+
+    def openAccount(self, username, password, initial_balance=0):
+        # Like createNewAccount, but returns the LSN to wait on instead of waiting for it
+        error = self.validateNewAccount(username, password, initial_balance)
+        if error is not None:
+            return 1, error, 0
+
+        with self.lock:
+            # Check if username is already taken in this bank
+            if username in self.clients_by_username:
+                logger.error("Username already taken")
+                return 1, "Username already taken", 0
+
+            account_number = self.generateUniqueAccountNumber()
+            new_client = Client(username, password, account_number, self.account_locks.lockFor(account_number), self.ledger)
+            new_client.setBalance(initial_balance)
+            # Logged before the account is published, so no change to it can be logged before its creation
+            lsn = self.logOperation({
+                "op": "create",
+                "username": username,
+                "password": password,
+                "account_number": account_number,
+                "balance": initial_balance
+            }, new_client)
+            self.addClient(new_client)
+        return 0, account_number, lsn
+
+    def validateNewAccount(self, username, password, initial_balance):
+        # Returns why an account can't be opened with these details, or None
+
         # Check if username is not empty
         if username == "":
             logger.error("Username cannot be empty")
-            return 1, "Username cannot be empty"
+            return "Username cannot be empty"
         
         # Check if password is empty
         if password == "":
             logger.error("Password cannot be empty")
-            return 1, "Password cannot be empty"
+            return "Password cannot be empty"
         
-        # Check if initial balance is negative
-        if initial_balance < 0:
+        # Check if initial balance is negative (or NaN/inf)
+        if not (initial_balance >= 0 and math.isfinite(initial_balance)):
             logger.error("Initial balance must be >= 0")
-            return 1, "Inital balance must be non negative"
-        account_number = self.generateUniqueAccountNumber()
-        new_client = Client(username, password, account_number)
-        new_client.setBalance(initial_balance)
-        self.clients.append(new_client)
-        return 0, account_number
+            return "Inital balance must be non negative"
+        return None
+
+    def addClient(self, client):
+        # Callers must hold self.lock
+        self.clients.append(client)
+        self.clients_by_username[client.getUsername()] = client
+        self.clients_by_account_number[client.getAccountNumber()] = client
 
     def checkAccountExist(self, account_number):
-        return True if account_number in [client.getAccountNumber() for client in self.clients] else False
+        return str(account_number) in self.clients_by_account_number
     
     def getID(self):
         return self.id
@@ -70,35 +1211,45 @@ class Bank:
         return self.clients
 
     def getClientByUsername(self, username):
-        for client in self.clients:
-            if client.getUsername() == username:
-                return client
-        return None
+        return self.clients_by_username.get(username)
+
+    def getClientByAccountNumber(self, account_number):
+        return self.clients_by_account_number.get(str(account_number))
 
 
 class Client:
-    def __init__(self, username, password, account_number):
+    __slots__ = ("username", "password", "account_number", "balance", "acc_statement", "last_lsn", "lock")
+
+    def __init__(self, username, password, account_number, lock=None, ledger=None):
         self.username = username
         self.password = password
         self.account_number = int(account_number)
         self.balance = 0
-        self.acc_statement = []
+        # Entries live in the bank's ledger
+        self.acc_statement = LedgerStatement(ledger if ledger is not None else ColumnarLedger(), self.account_number)
+        # LSN of the last logged change applied to this account
+        self.last_lsn = 0
+        # Stripe of the bank's lock table guarding this account's balance and statement
+        self.lock = lock if lock is not None else threading.RLock()
 
     def credit(self, amount):
-        if amount < 0:
-            logger.error(f"Amount to be credited should be >= 0, but got amount = {amount}")
+        # Written so that NaN fails too
+        if not (amount > 0 and math.isfinite(amount)):
+            logger.error(f"Amount to be credited should be > 0, but got amount = {amount}")
             return 1
-        self.balance += amount
+        with self.lock:
+            self.balance += amount
         return 0
         
     def debit(self, amount):
-        if amount <= 0:
+        if not (amount > 0 and math.isfinite(amount)):
             logger.error(f"Amount to be debited should be > 0, but got amount = {amount}")
             return 1
-        elif self.balance < amount:
-            logger.error(f"Not enough balance in account :(")
-            return 1
-        self.balance -= amount
+        with self.lock:
+            if self.balance < amount:
+                logger.error(f"Not enough balance in account :(")
+                return 1
+            self.balance -= amount
         return 0
         
     def getBalance(self):
@@ -116,18 +1267,834 @@ class Client:
     def checkPassword(self, entered_password):
         return entered_password == self.password
 
-    def addTransaction(self, transaction):
-        self.acc_statement.append(transaction)
+    def addTransaction(self, timestamp, transaction_type, amount, counterparty_id=NO_COUNTERPARTY):
+        self.acc_statement.append(timestamp, transaction_type, amount, counterparty_id)
 
     def getAllTransactions(self):
         return self.acc_statement
 
 
+class SharedBankState:
+    """
+    Accounts, counterparties and ledger of a bank laid out as NumPy columns
+    in one multiprocessing.shared_memory block, together with the
+    process-shared locks guarding them, so that worker processes forked
+    from the parent all serve the same bank.
+
+    Tables are append-only with a fixed capacity; a row is complete before
+    the count in the header covering it is bumped. The whole block is
+    reserved up front, so a /dev/shm too small for it raises
+    SharedMemoryTooSmall here instead of killing a worker with SIGBUS
+    when it first writes to a page that can't be backed. Its name is
+    removed right away, so the memory goes when the last process does.
+    """
+    def __init__(self, max_accounts, max_counterparties, max_transactions, max_idempotency_entries=DEFAULT_IDEMPOTENCY_MAX_ENTRIES,
+                 num_lock_stripes=NUM_ACCOUNT_LOCK_STRIPES):
+        context = multiprocessing.get_context("fork")
+        # Power of two, at most half full
+        idempotency_slots = 1 << (2 * max_idempotency_entries - 1).bit_length()
+        layout = [
+            ("account_number", np.int64, max_accounts),
+            ("balance", np.float64, max_accounts),
+            ("last_lsn", np.uint64, max_accounts),
+            ("username", f"S{SHARED_USERNAME_BYTES}", max_accounts),
+            ("password", f"S{SHARED_PASSWORD_BYTES}", max_accounts),
+            ("counterparty_username", f"S{SHARED_USERNAME_BYTES}", max_counterparties),
+            ("counterparty_bank_id", np.int32, max_counterparties),
+            ("counterparty_acc_no", f"S{SHARED_ACC_NO_BYTES}", max_counterparties),
+            ("ledger_timestamp", np.float64, max_transactions),
+            ("ledger_account", np.int64, max_transactions),
+            ("ledger_amount", np.float64, max_transactions),
+            ("ledger_type", np.uint8, max_transactions),
+            ("ledger_counterparty", np.int32, max_transactions),
+            ("idempotency_key", np.uint64, idempotency_slots),
+            ("idempotency_expiry", np.float64, idempotency_slots),
+            ("idempotency_fingerprint", np.uint64, idempotency_slots),
+            ("idempotency_err_code", np.int32, idempotency_slots),
+            ("idempotency_balance", np.float64, idempotency_slots),
+            ("idempotency_lsn", np.uint64, idempotency_slots),
+            ("reservation_key", np.uint64, idempotency_slots),
+            ("reservation_expiry", np.float64, idempotency_slots),
+            ("reservation_account", np.int64, idempotency_slots),
+            ("reservation_amount", np.float64, idempotency_slots),
+            ("reservation_counterparty", np.int32, idempotency_slots),
+            ("reservation_state", np.uint8, idempotency_slots),
+            ("reservation_lsn", np.uint64, idempotency_slots)
+        ]
+        # Every column starts on an 8 byte boundary
+        offsets = []
+        header_dtype = np.dtype([(field, np.uint64) for field in SHARED_HEADER_FIELDS])
+        size = header_dtype.itemsize
+        for _, dtype, length in layout:
+            offsets.append(size)
+            size += -(-np.dtype(dtype).itemsize * length // 8) * 8
+
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self._reserve(size)
+        # Workers inherit the mapping when they are forked, so the name isn't
+        # needed; unlinked now, the block is freed even if the bank is killed
+        self.shm.unlink()
+        logger.info(f"Reserved {size / 2**20:.0f} MB of shared memory")
+        self.header = np.ndarray((), dtype=header_dtype, buffer=self.shm.buf)
+        for (name, dtype, length), offset in zip(layout, offsets):
+            setattr(self, name, np.ndarray(length, dtype=dtype, buffer=self.shm.buf, offset=offset))
+
+        self.accounts_lock = context.Lock()
+        self.account_locks = StripedLocks(num_lock_stripes, lock_factory=context.RLock)
+        self.account_number_lock = context.Lock()
+        self.counterparties_lock = context.Lock()
+        self.ledger_lock = context.Lock()
+        self.wal_append_lock = context.Lock()
+        self.wal_durable = context.Condition()
+        self.idempotency_lock = context.Lock()
+        self.reservations_lock = context.Lock()
+
+    def _reserve(self, size):
+        # Allocates every page of the block now; only possible where it is a file in SHARED_MEMORY_DIR
+        path = SHARED_MEMORY_DIR / self.shm.name.lstrip("/")
+        if not path.exists():
+            return
+        fd = os.open(path, os.O_RDWR)
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            usage = os.statvfs(SHARED_MEMORY_DIR)
+            free_bytes = usage.f_bavail * usage.f_frsize
+            self.shm.close()
+            self.shm.unlink()
+            raise SharedMemoryTooSmall(f"--workers needs {size / 2**20:.0f} MB of shared memory, but {SHARED_MEMORY_DIR} has "
+                                       f"{free_bytes / 2**20:.0f} MB free ({e.strerror}). Lower --max-accounts, --max-transactions "
+                                       f"or --idempotency-max-entries, or enlarge {SHARED_MEMORY_DIR} (docker run --shm-size)") from None
+        finally:
+            os.close(fd)
+
+
+class SharedMemoryTooSmall(Exception):
+    pass
+
+
+class SharedAccountNumberAllocator(AccountNumberAllocator):
+    # Lease state lives in the shared header so that every worker draws
+    # numbers from the same blocks
+    def __init__(self, path, state, block_size=ACCOUNT_NUMBER_BLOCK_SIZE):
+        self.header = state.header
+        super().__init__(path, block_size)
+        self.lock = state.account_number_lock
+
+    @property
+    def next_number(self):
+        return int(self.header["next_account_number"])
+
+    @next_number.setter
+    def next_number(self, value):
+        self.header["next_account_number"] = value
+
+    @property
+    def block_end(self):
+        return int(self.header["account_block_end"])
+
+    @block_end.setter
+    def block_end(self, value):
+        self.header["account_block_end"] = value
+
+
+class SharedWriteAheadLog(WriteAheadLog):
+    """
+    WriteAheadLog shared by the worker processes of a SharedBank.
+
+    LSNs come from the shared header and every process appends to the same
+    segment (O_APPEND) under a process-shared lock, so the files hold
+    records in LSN order exactly like the single-process log and recovery
+    reads them the same way. There is no flusher thread: the first waiter
+    finding no sync in progress becomes the leader, syncs everything
+    written so far by any process and wakes the others.
+    """
+    def __init__(self, directory, name, state, next_lsn, durability="fsync", commit_window_ms=WAL_DEFAULT_COMMIT_WINDOW_MS):
+        super().__init__(directory, name, durability, commit_window_ms)
+        self.header = state.header
+        self.append_lock = state.wal_append_lock
+        self.durable = state.wal_durable
+        self.header["wal_next_lsn"] = next_lsn
+        self.header["wal_written_lsn"] = next_lsn - 1
+        self.header["wal_durable_lsn"] = next_lsn - 1
+        self.header["wal_segment_lsn"] = next_lsn
+
+        # Per process: descriptor of the current segment and the LSN naming it
+        self.fd = None
+        self.fd_segment_lsn = 0
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.append_lock:
+            self._reopenIfRotated()
+
+    def _reopenIfRotated(self):
+        # Callers must hold self.append_lock
+        segment_lsn = int(self.header["wal_segment_lsn"])
+        if self.fd is not None and self.fd_segment_lsn == segment_lsn:
+            return
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = os.open(self._segmentPath(segment_lsn), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.fd_segment_lsn = segment_lsn
+
+    def _syncFd(self, fd):
+        if self.durability == "fsync":
+            os.fsync(fd)
+        elif self.durability == "fdatasync":
+            getattr(os, "fdatasync", os.fsync)(fd)
+
+    def rotate(self):
+        with self.append_lock:
+            self._reopenIfRotated()
+            if os.fstat(self.fd).st_size == 0:
+                return
+            # Later commits only sync the new segment, so finish this one first
+            self._syncFd(self.fd)
+            self.header["wal_segment_lsn"] = int(self.header["wal_written_lsn"]) + 1
+            self._reopenIfRotated()
+
+    def truncateUpTo(self, lsn):
+        with self.append_lock:
+            current = self._segmentPath(int(self.header["wal_segment_lsn"])).name
+            segments = self._segments()
+            for (_, path), (next_first_lsn, _) in zip(segments, segments[1:]):
+                if next_first_lsn - 1 <= lsn and path.name != current:
+                    path.unlink()
+
+    def append(self, record):
+        """Writes a record and returns its LSN; the record is not durable until waitDurable(lsn) returns."""
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        with self.append_lock:
+            self._raiseIfFailed()
+            self._reopenIfRotated()
+            lsn = int(self.header["wal_next_lsn"])
+            try:
+                os.write(self.fd, WAL_RECORD_HEADER.pack(lsn, len(payload), zlib.crc32(payload)) + payload)
+            except OSError as e:
+                self._fail(e)
+                raise WriteAheadLogFailed(f"Write-ahead log failed: {e}") from e
+            self.header["wal_next_lsn"] = lsn + 1
+            self.header["wal_written_lsn"] = lsn
+        return lsn
+
+    def lastAssignedLsn(self):
+        with self.append_lock:
+            return int(self.header["wal_next_lsn"]) - 1
+
+    def waitDurable(self, lsn):
+        # Records are handed to the OS by append() itself
+        if self.durability == "os-buffered":
+            return
+
+        header = self.header
+        with self.durable:
+            while int(header["wal_durable_lsn"]) < lsn:
+                self._raiseIfFailed()
+                if not header["wal_syncing"]:
+                    header["wal_syncing"] = 1
+                    break
+                self.durable.wait()
+            else:
+                return
+
+        # This thread leads the next commit
+        synced_lsn = 0
+        try:
+            synced_lsn = self._syncWritten()
+        except OSError as e:
+            self._fail(e)
+            raise WriteAheadLogFailed(f"Write-ahead log failed: {e}") from e
+        finally:
+            with self.durable:
+                durable_lsn = int(header["wal_durable_lsn"])
+                if synced_lsn > durable_lsn:
+                    header["wal_durable_lsn"] = synced_lsn
+                    header["wal_commits"] += 1
+                    header["wal_records"] += synced_lsn - durable_lsn
+                header["wal_syncing"] = 0
+                self.durable.notify_all()
+
+    async def waitDurableAsync(self, lsn):
+        await asyncio.get_running_loop().run_in_executor(None, self.waitDurable, lsn)
+
+    def _raiseIfFailed(self):
+        if self.header["wal_failed"]:
+            raise WriteAheadLogFailed("Write-ahead log failed in one of the workers")
+
+    def _fail(self, error):
+        # Stops every worker from accepting changes
+        logger.critical(f"Could not write the write-ahead log, no longer accepting changes: {error}")
+        self.header["wal_failed"] = 1
+
+    def _syncWritten(self):
+        # Let concurrent RPCs of every worker join this commit
+        if self.commit_window_s > 0:
+            time.sleep(self.commit_window_s)
+
+        with self.append_lock:
+            self._reopenIfRotated()
+            written_lsn = int(self.header["wal_written_lsn"])
+            # Our own copy, so appends can go on (and rotate) while it syncs
+            fd = os.dup(self.fd)
+        try:
+            self._syncFd(fd)
+        finally:
+            os.close(fd)
+        return written_lsn
+
+    def getStats(self):
+        return {
+            "commits": int(self.header["wal_commits"]),
+            "records": int(self.header["wal_records"]),
+            "durable_lsn": int(self.header["wal_durable_lsn"])
+        }
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SharedCounterpartyTable(CounterpartyTable):
+    # CounterpartyTable over the shared counterparty columns; ids are the
+    # same in every process, each of which keeps its own lookup dict
+    def __init__(self, state):
+        self.state = state
+        self.lock = state.counterparties_lock
+        self.catch_up_lock = threading.Lock()
+        self.ids = {}
+        self.local_entries = []
+
+    @property
+    def entries(self):
+        self._catchUp()
+        return self.local_entries
+
+    def _catchUp(self):
+        if int(self.state.header["num_counterparties"]) == len(self.local_entries):
+            return
+        state = self.state
+        with self.catch_up_lock:
+            for counterparty_id in range(len(self.local_entries), int(state.header["num_counterparties"])):
+                key = (state.counterparty_username[counterparty_id].decode(), int(state.counterparty_bank_id[counterparty_id]),
+                       state.counterparty_acc_no[counterparty_id].decode())
+                self.local_entries.append(key)
+                self.ids[key] = counterparty_id
+
+    def intern(self, username, bank_id, acc_no):
+        key = (username, bank_id, acc_no)
+        counterparty_id = self.ids.get(key)
+        if counterparty_id is not None:
+            return counterparty_id
+
+        state = self.state
+        with self.lock:
+            self._catchUp()
+            counterparty_id = self.ids.get(key)
+            if counterparty_id is None:
+                counterparty_id = int(state.header["num_counterparties"])
+                if counterparty_id >= len(state.counterparty_bank_id):
+                    logger.error("Shared counterparty table is full")
+                    return NO_COUNTERPARTY
+                # Longer names are cut to the column width; they are only displayed
+                state.counterparty_username[counterparty_id] = username.encode()
+                state.counterparty_bank_id[counterparty_id] = bank_id
+                state.counterparty_acc_no[counterparty_id] = acc_no.encode()
+                state.header["num_counterparties"] = counterparty_id + 1
+                self._catchUp()
+                self.ids[key] = counterparty_id
+        return counterparty_id
+
+    def get(self, counterparty_id):
+        if counterparty_id >= len(self.local_entries):
+            self._catchUp()
+        return self.local_entries[counterparty_id]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SharedLedger(ColumnarLedger):
+    # ColumnarLedger over the shared ledger columns, which also keep the
+    # counterparty of each row since statements are read from them
+    def __init__(self, state, chunk_rows=LEDGER_CHUNK_ROWS):
+        self.state = state
+        self.chunk_rows = chunk_rows
+        self.lock = state.ledger_lock
+
+    @property
+    def num_rows(self):
+        return int(self.state.header["num_transactions"])
+
+    def append(self, timestamp, account_number, amount, type_code, counterparty_id=NO_COUNTERPARTY):
+        # Returns the row written, or -1 if the ledger is full
+        state = self.state
+        with self.lock:
+            row = int(state.header["num_transactions"])
+            if row >= len(state.ledger_timestamp):
+                return -1
+            state.ledger_timestamp[row] = timestamp
+            state.ledger_account[row] = account_number
+            state.ledger_amount[row] = amount
+            state.ledger_type[row] = type_code
+            state.ledger_counterparty[row] = counterparty_id
+            state.header["num_transactions"] = row + 1
+        return row
+
+    def _filledChunks(self):
+        state = self.state
+        num_rows = self.num_rows
+        for start in range(0, num_rows, self.chunk_rows):
+            stop = min(start + self.chunk_rows, num_rows)
+            yield {
+                "timestamp": state.ledger_timestamp[start:stop],
+                "account": state.ledger_account[start:stop],
+                "amount": state.ledger_amount[start:stop],
+                "type": state.ledger_type[start:stop]
+            }
+
+
+class SharedIdempotencyCache:
+    """
+    Bank idempotency cache in a SharedBankState, so that a retry is
+    recognised by whichever worker process it reaches. A fixed size hash
+    table of 64-bit key hashes with linear probing over at most
+    SHARED_IDEMPOTENCY_PROBE_LENGTH slots; an insert that finds neither the
+    key nor an empty slot there overwrites the entry expiring first.
+    Keys and values are as in Bank.idempotency.
+    """
+    def __init__(self, state, ttl_s=DEFAULT_IDEMPOTENCY_TTL_S):
+        self.state = state
+        self.lock = state.idempotency_lock
+        self.ttl_s = ttl_s
+        self.mask = len(state.idempotency_key) - 1
+
+    def _slots(self, key_hash):
+        # 0 marks an empty slot
+        key_hash = key_hash or 1
+        return key_hash, [(key_hash + probe) & self.mask for probe in range(SHARED_IDEMPOTENCY_PROBE_LENGTH)]
+
+    def get(self, key_hash):
+        key_hash, slots = self._slots(key_hash)
+        state = self.state
+        now = time.monotonic()
+        with self.lock:
+            for slot in slots:
+                if state.idempotency_key[slot] == key_hash and state.idempotency_expiry[slot] > now:
+                    return (int(state.idempotency_fingerprint[slot]), int(state.idempotency_err_code[slot]),
+                            float(state.idempotency_balance[slot]), int(state.idempotency_lsn[slot]))
+        return None
+
+    def put(self, key_hash, value):
+        self._put(key_hash, value, time.monotonic() + self.ttl_s)
+
+    def _put(self, key_hash, value, expiry):
+        fingerprint, err_code, balance, lsn = value
+        key_hash, slots = self._slots(key_hash)
+        state = self.state
+        with self.lock:
+            victim = slots[0]
+            for slot in slots:
+                if state.idempotency_key[slot] == key_hash:
+                    victim = slot
+                    break
+                if state.idempotency_expiry[slot] < state.idempotency_expiry[victim]:
+                    victim = slot
+            state.idempotency_key[victim] = key_hash
+            state.idempotency_expiry[victim] = expiry
+            state.idempotency_fingerprint[victim] = fingerprint
+            state.idempotency_err_code[victim] = err_code
+            state.idempotency_balance[victim] = balance
+            state.idempotency_lsn[victim] = lsn
+
+    def expiringItems(self):
+        # As IdempotencyCache.expiringItems, in slot order
+        state = self.state
+        now = time.monotonic()
+        wall_offset = time.time() - now
+        with self.lock:
+            slots = np.flatnonzero((state.idempotency_key != 0) & (state.idempotency_expiry > now))
+            return [(int(state.idempotency_key[slot]), float(state.idempotency_expiry[slot]) + wall_offset,
+                     (int(state.idempotency_fingerprint[slot]), int(state.idempotency_err_code[slot]),
+                      float(state.idempotency_balance[slot]), int(state.idempotency_lsn[slot])))
+                    for slot in slots]
+
+    def restore(self, key_hash, expires_at, value):
+        remaining_s = expires_at - time.time()
+        if remaining_s > 0:
+            self._put(key_hash, value, time.monotonic() + min(remaining_s, self.ttl_s))
+
+
+class SharedReservationTable:
+    """
+    ReservationTable in a SharedBankState, so that a reservation made
+    through one worker process can be settled through any other. Hashed
+    and probed like SharedIdempotencyCache, but a held reservation is never
+    overwritten: an insert that finds no empty or expired slot raises
+    ReservationTableFull.
+    """
+    def __init__(self, state, ttl_s=DEFAULT_IDEMPOTENCY_TTL_S):
+        self.state = state
+        self.lock = state.reservations_lock
+        self.ttl_s = ttl_s
+        self.mask = len(state.reservation_key) - 1
+
+    def _slots(self, key_hash):
+        # 0 marks an empty slot
+        key_hash = key_hash or 1
+        return key_hash, [(key_hash + probe) & self.mask for probe in range(SHARED_IDEMPOTENCY_PROBE_LENGTH)]
+
+    def _find(self, key_hash, slots, now):
+        # Slot of a live entry for the key, and a slot a new entry can take
+        state = self.state
+        free_slot = None
+        for slot in slots:
+            live = state.reservation_expiry[slot] > now
+            if state.reservation_key[slot] == key_hash and live:
+                return slot, None
+            if free_slot is None and (state.reservation_key[slot] == 0 or not live):
+                free_slot = slot
+        return None, free_slot
+
+    def _value(self, slot):
+        state = self.state
+        return (int(state.reservation_account[slot]), float(state.reservation_amount[slot]), int(state.reservation_counterparty[slot]),
+                int(state.reservation_state[slot]), int(state.reservation_lsn[slot]))
+
+    def _write(self, slot, key_hash, value):
+        account_number, amount, counterparty_id, reservation_state, lsn = value
+        state = self.state
+        state.reservation_key[slot] = key_hash
+        state.reservation_expiry[slot] = float("inf") if reservation_state == RESERVATION_HELD else time.monotonic() + self.ttl_s
+        state.reservation_account[slot] = account_number
+        state.reservation_amount[slot] = amount
+        state.reservation_counterparty[slot] = counterparty_id
+        state.reservation_state[slot] = reservation_state
+        state.reservation_lsn[slot] = lsn
+
+    def get(self, key_hash):
+        key_hash, slots = self._slots(key_hash)
+        with self.lock:
+            slot, _ = self._find(key_hash, slots, time.monotonic())
+            return self._value(slot) if slot is not None else None
+
+    def insertIfAbsent(self, key_hash, value):
+        key_hash, slots = self._slots(key_hash)
+        with self.lock:
+            slot, free_slot = self._find(key_hash, slots, time.monotonic())
+            if slot is not None:
+                return self._value(slot)
+            if free_slot is None:
+                raise ReservationTableFull()
+            self._write(free_slot, key_hash, value)
+            return None
+
+    def put(self, key_hash, value):
+        key_hash, slots = self._slots(key_hash)
+        with self.lock:
+            slot, free_slot = self._find(key_hash, slots, time.monotonic())
+            if slot is None:
+                slot = free_slot
+            if slot is None:
+                raise ReservationTableFull()
+            self._write(slot, key_hash, value)
+
+    def remove(self, key_hash):
+        key_hash, slots = self._slots(key_hash)
+        with self.lock:
+            slot, _ = self._find(key_hash, slots, time.monotonic())
+            if slot is not None:
+                self.state.reservation_key[slot] = 0
+
+    def items(self):
+        state = self.state
+        with self.lock:
+            slots = np.flatnonzero((state.reservation_key != 0) & (state.reservation_expiry > time.monotonic()))
+            return [(int(state.reservation_key[slot]), self._value(slot)) for slot in slots]
+
+
+class SharedStatement:
+    """
+    Statement of one account of a SharedBank: the account's rows of the
+    shared ledger, read through the same methods as a LedgerStatement.
+    """
+    __slots__ = ("bank", "account_number")
+
+    def __init__(self, bank, account_number):
+        self.bank = bank
+        self.account_number = account_number
+
+    def __len__(self):
+        return len(self.bank.statementRows(self.account_number))
+
+    def format(self, index, counterparties):
+        row = self.bank.statementRows(self.account_number)[index]
+        state = self.bank.state
+        return formatTransaction(float(state.ledger_timestamp[row]), int(state.ledger_type[row]), float(state.ledger_amount[row]),
+                                 int(state.ledger_counterparty[row]), counterparties)
+
+    def columnBytes(self, count):
+        rows = np.asarray(self.bank.statementRows(self.account_number)[:count], dtype=np.int64)
+        state = self.bank.state
+        return [column[rows].tobytes() for column in (state.ledger_timestamp, state.ledger_type, state.ledger_amount, state.ledger_counterparty)]
+
+
+class SharedClient(Client):
+    # Client whose balance and last LSN are a row of the shared account table
+    __slots__ = ("state", "row")
+
+    def __init__(self, bank, row):
+        state = bank.state
+        self.state = state
+        self.row = row
+        self.username = state.username[row].decode()
+        self.password = state.password[row].decode()
+        self.account_number = int(state.account_number[row])
+        self.acc_statement = SharedStatement(bank, self.account_number)
+        self.lock = bank.account_locks.lockFor(self.account_number)
+
+    @property
+    def balance(self):
+        return float(self.state.balance[self.row])
+
+    @balance.setter
+    def balance(self, balance):
+        self.state.balance[self.row] = balance
+
+    @property
+    def last_lsn(self):
+        return int(self.state.last_lsn[self.row])
+
+    @last_lsn.setter
+    def last_lsn(self, lsn):
+        self.state.last_lsn[self.row] = lsn
+
+
+class SharedBank(Bank):
+    """
+    Bank whose accounts, balances, statements and log are kept in a
+    SharedBankState, so that several worker processes can serve any
+    account. Every process keeps its own indexes (self.clients, the dicts
+    and statementRows) and catches them up with rows added by the other
+    processes when a lookup misses.
+    """
+    def __init__(self, port, state, data_dir=DATA_DIR):
+        super().__init__(port, data_dir)
+        self.state = state
+        self.lock = state.accounts_lock
+        self.account_locks = state.account_locks
+        self.account_number_allocator = SharedAccountNumberAllocator(self.data_dir / f"bank_{port}_account_numbers", state)
+        self.counterparties = SharedCounterpartyTable(state)
+        self.ledger = SharedLedger(state)
+        self.idempotency = SharedIdempotencyCache(state)
+        self.reservations = SharedReservationTable(state)
+
+        # Local to this process
+        self.catch_up_lock = threading.Lock()
+        self.statement_rows = {}
+        self.statement_rows_seen = 0
+
+    @classmethod
+    def fromBank(cls, bank, max_accounts=SHARED_DEFAULT_MAX_ACCOUNTS, max_transactions=SHARED_DEFAULT_MAX_TRANSACTIONS):
+        # Moves a recovered bank into a new SharedBankState with room for at
+        # least as many accounts and statement entries again
+        clients = bank.getAllClients()
+        counterparties = bank.counterparties.entries
+        num_transactions = bank.ledger.num_rows
+        state = SharedBankState(max(max_accounts, 2 * len(clients)), max(max_accounts, 2 * len(counterparties)),
+                                max(max_transactions, 2 * num_transactions), bank.idempotency.max_entries)
+
+        for client in clients:
+            if len(client.username.encode()) > SHARED_USERNAME_BYTES or len(client.password.encode()) > SHARED_PASSWORD_BYTES:
+                raise ValueError(f"Credentials of account {client.account_number} don't fit the shared account table")
+        num_accounts = len(clients)
+        state.account_number[:num_accounts] = [client.account_number for client in clients]
+        state.balance[:num_accounts] = [client.balance for client in clients]
+        state.last_lsn[:num_accounts] = [client.last_lsn for client in clients]
+        state.username[:num_accounts] = [client.username.encode() for client in clients]
+        state.password[:num_accounts] = [client.password.encode() for client in clients]
+        state.header["num_accounts"] = num_accounts
+
+        for counterparty_id, (username, bank_id, acc_no) in enumerate(counterparties):
+            state.counterparty_username[counterparty_id] = username.encode()
+            state.counterparty_bank_id[counterparty_id] = bank_id
+            state.counterparty_acc_no[counterparty_id] = acc_no.encode()
+        state.header["num_counterparties"] = len(counterparties)
+
+        # The ledger keeps each account's entries in order, so it is copied as is
+        row = 0
+        for chunk in bank.ledger._filledChunks():
+            count = len(chunk["timestamp"])
+            state.ledger_timestamp[row:row + count] = chunk["timestamp"]
+            state.ledger_account[row:row + count] = chunk["account"]
+            state.ledger_amount[row:row + count] = chunk["amount"]
+            state.ledger_type[row:row + count] = chunk["type"]
+            state.ledger_counterparty[row:row + count] = chunk["counterparty"]
+            row += count
+        state.header["num_transactions"] = row
+
+        shared_bank = cls(bank.port, state, bank.data_dir)
+        shared_bank.setID(bank.getID())
+        shared_bank.setIdempotencyCache(SharedIdempotencyCache(state, bank.idempotency.ttl_s))
+        for key_hash, expires_at, value in bank.idempotency.expiringItems():
+            shared_bank.idempotency.restore(key_hash, expires_at, value)
+        shared_bank.setReservationTable(SharedReservationTable(state, bank.reservations.ttl_s))
+        for key_hash, reservation in bank.reservations.items():
+            shared_bank.reservations.put(key_hash, reservation)
+        if bank.wal is not None:
+            wal = bank.wal
+            shared_bank.setWriteAheadLog(SharedWriteAheadLog(wal.directory, wal.name, state, wal.next_lsn,
+                                                             wal.durability, wal.commit_window_s * 1000))
+        return shared_bank
+
+    def _catchUpAccounts(self):
+        if int(self.state.header["num_accounts"]) == len(self.clients):
+            return
+        with self.catch_up_lock:
+            for row in range(len(self.clients), int(self.state.header["num_accounts"])):
+                self.addClient(SharedClient(self, row))
+
+    def statementRows(self, account_number):
+        # Ledger rows of an account, including rows appended by other processes
+        if self.ledger.num_rows != self.statement_rows_seen:
+            with self.catch_up_lock:
+                start = self.statement_rows_seen
+                num_rows = self.ledger.num_rows
+                accounts = self.state.ledger_account[start:num_rows].tolist()
+                for row, account in enumerate(accounts, start):
+                    rows = self.statement_rows.get(account)
+                    if rows is None:
+                        rows = self.statement_rows[account] = array("q")
+                    rows.append(row)
+                self.statement_rows_seen = max(num_rows, start)
+        return self.statement_rows.get(account_number, ())
+
+    def openAccount(self, username, password, initial_balance=0):
+        error = self.validateNewAccount(username, password, initial_balance)
+        if error is not None:
+            return 1, error, 0
+        if len(username.encode()) > SHARED_USERNAME_BYTES or len(password.encode()) > SHARED_PASSWORD_BYTES:
+            logger.error("Username or password too long")
+            return 1, "Username or password too long", 0
+
+        state = self.state
+        with self.lock:
+            self._catchUpAccounts()
+            # Check if username is already taken in this bank
+            if username in self.clients_by_username:
+                logger.error("Username already taken")
+                return 1, "Username already taken", 0
+
+            row = int(state.header["num_accounts"])
+            if row >= len(state.account_number):
+                logger.error("Shared account table is full")
+                return 1, "Bank cannot open more accounts", 0
+
+            account_number = self.generateUniqueAccountNumber()
+            # Logged before the account is published, so no change to it can be logged before its creation
+            lsn = self.logOperation({
+                "op": "create",
+                "username": username,
+                "password": password,
+                "account_number": account_number,
+                "balance": initial_balance
+            })
+            state.account_number[row] = int(account_number)
+            state.balance[row] = initial_balance
+            state.last_lsn[row] = lsn
+            state.username[row] = username.encode()
+            state.password[row] = password.encode()
+            state.header["num_accounts"] = row + 1
+            self._catchUpAccounts()
+        return 0, account_number, lsn
+
+    def recordTransaction(self, client, amount, timestamp, transaction_type, counterparty=None):
+        counterparty_id = NO_COUNTERPARTY
+        if counterparty is not None:
+            counterparty_id = self.counterparties.intern(*counterparty)
+        if self.ledger.append(timestamp, client.account_number, amount, TRANSACTION_TYPE_CODES[transaction_type], counterparty_id) < 0:
+            # Still in the log, so the entry comes back after a restart
+            logger.error(f"Shared ledger is full; statement entry of account {client.account_number} not kept in memory")
+
+    def getAllClients(self):
+        self._catchUpAccounts()
+        return self.clients
+
+    def checkAccountExist(self, account_number):
+        return self.getClientByAccountNumber(account_number) is not None
+
+    def getClientByUsername(self, username):
+        client = self.clients_by_username.get(username)
+        if client is None:
+            self._catchUpAccounts()
+            client = self.clients_by_username.get(username)
+        return client
+
+    def getClientByAccountNumber(self, account_number):
+        client = self.clients_by_account_number.get(str(account_number))
+        if client is None:
+            self._catchUpAccounts()
+            client = self.clients_by_account_number.get(str(account_number))
+        return client
+
+
 class BankServicer(bank_grpc.BankServicer):
+    # RPCs that change state are split into an apply* method doing the work
+    # and a wrapper that waits for durability, so AsyncBankServicer can
+    # await that wait instead of blocking on it
     def CreateNewClient(self, request, context):
+        response_obj, lsn = self.applyCreateNewClient(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def AddBalance(self, request, context):
+        response_obj, lsn = self.applyAddBalance(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def Credit(self, request, context):
+        response_obj, lsn = self.applyCredit(request)
+        # Only acknowledge once the credit is durable
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def Debit(self, request, context):
+        response_obj, lsn = self.applyDebit(request)
+        # Only acknowledge once the debit is durable
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def BulkCredit(self, request, context):
+        response_obj, lsn = self.applyBulkCredit(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def Transfer(self, request, context):
+        response_obj, lsn = self.applyTransfer(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def Reserve(self, request, context):
+        response_obj, lsn = self.applyReserve(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def CommitReservation(self, request, context):
+        response_obj, lsn = self.applyCommitReservation(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def AbortReservation(self, request, context):
+        response_obj, lsn = self.applyAbortReservation(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    def applyCreateNewClient(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
         logger.info("Create new client request received")
         response_obj = bank_pb2.CreateNewClientResponse()
-        err_code, output = MyBank.createNewAccount(request.username, request.password, request.initial_balance)
+        err_code, output, lsn = MyBank.openAccount(request.username, request.password, request.initial_balance)
         if err_code == 1:
             logger.error(output)
             response_obj.err_code = 1
@@ -137,19 +2104,18 @@ class BankServicer(bank_grpc.BankServicer):
             response_obj.err_code = 0
             response_obj.account_number = str(output)
 
-        return response_obj
+        return response_obj, lsn
 
     def VerifyClientInfo(self, request, context):
         logger.info("Verify client info request received")
         response_obj = bank_pb2.ClientInformationResponse()
         response_obj.present = False
 
-        for client in MyBank.getAllClients():
-            if client.getUsername() == request.username and client.getAccountNumber() == request.account_number and client.checkPassword(request.password):
-                response_obj.present = True
-                logger.info("Client found")
-                break
-        if response_obj.present == False:
+        client = MyBank.getClientByUsername(request.username)
+        if client is not None and client.getAccountNumber() == request.account_number and client.checkPassword(request.password):
+            response_obj.present = True
+            logger.info("Client found")
+        else:
             logger.info("Client not found")
         return response_obj
 
@@ -157,29 +2123,33 @@ class BankServicer(bank_grpc.BankServicer):
         logger.info("Fetch balance request received")
         response_obj = bank_pb2.FetchBalanceResponse()
 
-        clients = MyBank.getAllClients()
-        for client in clients:
-            if client.getAccountNumber() == request.account_number:
-                logger.info(f"Found client; Balance = {client.getBalance()}")
-                response_obj.err_code = 0
-                response_obj.balance = client.getBalance()
-                return response_obj
+        client = MyBank.getClientByAccountNumber(request.account_number)
+        if client is not None:
+            logger.info(f"Found client; Balance = {client.getBalance()}")
+            response_obj.err_code = 0
+            response_obj.balance = client.getBalance()
+            return response_obj
             
         logger.error("Client not found")
         response_obj.err_code = 1
         response_obj.text = "Client not found"
         return response_obj
 
-    def AddBalance(self, request, context):
+    def applyAddBalance(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
         logger.info("Add Balance request received")
 
         client = MyBank.getClientByUsername(request.username)
-        client.credit(request.amount)
+        with client.lock:
+            lsn = 0
+            if client.credit(request.amount) == 0:
+                lsn = MyBank.logOperation({"op": "credit", "account_number": client.getAccountNumber(), "amount": request.amount}, client)
 
         response_obj = bank_pb2.AddBalanceResponse(err_code=0, text="")
-        return response_obj
+        return response_obj, lsn
 
-    def Credit(self, request, context):
+    def applyCredit(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
         logger.info("Credit request received")
 
         response_obj = bank_pb2.AmountTransferResponse()
@@ -188,31 +2158,78 @@ class BankServicer(bank_grpc.BankServicer):
             response_obj.err_code = 1
             response_obj.text = "No such client exist"
             logger.error("No such client exists")
-            return response_obj
+            return response_obj, 0
         
-        err_code = client.credit(request.amount)
-        if err_code == 1:
-            response_obj.err_code = err_code
-            response_obj.text = "Invalid amount"
-            return response_obj
+        fingerprint = requestFingerprint(request) if request.idempotency_key else None
+        credit_key_hash = creditKeyHash(request.transfer_id) if request.transfer_id else None
+        # Hold the account lock so the statement and returned balance match this credit
+        with client.lock:
+            # Retries carry the same key and target the same account, so the lock also orders them
+            if credit_key_hash is not None:
+                # Unlike the idempotency cache, the marker isn't evicted to make room
+                try:
+                    marker = MyBank.reservations.insertIfAbsent(credit_key_hash, (client.account_number, request.amount, NO_COUNTERPARTY, RESERVATION_CREDITED, 0))
+                except ReservationTableFull:
+                    logger.error("Reservation table is full")
+                    response_obj.err_code = 1
+                    response_obj.text = RESERVATION_TABLE_FULL_TEXT
+                    return response_obj, 0
+                if marker is not None:
+                    return self.replayCredit(client, request, marker)
+
+            replay = self.replayTransfer(request, fingerprint, CREDIT_RESULT_TEXTS)
+            if replay is not None:
+                if credit_key_hash is not None:
+                    MyBank.reservations.remove(credit_key_hash)
+                return replay
 
-        now = datetime.datetime.now()
-        formatted_time = now.strftime("%B %d, %Y - %H:%M:%S")
-        if request.type == "deposit":
-            client.addTransaction(f"{GREEN}{formatted_time} : {request.amount} deposited in account{RESET}")
+            err_code = client.credit(request.amount)
+            if err_code == 1:
+                if credit_key_hash is not None:
+                    MyBank.reservations.remove(credit_key_hash)
+                response_obj.err_code = err_code
+                response_obj.text = CREDIT_RESULT_TEXTS[err_code]
+                self.rememberTransfer(request, fingerprint, response_obj, 0)
+                return response_obj, 0
+
+            # Store the raw fields; the statement text is only built when it is read
+            transaction = None
+            if request.type == "deposit":
+                transaction = [time.time(), "deposit"]
             
-        elif request.type == "transfer":
-            client.addTransaction(f"{GREEN}{formatted_time} : {request.amount} credited from {request.sender_username} | Bank id: {request.sender_bank_id} | Acc No: {request.sender_acc_no}{RESET}")
+            elif request.type == "transfer":
+                transaction = [time.time(), "transfer_in", [request.sender_username, request.sender_bank_id, request.sender_acc_no]]
             
-        elif request.type == "reimbursement":
-            client.addTransaction(f"{GREEN}{formatted_time} : {request.amount} recredited in account{RESET}")
+            elif request.type == "reimbursement":
+                transaction = [time.time(), "reimbursement"]
+
+            if transaction is not None:
+                MyBank.recordTransaction(client, request.amount, *transaction)
+            record = {"op": "credit", "account_number": client.getAccountNumber(), "amount": request.amount, "transaction": transaction}
+            if credit_key_hash is not None:
+                record["transfer_id"] = request.transfer_id
+            lsn = MyBank.logOperation(self.withIdempotencyKey(record, request, fingerprint), client)
+            if credit_key_hash is not None:
+                MyBank.reservations.put(credit_key_hash, (client.account_number, request.amount, NO_COUNTERPARTY, RESERVATION_CREDITED, lsn))
         
-        response_obj.err_code = 0
-        response_obj.text = "Amount Credited"
-        response_obj.balance = client.getBalance()
-        return response_obj
+            response_obj.err_code = 0
+            response_obj.text = CREDIT_RESULT_TEXTS[0]
+            response_obj.balance = client.getBalance()
+            self.rememberTransfer(request, fingerprint, response_obj, lsn)
 
-    def Debit(self, request, context):
+        return response_obj, lsn
+
+    def replayCredit(self, client, request, marker):
+        # (response, LSN) of a Credit for a transfer that was already credited
+        account_number, amount, _, _, lsn = marker
+        if account_number != client.account_number or amount != request.amount:
+            logger.error(IDEMPOTENCY_KEY_REUSED)
+            return bank_pb2.AmountTransferResponse(err_code=1, text=IDEMPOTENCY_KEY_REUSED), 0
+        logger.info(f"Replaying credit of transfer {request.transfer_id}")
+        return bank_pb2.AmountTransferResponse(err_code=0, text=CREDIT_RESULT_TEXTS[0], balance=client.getBalance()), lsn
+
+    def applyDebit(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
         logger.info("Debit request received")
 
         response_obj = bank_pb2.AmountTransferResponse()
@@ -222,27 +2239,283 @@ class BankServicer(bank_grpc.BankServicer):
             response_obj.err_code = 1
             response_obj.text = "No such client exist"
             logger.error("No such client exists")
-            return response_obj
+            return response_obj, 0
         
-        err_code = client.debit(request.amount)
-        if err_code == 1:
-            response_obj.err_code = err_code
-            response_obj.text = "Not enough balance in account"
-            return response_obj
+        fingerprint = requestFingerprint(request) if request.idempotency_key else None
+        # Hold the account lock so the statement and returned balance match this debit
+        with client.lock:
+            replay = self.replayTransfer(request, fingerprint, DEBIT_RESULT_TEXTS)
+            if replay is not None:
+                return replay
+
+            err_code = client.debit(request.amount)
+            if err_code == 1:
+                response_obj.err_code = err_code
+                response_obj.text = DEBIT_RESULT_TEXTS[err_code]
+                self.rememberTransfer(request, fingerprint, response_obj, 0)
+                return response_obj, 0
         
-        now = datetime.datetime.now()
-        formatted_time = now.strftime("%B %d, %Y - %H:%M:%S")
+            # Store the raw fields; the statement text is only built when it is read
+            transaction = None
         
-        if request.type == "withdraw":
-            client.addTransaction(f"{RED}{formatted_time} : {request.amount} withdrawn in account{RESET}")
+            if request.type == "withdraw":
+                transaction = [time.time(), "withdraw"]
             
-        elif request.type == "transfer":
-            client.addTransaction(f"{RED}{formatted_time} : {request.amount} debited to {request.receiver_username} | Bank id: {request.receiver_bank_id} | Acc No: {request.receiver_acc_no}{RESET}")
+            elif request.type == "transfer":
+                transaction = [time.time(), "transfer_out", [request.receiver_username, request.receiver_bank_id, request.receiver_acc_no]]
+
+            elif request.type == "bulk_transfer":
+                transaction = [time.time(), "bulk_transfer_out"]
+
+            if transaction is not None:
+                MyBank.recordTransaction(client, request.amount, *transaction)
+            record = {"op": "debit", "account_number": client.getAccountNumber(), "amount": request.amount, "transaction": transaction}
+            lsn = MyBank.logOperation(self.withIdempotencyKey(record, request, fingerprint), client)
         
-        response_obj.err_code = 0
-        response_obj.text = "Amount Debited"
-        response_obj.balance = client.getBalance()
-        return response_obj
+            response_obj.err_code = 0
+            response_obj.text = DEBIT_RESULT_TEXTS[0]
+            response_obj.balance = client.getBalance()
+            self.rememberTransfer(request, fingerprint, response_obj, lsn)
+
+        return response_obj, lsn
+
+    def applyTransfer(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
+        logger.info("Transfer request received")
+
+        response_obj = bank_pb2.AmountTransferResponse()
+        sender = MyBank.getClientByUsername(request.sender_username)
+        if sender is None:
+            response_obj.err_code = 1
+            response_obj.text = "No such client exist"
+            logger.error("No such client exists")
+            return response_obj, 0
+        receiver = MyBank.getClientByUsername(request.receiver_username)
+        if receiver is None or receiver.getAccountNumber() != request.receiver_acc_no:
+            response_obj.err_code = 1
+            response_obj.text = "Recepient not found"
+            logger.error("Recepient not found")
+            return response_obj, 0
+
+        fingerprint = requestFingerprint(request) if request.idempotency_key else None
+        # Both accounts are locked, so nobody sees the money taken from one and not yet added to the other
+        with MyBank.lockAccounts(sender, receiver):
+            replay = self.replayTransfer(request, fingerprint, TRANSFER_RESULT_TEXTS)
+            if replay is not None:
+                return replay
+
+            err_code = sender.debit(request.amount)
+            if err_code == 1:
+                response_obj.err_code = err_code
+                response_obj.text = TRANSFER_RESULT_TEXTS[err_code]
+                self.rememberTransfer(request, fingerprint, response_obj, 0)
+                return response_obj, 0
+            receiver.credit(request.amount)
+
+            timestamp = time.time()
+            sender_transaction = [timestamp, "transfer_out", [request.receiver_username, request.receiver_bank_id, request.receiver_acc_no]]
+            receiver_transaction = [timestamp, "transfer_in", [request.sender_username, request.sender_bank_id, sender.getAccountNumber()]]
+            MyBank.recordTransaction(sender, request.amount, *sender_transaction)
+            MyBank.recordTransaction(receiver, request.amount, *receiver_transaction)
+            record = {
+                "op": "transfer",
+                "sender_account_number": sender.getAccountNumber(),
+                "receiver_account_number": receiver.getAccountNumber(),
+                "amount": request.amount,
+                "sender_transaction": sender_transaction,
+                "receiver_transaction": receiver_transaction
+            }
+            lsn = MyBank.logOperation(self.withIdempotencyKey(record, request, fingerprint), sender, receiver)
+
+            response_obj.err_code = 0
+            response_obj.text = TRANSFER_RESULT_TEXTS[0]
+            response_obj.balance = sender.getBalance()
+            self.rememberTransfer(request, fingerprint, response_obj, lsn)
+
+        logger.info(f"Transferred {request.amount} from {sender.getAccountNumber()} to {receiver.getAccountNumber()}")
+        return response_obj, lsn
+
+    def applyReserve(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
+        logger.info("Reserve request received")
+
+        response_obj = bank_pb2.AmountTransferResponse()
+        client = MyBank.getClientByUsername(request.sender_username)
+        if client is None:
+            response_obj.err_code = 1
+            response_obj.text = "No such client exist"
+            logger.error("No such client exists")
+            return response_obj, 0
+        if request.transfer_id == "":
+            response_obj.err_code = 1
+            response_obj.text = "Missing transfer id"
+            logger.error("Reserve request without a transfer id")
+            return response_obj, 0
+
+        key_hash = keyHash(request.transfer_id)
+        counterparty = [request.receiver_username, request.receiver_bank_id, request.receiver_acc_no]
+        with client.lock:
+            # Taken before the debit, so that an abort arriving meanwhile waits for this lock
+            try:
+                reservation = MyBank.reservations.insertIfAbsent(key_hash, (client.account_number, request.amount, NO_COUNTERPARTY, RESERVATION_HELD, 0))
+            except ReservationTableFull:
+                logger.error("Reservation table is full")
+                response_obj.err_code = 1
+                response_obj.text = RESERVATION_TABLE_FULL_TEXT
+                return response_obj, 0
+            if reservation is not None:
+                return self.replayReserve(client, request, reservation)
+
+            err_code = client.debit(request.amount)
+            if err_code == 1:
+                MyBank.reservations.remove(key_hash)
+                response_obj.err_code = err_code
+                response_obj.text = RESERVE_RESULT_TEXTS[err_code]
+                return response_obj, 0
+
+            record = {
+                "op": "reserve",
+                "transfer_id": request.transfer_id,
+                "account_number": client.getAccountNumber(),
+                "amount": request.amount,
+                "counterparty": counterparty
+            }
+            lsn = MyBank.logOperation(record, client)
+            MyBank.reservations.put(key_hash, (client.account_number, request.amount, MyBank.counterparties.intern(*counterparty), RESERVATION_HELD, lsn))
+
+            response_obj.err_code = 0
+            response_obj.text = RESERVE_RESULT_TEXTS[0]
+            response_obj.balance = client.getBalance()
+
+        logger.info(f"Reserved {request.amount} of account {client.getAccountNumber()} for transfer {request.transfer_id}")
+        return response_obj, lsn
+
+    def replayReserve(self, client, request, reservation):
+        # (response, LSN) of a Reserve whose transfer id is already known
+        account_number, amount, _, state, lsn = reservation
+        if state == RESERVATION_ABORTED:
+            logger.error(f"Transfer {request.transfer_id} was aborted")
+            return bank_pb2.AmountTransferResponse(err_code=1, text=RESERVATION_ABORTED_TEXT), 0
+        if account_number != client.account_number or amount != request.amount:
+            logger.error(IDEMPOTENCY_KEY_REUSED)
+            return bank_pb2.AmountTransferResponse(err_code=1, text=IDEMPOTENCY_KEY_REUSED), 0
+        logger.info(f"Replaying reservation of transfer {request.transfer_id}")
+        return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVE_RESULT_TEXTS[0], balance=client.getBalance()), lsn
+
+    def applyCommitReservation(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
+        logger.info("Commit reservation request received")
+
+        key_hash = keyHash(request.transfer_id)
+        reservation = MyBank.reservations.get(key_hash)
+        if reservation is None:
+            logger.error(f"No reservation for transfer {request.transfer_id}")
+            return bank_pb2.AmountTransferResponse(err_code=1, text=NO_SUCH_RESERVATION_TEXT), 0
+        if reservation[0] == NO_ACCOUNT:
+            logger.error(f"Transfer {request.transfer_id} was aborted")
+            return bank_pb2.AmountTransferResponse(err_code=1, text=RESERVATION_ABORTED_TEXT), 0
+
+        client = MyBank.getClientByAccountNumber(reservation[0])
+        with client.lock:
+            # Read again, a Reserve or an abort may have changed it meanwhile
+            reservation = MyBank.reservations.get(key_hash)
+            if reservation is None:
+                logger.error(f"No reservation for transfer {request.transfer_id}")
+                return bank_pb2.AmountTransferResponse(err_code=1, text=NO_SUCH_RESERVATION_TEXT), 0
+            account_number, amount, counterparty_id, state, lsn = reservation
+            if state == RESERVATION_ABORTED:
+                logger.error(f"Transfer {request.transfer_id} was aborted")
+                return bank_pb2.AmountTransferResponse(err_code=1, text=RESERVATION_ABORTED_TEXT), 0
+            if state == RESERVATION_COMMITTED:
+                logger.info(f"Replaying commit of transfer {request.transfer_id}")
+                return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_COMMITTED_TEXT, balance=client.getBalance()), lsn
+
+            # The money already left the balance; the statement entry is only added now
+            counterparty = list(MyBank.counterparties.get(counterparty_id)) if counterparty_id != NO_COUNTERPARTY else None
+            transaction = [time.time(), "transfer_out", counterparty]
+            MyBank.recordTransaction(client, amount, *transaction)
+            record = {
+                "op": "commit_reservation",
+                "transfer_id": request.transfer_id,
+                "account_number": client.getAccountNumber(),
+                "amount": amount,
+                "transaction": transaction
+            }
+            lsn = MyBank.logOperation(record, client)
+            MyBank.reservations.put(key_hash, (account_number, amount, counterparty_id, RESERVATION_COMMITTED, lsn))
+            balance = client.getBalance()
+
+        logger.info(f"Committed transfer {request.transfer_id}")
+        return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_COMMITTED_TEXT, balance=balance), lsn
+
+    def applyAbortReservation(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
+        logger.info("Abort reservation request received")
+
+        key_hash = keyHash(request.transfer_id)
+        while True:
+            try:
+                reservation = MyBank.reservations.insertIfAbsent(key_hash, (NO_ACCOUNT, 0, NO_COUNTERPARTY, RESERVATION_ABORTED, 0))
+            except ReservationTableFull:
+                logger.error("Reservation table is full")
+                return bank_pb2.AmountTransferResponse(err_code=1, text=RESERVATION_TABLE_FULL_TEXT), 0
+            if reservation is None:
+                # Nothing was reserved; the entry makes a late Reserve for this transfer fail
+                lsn = MyBank.logOperation({"op": "abort_reservation", "transfer_id": request.transfer_id, "account_number": None, "amount": 0})
+                MyBank.reservations.put(key_hash, (NO_ACCOUNT, 0, NO_COUNTERPARTY, RESERVATION_ABORTED, lsn))
+                logger.info(f"Aborted transfer {request.transfer_id} before its reservation")
+                return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_ABORTED_TEXT), lsn
+            if reservation[0] == NO_ACCOUNT:
+                return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_ABORTED_TEXT), reservation[4]
+
+            client = MyBank.getClientByAccountNumber(reservation[0])
+            with client.lock:
+                reservation = MyBank.reservations.get(key_hash)
+                if reservation is None:
+                    # Its Reserve failed meanwhile
+                    continue
+                account_number, amount, counterparty_id, state, lsn = reservation
+                if state == RESERVATION_COMMITTED:
+                    logger.error(f"Transfer {request.transfer_id} was already committed")
+                    return bank_pb2.AmountTransferResponse(err_code=1, text=RESERVATION_COMMITTED_TEXT), 0
+                if state == RESERVATION_ABORTED:
+                    return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_ABORTED_TEXT, balance=client.getBalance()), lsn
+
+                client.credit(amount)
+                record = {"op": "abort_reservation", "transfer_id": request.transfer_id, "account_number": client.getAccountNumber(), "amount": amount}
+                lsn = MyBank.logOperation(record, client)
+                MyBank.reservations.put(key_hash, (account_number, amount, counterparty_id, RESERVATION_ABORTED, lsn))
+                balance = client.getBalance()
+
+            logger.info(f"Aborted transfer {request.transfer_id}, {amount} returned to account {account_number}")
+            return bank_pb2.AmountTransferResponse(err_code=0, text=RESERVATION_ABORTED_TEXT, balance=balance), lsn
+
+    def replayTransfer(self, request, fingerprint, result_texts):
+        # (response, LSN) of an earlier Credit, Debit or Transfer with the same
+        # idempotency key, or None if the request has to be applied
+        if fingerprint is None:
+            return None
+        cached = MyBank.idempotency.get(keyHash(request.idempotency_key))
+        if cached is None:
+            return None
+        cached_fingerprint, err_code, balance, lsn = cached
+        if cached_fingerprint != fingerprint:
+            logger.error(IDEMPOTENCY_KEY_REUSED)
+            return bank_pb2.AmountTransferResponse(err_code=1, text=IDEMPOTENCY_KEY_REUSED), 0
+        # Still waits for the first request's log record to be durable
+        logger.info(f"Replaying result of idempotency key {request.idempotency_key}")
+        return bank_pb2.AmountTransferResponse(err_code=err_code, text=result_texts[err_code], balance=balance), lsn
+
+    def rememberTransfer(self, request, fingerprint, response_obj, lsn):
+        if fingerprint is not None:
+            MyBank.idempotency.put(keyHash(request.idempotency_key), (fingerprint, response_obj.err_code, response_obj.balance, lsn))
+
+    def withIdempotencyKey(self, record, request, fingerprint):
+        # Logged with the operation so that recovery rebuilds the cache
+        if fingerprint is not None:
+            record["idempotency_key"] = request.idempotency_key
+            record["fingerprint"] = fingerprint
+        return record
 
     def GetTransactions(self, request, context):
         logger.info("Get Transactions request received")
@@ -253,9 +2526,124 @@ class BankServicer(bank_grpc.BankServicer):
             response_obj.text = "No such user exist"
             return response_obj
         response_obj.err_code = 0
-        response_obj.transactions.extend(client.getAllTransactions())
+        response_obj.transactions.extend(MyBank.formatTransactions(client))
+        return response_obj
+
+    def StreamTransactions(self, request, context):
+        for page in self.pageTransactions(request):
+            yield page
+            if not context.is_active():
+                break
+
+    def pageTransactions(self, request):
+        logger.info("Stream Transactions request received")
+        client = MyBank.getClientByUsername(request.username)
+        if client is None:
+            yield bank_pb2.TransactionsPage(err_code=1, text="No such user exist")
+            return
+
+        page_size = request.page_size or DEFAULT_TRANSACTIONS_PAGE_SIZE
+        page_size = min(page_size, MAX_TRANSACTIONS_PAGE_SIZE)
+
+        # Stream up to the entries present when the request arrived; later
+        # ones can be fetched by resuming from the returned cursor
+        end = MyBank.countTransactions(client)
+        cursor = min(request.cursor, end)
+        while True:
+            page_end = min(cursor + page_size, end)
+            page = bank_pb2.TransactionsPage(err_code=0, next_cursor=page_end, has_more=page_end < end)
+            page.transactions.extend(MyBank.formatTransactions(client, cursor, page_end))
+            yield page
+            cursor = page_end
+            if cursor >= end:
+                break
+
+    def Aggregate(self, request, context):
+        logger.info("Aggregate request received")
+        response_obj = bank_pb2.AggregateResponse()
+
+        account_number = None
+        if request.account_number != "":
+            client = MyBank.getClientByAccountNumber(request.account_number)
+            if client is None:
+                response_obj.err_code = 1
+                response_obj.text = "Client not found"
+                logger.error("Client not found")
+                return response_obj
+            account_number = client.account_number
+
+        result = MyBank.ledger.aggregate(
+            account_number=account_number,
+            start_time=request.start_time or None,
+            end_time=request.end_time or None,
+            top_n=request.top_n
+        )
+
+        response_obj.err_code = 0
+        response_obj.total_in = result["total_in"]
+        response_obj.total_out = result["total_out"]
+        response_obj.count = result["count"]
+        for day, total_in, total_out, count in result["daily"]:
+            response_obj.daily.add(day=day, total_in=total_in, total_out=total_out, count=count)
+        for timestamp, account, amount, transaction_type in result["largest"]:
+            response_obj.largest.add(timestamp=timestamp, account_number=str(account), amount=amount, type=transaction_type)
         return response_obj
 
+    def applyBulkCredit(self, request):
+        # Applies the change and returns (response, LSN to wait on before replying)
+        logger.info(f"Bulk credit request received for {len(request.legs)} legs")
+        response_obj = bank_pb2.BulkCreditResponse()
+        counterparty = [request.sender_username, request.sender_bank_id, request.sender_acc_no]
+        # Every leg is remembered under its own key, like a Credit
+        fingerprint = requestFingerprint(request) if request.idempotency_key else None
+
+        last_lsn = 0
+        num_credited = 0
+        for index, leg in enumerate(request.legs):
+            result = response_obj.results.add()
+            client = MyBank.getClientByUsername(leg.receiver_username)
+            if client is None or client.getAccountNumber() != leg.receiver_acc_no:
+                result.err_code = 1
+                result.text = "Recepient not found"
+                continue
+            if not (leg.amount > 0 and math.isfinite(leg.amount)):
+                result.err_code = 1
+                result.text = "Invalid amount"
+                continue
+
+            leg_key = f"{request.idempotency_key}/{index}"
+            with client.lock:
+                cached = MyBank.idempotency.get(keyHash(leg_key)) if fingerprint is not None else None
+                if cached is not None:
+                    cached_fingerprint, _, _, lsn = cached
+                    if cached_fingerprint != fingerprint:
+                        logger.error(IDEMPOTENCY_KEY_REUSED)
+                        result.err_code = 1
+                        result.text = IDEMPOTENCY_KEY_REUSED
+                        continue
+                    # Still waits for the first request's log record to be durable
+                    logger.info(f"Replaying credit of idempotency key {leg_key}")
+                else:
+                    client.credit(leg.amount)
+                    transaction = [time.time(), "transfer_in", counterparty]
+                    MyBank.recordTransaction(client, leg.amount, *transaction)
+                    record = {"op": "credit", "account_number": client.getAccountNumber(), "amount": leg.amount, "transaction": transaction}
+                    if fingerprint is not None:
+                        record["idempotency_key"] = leg_key
+                        record["fingerprint"] = fingerprint
+                    lsn = MyBank.logOperation(record, client)
+                    if fingerprint is not None:
+                        MyBank.idempotency.put(keyHash(leg_key), (fingerprint, 0, client.balance, lsn))
+            last_lsn = max(last_lsn, lsn)
+            result.err_code = 0
+            result.text = "Amount Credited"
+            num_credited += 1
+
+        # Every leg is acknowledged together once the last one is durable
+        logger.info(f"Bulk credit done; {num_credited} of {len(request.legs)} legs credited")
+        response_obj.err_code = 0
+        return response_obj, last_lsn
+
     def CheckClientExist(self, request, context):
         logger.info("Check client exists request received")
 
@@ -279,14 +2667,98 @@ class BankServicer(bank_grpc.BankServicer):
         return response_obj
 
 
+class AsyncBankServicer(bank_grpc.BankServicer):
+    """
+    grpc.aio flavour of BankServicer. Account operations only hold a lock
+    for microseconds, so they run directly on the event loop; waiting for
+    the write-ahead log is awaited, and whole-statement formatting and
+    aggregates run in the default executor.
+
+    With --workers the locks and the log are shared with other processes,
+    which may hold a lock or sync the log for as long as they like, so
+    every call then runs in a pool of --max-workers threads instead.
+    """
+    def __init__(self):
+        self.servicer = BankServicer()
+        self.executor = None
+        if isinstance(MyBank, SharedBank):
+            self.executor = futures.ThreadPoolExecutor(max_workers, thread_name_prefix="bank-apply")
+
+    async def _apply(self, apply, request):
+        # Response of a change, once it is durable
+        if self.executor is not None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._applyDurably, apply, request)
+        response_obj, lsn = apply(request)
+        await MyBank.waitDurableAsync(lsn)
+        return response_obj
+
+    def _applyDurably(self, apply, request):
+        response_obj, lsn = apply(request)
+        MyBank.waitDurable(lsn)
+        return response_obj
+
+    async def _read(self, read, request, context):
+        if self.executor is not None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, read, request, context)
+        return read(request, context)
+
+    async def CreateNewClient(self, request, context):
+        return await self._apply(self.servicer.applyCreateNewClient, request)
+
+    async def VerifyClientInfo(self, request, context):
+        return await self._read(self.servicer.VerifyClientInfo, request, context)
+
+    async def FetchBalance(self, request, context):
+        return await self._read(self.servicer.FetchBalance, request, context)
+
+    async def AddBalance(self, request, context):
+        return await self._apply(self.servicer.applyAddBalance, request)
+
+    async def Credit(self, request, context):
+        return await self._apply(self.servicer.applyCredit, request)
+
+    async def Debit(self, request, context):
+        return await self._apply(self.servicer.applyDebit, request)
+
+    async def GetTransactions(self, request, context):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.servicer.GetTransactions, request, context)
+
+    async def StreamTransactions(self, request, context):
+        pages = self.servicer.pageTransactions(request)
+        if self.executor is None:
+            for page in pages:
+                yield page
+            return
+        loop = asyncio.get_running_loop()
+        while (page := await loop.run_in_executor(self.executor, next, pages, None)) is not None:
+            yield page
+
+    async def Aggregate(self, request, context):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.servicer.Aggregate, request, context)
+
+    async def BulkCredit(self, request, context):
+        return await self._apply(self.servicer.applyBulkCredit, request)
+
+    async def CheckClientExist(self, request, context):
+        return await self._read(self.servicer.CheckClientExist, request, context)
+
+    async def Transfer(self, request, context):
+        return await self._apply(self.servicer.applyTransfer, request)
+
+    async def Reserve(self, request, context):
+        return await self._apply(self.servicer.applyReserve, request)
+
+    async def CommitReservation(self, request, context):
+        return await self._apply(self.servicer.applyCommitReservation, request)
+
+    async def AbortReservation(self, request, context):
+        return await self._apply(self.servicer.applyAbortReservation, request)
+
+
 # =========================================================================================
 # Base code generated by ChatGPT + Modified by me (Prompt 1 in README)
 # =========================================================================================
-logging.basicConfig(
-    filename="./server/logs/bank_server.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+LOG_FILE = "./server/logs/bank_server.log"
 
 class LoggingInterceptor(grpc.ServerInterceptor):
     def intercept_service(self, continuation, handler_call_details):
@@ -296,30 +2768,79 @@ class LoggingInterceptor(grpc.ServerInterceptor):
         method_name = handler_call_details.method
         username = metadata.get("username", "Unknown")
 
-        logging.info(f"Received request: {method_name}")
-        logging.info(f"Username: {username}")
+        # Errors are always logged, the rest only for sampled requests
+        sampled = log_pipeline.sampleRequest()
+        if sampled:
+            logging.info(f"Received request: {method_name}")
+            logging.info(f"Username: {username}")
         
         try:
             response = continuation(handler_call_details)
+            if response is not None and not sampled:
+                return unsampledHandler(response)
             return response
         except Exception as e:
             logging.error(f"Error in {method_name}: {str(e)}")
             raise e
 # =========================================================================================
 
+class AsyncLoggingInterceptor(grpc.aio.ServerInterceptor):
+    # Same as LoggingInterceptor for the grpc.aio server
+    async def intercept_service(self, continuation, handler_call_details):
+        metadata = dict(handler_call_details.invocation_metadata)
+
+        # Extract details
+        method_name = handler_call_details.method
+        username = metadata.get("username", "Unknown")
+
+        sampled = log_pipeline.sampleRequest()
+        if sampled:
+            logging.info(f"Received request: {method_name}")
+            logging.info(f"Username: {username}")
+
+        try:
+            response = await continuation(handler_call_details)
+            if response is not None and not sampled:
+                return unsampledHandlerAsync(response)
+            return response
+        except Exception as e:
+            logging.error(f"Error in {method_name}: {str(e)}")
+            raise e
+
 
 def clear_screen():
-    os.system("cls" if os.name == "nt" else "clear")
+    # Only a terminal can be cleared; elsewhere it would just add escape codes to the output
+    if sys.stdout.isatty():
+        os.system("cls" if os.name == "nt" else "clear")
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    bank_grpc.add_BankServicer_to_server(BankServicer(), server)
+def advertisedAddress():
+    # Address reported to the gateway: --advertise-host, or else the address
+    # of the interface routing outwards. Connecting a UDP socket only picks
+    # the route, no packet is sent, so this works without network access
+    if advertise_host:
+        return advertise_host
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))
+            return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
 
-    server.add_insecure_port(f"localhost:{my_port}")
-    server.start()
-    logger.info(f"Bank server started; Port = {my_port}")
+def registerWithGateway():
+    """
+    Registers the bank with the payment gateway, then keeps renewing the
+    lease the gateway grants with heartbeats. The gateway stops routing to
+    the bank once the lease expires; if it no longer knows the bank at all
+    (e.g. after a gateway restart) the bank registers again.
+    """
+    if gateway_port < 0:
+        logger.warning("No payment gateway port given; bank not registered")
+        return
+
+    # Only needed here, so not imported on startup
+    import payment_gateway_pb2
+    import payment_gateway_pb2_grpc as payment_gateway_grpc
 
-    # Registering bank with payment gateway
     root_certificate_relative_path = "../CA/ca.crt"
     file_path = script_dir / root_certificate_relative_path
     with open(file_path, "rb") as f:
@@ -330,23 +2851,148 @@ def serve():
     gateway_stub = payment_gateway_grpc.PaymentGatewayStub(channel)
     request_obj = payment_gateway_pb2.RegisterBankRequest()
     request_obj.port = my_port
-    public_ip = requests.get("https://api64.ipify.org").text
 
     metadata = [
         ("authorization", "bank"),
-        ("ip", public_ip),
+        ("ip", advertisedAddress()),
         ("amount", str(0))
         ]
-    response = gateway_stub.RegisterBank(request_obj, metadata=metadata)
-    if response.err_code == 0:
+
+    while True:
+        # Exponential backoff + jitter until the gateway answers
+        backoff_s = REGISTRATION_INITIAL_BACKOFF_S
+        while True:
+            try:
+                response = gateway_stub.RegisterBank(request_obj, metadata=metadata, timeout=REGISTRATION_TIMEOUT_S, wait_for_ready=True)
+                break
+            except grpc.RpcError as e:
+                logger.warning(f"Could not register with payment gateway ({e.code().name}), retrying in {backoff_s:.1f}s")
+                time.sleep(backoff_s * (0.5 + random.random()))
+                backoff_s = min(2 * backoff_s, REGISTRATION_MAX_BACKOFF_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+            channel.close()
+            return
         logger.info(f"Bank registered successfully with id = {response.id}")
         MyBank.setID(response.id)
+
+        heartbeat_obj = payment_gateway_pb2.BankHeartbeatRequest(id=response.id, port=my_port)
+        lease_s = response.lease_s
+        while lease_s > 0:
+            time.sleep(lease_s / HEARTBEATS_PER_LEASE)
+            try:
+                heartbeat = gateway_stub.BankHeartbeat(heartbeat_obj, metadata=metadata, timeout=REGISTRATION_TIMEOUT_S)
+            except grpc.RpcError as e:
+                logger.warning(f"Heartbeat to payment gateway failed ({e.code().name})")
+                continue
+            if heartbeat.err_code == 1:
+                logger.warning(f"Payment gateway dropped the bank ({heartbeat.text}); registering again")
+                break
+            lease_s = heartbeat.lease_s
+        else:
+            # A gateway without leases keeps the registration forever
+            channel.close()
+            return
+
+def startRegistration():
+    # The port serves right away; RPCs don't depend on the bank id
+    threading.Thread(target=registerWithGateway, name="gateway-registration", daemon=True).start()
+
+def startPreload():
+    # Imports NumPy while the server already answers RPCs, so the first
+    # transaction doesn't wait for it
+    threading.Thread(target=getattr, args=(np, "ndarray"), name="preload", daemon=True).start()
+
+def serve(worker_id=None):
+    # Worker processes share the port and leave registration to the parent
+    options = SERVER_OPTIONS + ([("grpc.so_reuseport", 1)] if worker_id is not None else [])
+    executor = CountingThreadPoolExecutor(max_workers)
+    admission = AdmissionController("Bank", admission_control_mode, max_concurrent_rpcs, min_limit=max_workers, executor=executor)
+    server = grpc.server(executor, interceptors=[AdmissionControlInterceptor(admission), LoggingInterceptor()], options=options,
+                         maximum_concurrent_rpcs=admission.hardLimit())
+    bank_grpc.add_BankServicer_to_server(BankServicer(), server)
+
+    server.add_insecure_port(f"localhost:{my_port}")
+    server.start()
+    if worker_id is not None:
+        logger.info(f"Bank worker {worker_id} started; Port = {my_port}")
     else:
-        logger.error(response.text)
-    channel.close()
+        logger.info(f"Bank server started; Port = {my_port}")
+        startRegistration()
+    startPreload()
 
     server.wait_for_termination()
 
+async def serve_aio(worker_id=None):
+    # Single event loop serving every RPC; see AsyncBankServicer
+    options = SERVER_OPTIONS + ([("grpc.so_reuseport", 1)] if worker_id is not None else [])
+    admission = AdmissionController("Bank", admission_control_mode, max_concurrent_rpcs)
+    server = grpc.aio.server(interceptors=[AsyncAdmissionControlInterceptor(admission), AsyncLoggingInterceptor()], options=options,
+                             maximum_concurrent_rpcs=admission.hardLimit())
+    bank_grpc.add_BankServicer_to_server(AsyncBankServicer(), server)
+
+    server.add_insecure_port(f"localhost:{my_port}")
+    await server.start()
+    if worker_id is not None:
+        logger.info(f"Bank worker {worker_id} started in asyncio mode; Port = {my_port}")
+    else:
+        logger.info(f"Bank server started in asyncio mode; Port = {my_port}")
+        startRegistration()
+    startPreload()
+
+    await server.wait_for_termination()
+
+def startSnapshotter(interval_s):
+    if interval_s > 0:
+        threading.Thread(target=MyBank.snapshotPeriodically, args=(interval_s,), name="snapshotter", daemon=True).start()
+
+def runWorker(worker_id, use_aio):
+    # Entry point of a forked worker; MyBank is the parent's SharedBank
+    log_pipeline.start()
+    try:
+        if use_aio:
+            asyncio.run(serve_aio(worker_id))
+        else:
+            serve(worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_pipeline.close()
+
+def serveWorkers(num_workers, use_aio, snapshot_interval_s):
+    """
+    Forks num_workers processes each running a gRPC server on my_port;
+    with SO_REUSEPORT the kernel spreads connections across them. The
+    parent only registers the bank, takes snapshots and waits.
+    """
+    context = multiprocessing.get_context("fork")
+    workers = []
+    try:
+        for worker_id in range(num_workers):
+            worker = context.Process(target=runWorker, args=(worker_id, use_aio), name=f"bank-worker-{worker_id}")
+            worker.start()
+            workers.append(worker)
+
+        # Stop the workers and free the shared block on termination too
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        # Threads are only started once every worker has been forked
+        log_pipeline.start()
+        startSnapshotter(snapshot_interval_s)
+        startRegistration()
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                logger.error(f"{worker.name} exited with code {worker.exitcode}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        MyBank.wal.close()
+
 if __name__ == "__main__":
     logger.remove()
     logger.add(sys.stdout, format="{time:MMMM D, YYYY - HH:mm:ss} {level} --- <level>{message}</level>")
@@ -354,17 +3000,84 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Start the Bank gRPC Server")
     parser.add_argument("--port", type=int, default=50052, help="Port number to run the gRPC server on")
     parser.add_argument("--gatewayport", type=int, default=-1, help="Port on which payment gateway is listening")
+    parser.add_argument("--advertise-host", default=None, help="Address of this bank reported to the payment gateway (default: address of the outgoing network interface)")
+    parser.add_argument("--wal-durability", choices=WAL_DURABILITY_MODES, default="fsync", help="How write-ahead log commits are made durable")
+    parser.add_argument("--wal-commit-window-ms", type=float, default=WAL_DEFAULT_COMMIT_WINDOW_MS, help="How long the write-ahead log waits to group concurrent commits into one sync")
+    parser.add_argument("--snapshot-interval-s", type=float, default=SNAPSHOT_DEFAULT_INTERVAL_S, help="Seconds between background snapshots of bank state (0 to disable)")
+    parser.add_argument("--recover", action="store_true", help="Recover bank state from the latest snapshot and log, write a fresh snapshot and exit")
+    parser.add_argument("--aio", action="store_true", help="Serve RPCs with grpc.aio on a single event loop instead of a thread pool")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes serving the port, sharing bank state in shared memory")
+    parser.add_argument("--max-accounts", type=int, default=SHARED_DEFAULT_MAX_ACCOUNTS, help="Capacity of the shared account table with --workers, at least twice the accounts at startup")
+    parser.add_argument("--max-transactions", type=int, default=SHARED_DEFAULT_MAX_TRANSACTIONS, help="Capacity of the shared ledger with --workers, at least twice the statement entries at startup")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Directory for the write-ahead log, snapshots and account number leases")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Threads serving RPCs (per worker process)")
+    parser.add_argument("--max-concurrent-rpcs", type=int, default=DEFAULT_MAX_CONCURRENT_RPCS, help="Upper bound of RPCs queued or running; excess load is rejected with RESOURCE_EXHAUSTED")
+    parser.add_argument("--admission-control", choices=ADMISSION_CONTROL_MODES, default="adaptive", help="Adapt the concurrency limit to latency, keep it fixed at --max-concurrent-rpcs, or turn it off")
+    parser.add_argument("--idempotency-ttl-s", type=float, default=DEFAULT_IDEMPOTENCY_TTL_S, help="Seconds the result of a Credit or Debit is kept for replays of its idempotency key")
+    parser.add_argument("--idempotency-max-entries", type=int, default=DEFAULT_IDEMPOTENCY_MAX_ENTRIES, help="Most idempotency keys remembered at once; the oldest are dropped first")
+    parser.add_argument("--log-queue-size", type=int, default=DEFAULT_LOG_QUEUE_SIZE, help="Log records waiting for the writer thread before low-severity ones are dropped")
+    parser.add_argument("--log-max-bytes", type=int, default=DEFAULT_LOG_MAX_BYTES, help="Size at which the log file is rotated (0 to never rotate)")
+    parser.add_argument("--log-backups", type=int, default=DEFAULT_LOG_BACKUPS, help="Rotated log files kept")
+    parser.add_argument("--request-log-sample-rate", type=float, default=1.0, help="Fraction of requests whose INFO logs are written (0 turns them off; errors are always logged)")
 
     args = parser.parse_args()
 
+    # Worker processes start their own log writer thread after the fork
+    global log_pipeline
+    log_pipeline = LogPipeline(LOG_FILE, args.log_queue_size, args.log_max_bytes, args.log_backups, args.request_log_sample_rate)
+    if args.workers <= 1:
+        log_pipeline.start()
+    atexit.register(log_pipeline.close)
+
     global my_port
     my_port = args.port
 
-    global gateway_port
+    global gateway_port, advertise_host
     gateway_port = args.gatewayport
+    advertise_host = args.advertise_host
+
+    global max_workers, max_concurrent_rpcs, admission_control_mode
+    max_workers = args.max_workers
+    max_concurrent_rpcs = args.max_concurrent_rpcs
+    admission_control_mode = args.admission_control
 
     global MyBank
-    MyBank = Bank(my_port)
-    
+    MyBank = Bank(my_port, args.data_dir)
+    MyBank.setIdempotencyCache(IdempotencyCache(args.idempotency_max_entries, args.idempotency_ttl_s))
+    MyBank.setReservationTable(ReservationTable(args.idempotency_ttl_s))
+
+    # Restore state from the latest snapshot and the log after it before accepting requests
+    wal = WriteAheadLog(args.data_dir, f"bank_{my_port}", durability=args.wal_durability, commit_window_ms=args.wal_commit_window_ms)
+    MyBank.setWriteAheadLog(wal)
+    start_time = time.monotonic()
+    num_records = MyBank.recover()
+    recovery_time = time.monotonic() - start_time
+
+    # Worker processes share the recovered state through shared memory
+    if args.workers > 1 and not args.recover:
+        try:
+            MyBank = SharedBank.fromBank(MyBank, args.max_accounts, args.max_transactions)
+        except SharedMemoryTooSmall as e:
+            logger.critical(str(e))
+            sys.exit(1)
+    MyBank.wal.open()
+
+    if args.recover:
+        logger.info(f"Recovered {len(MyBank.getAllClients())} accounts, replayed {num_records} log records in {recovery_time:.2f}s")
+        start_time = time.monotonic()
+        MyBank.writeSnapshot()
+        logger.info(f"Snapshot written in {time.monotonic() - start_time:.2f}s")
+        wal.close()
+        sys.exit(0)
+
     clear_screen()
-    serve()
\ No newline at end of file
+    if len(MyBank.getAllClients()) > 0:
+        logger.info(f"Recovered {len(MyBank.getAllClients())} accounts, replayed {num_records} log records in {recovery_time:.2f}s")
+    if args.workers > 1:
+        serveWorkers(args.workers, args.aio, args.snapshot_interval_s)
+    else:
+        startSnapshotter(args.snapshot_interval_s)
+        if args.aio:
+            asyncio.run(serve_aio())
+        else:
+            serve()
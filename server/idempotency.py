@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_IDEMPOTENCY_TTL_S = 600
+DEFAULT_IDEMPOTENCY_MAX_ENTRIES = 100000
+# How long a retry waits for the first request with the same key to finish
+IDEMPOTENCY_WAIT_TIMEOUT_S = 5
+
+IDEMPOTENCY_KEY_REUSED = "Idempotency key was already used for a different request"
+IDEMPOTENCY_IN_PROGRESS = "A request with this idempotency key is still in progress, try again later"
+
+
+def requestFingerprint(request):
+    # Identifies the request a key was first used with, so that reusing the
+    # key for a different request is refused instead of replayed
+    digest = hashlib.blake2b(request.SerializeToString(deterministic=True), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def keyHash(key):
+    # 64-bit hash of a key, for tables of fixed size entries
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+class _PendingResult:
+    def __init__(self):
+        self.done = threading.Event()
+        self.failed = False
+        self.value = None
+
+
+class IdempotencyCache:
+    """
+    Results of requests by idempotency key, kept for ttl_s seconds and for
+    at most max_entries keys. Every entry lives for the same time, so
+    insertion order is expiry order: expired entries are dropped from the
+    front of the OrderedDict and, once full, the oldest entry makes room.
+    Lookups and inserts are O(1) and memory stays bounded.
+    """
+    def __init__(self, max_entries=DEFAULT_IDEMPOTENCY_MAX_ENTRIES, ttl_s=DEFAULT_IDEMPOTENCY_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (expiry time, value)
+        self.hits = 0
+
+    def _evictExpired(self, now):
+        while self.entries:
+            key, (expiry, _) = next(iter(self.entries.items()))
+            if expiry > now:
+                break
+            del self.entries[key]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self._evictExpired(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def _insert(self, key, value, now):
+        self.entries.pop(key, None)
+        while len(self.entries) >= self.max_entries:
+            self.entries.popitem(last=False)
+        self.entries[key] = (now + self.ttl_s, value)
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self.lock:
+            self._evictExpired(now)
+            self._insert(key, value, now)
+
+    def discard(self, key, value):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is value:
+                del self.entries[key]
+
+    def items(self):
+        now = time.monotonic()
+        with self.lock:
+            self._evictExpired(now)
+            return [(key, value) for key, (_, value) in self.entries.items()]
+
+    def expiringItems(self):
+        # (key, Unix time the entry expires at, value) of every live entry,
+        # oldest first, for saving the cache across a restart
+        now = time.monotonic()
+        wall_offset = time.time() - now
+        with self.lock:
+            self._evictExpired(now)
+            return [(key, expiry + wall_offset, value) for key, (expiry, value) in self.entries.items()]
+
+    def restore(self, key, expires_at, value):
+        # Inserts an entry saved by expiringItems(); must be called in the
+        # order those were returned, before any other put
+        now = time.monotonic()
+        remaining_s = expires_at - time.time()
+        if remaining_s <= 0:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            while len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+            self.entries[key] = (now + min(remaining_s, self.ttl_s), value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _claim(self, key, fingerprint):
+        # Returns (None, entry claimed for this call) for a new key, or
+        # (pending result of the earlier call, None) for a known one
+        now = time.monotonic()
+        with self.lock:
+            self._evictExpired(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                claimed = (fingerprint, _PendingResult())
+                self._insert(key, claimed, now)
+                return None, claimed
+            self.hits += 1
+
+        cached_fingerprint, cached = entry[1]
+        if cached_fingerprint != fingerprint:
+            raise ValueError(IDEMPOTENCY_KEY_REUSED)
+        return cached, None
+
+    def _finish(self, key, claimed, failed):
+        pending = claimed[1]
+        if failed:
+            pending.failed = True
+            self.discard(key, claimed)
+        pending.done.set()
+
+    def execute(self, key, fingerprint, function):
+        """
+        Runs function() once per key and returns its result, also to later
+        calls with the same key. A call arriving while the first one still
+        runs waits for its result. Raises IdempotencyInProgress if that
+        takes longer than IDEMPOTENCY_WAIT_TIMEOUT_S or the first call
+        failed, and ValueError if the key was used with another fingerprint.
+        Failed calls are not remembered, so they can be retried.
+        """
+        cached, claimed = self._claim(key, fingerprint)
+        if cached is not None:
+            if not cached.done.wait(IDEMPOTENCY_WAIT_TIMEOUT_S) or cached.failed:
+                raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+            return cached.value
+
+        failed = True
+        try:
+            claimed[1].value = function()
+            failed = False
+            return claimed[1].value
+        finally:
+            self._finish(key, claimed, failed)
+
+    async def executeAsync(self, key, fingerprint, function):
+        # execute() for a coroutine function, on an event loop. Waiting for
+        # an earlier call still in progress, which is rare, takes a thread
+        # of the default executor instead of blocking the loop
+        cached, claimed = self._claim(key, fingerprint)
+        if cached is not None:
+            if not cached.done.is_set():
+                await asyncio.get_running_loop().run_in_executor(None, cached.done.wait, IDEMPOTENCY_WAIT_TIMEOUT_S)
+            if not cached.done.is_set() or cached.failed:
+                raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+            return cached.value
+
+        failed = True
+        try:
+            claimed[1].value = await function()
+            failed = False
+            return claimed[1].value
+        finally:
+            self._finish(key, claimed, failed)
@@ -0,0 +1,284 @@
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+
+import grpc
+from loguru import logger
+
+DEFAULT_LOG_QUEUE_SIZE = 10000
+DEFAULT_LOG_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 3
+# Most records written with one write() call
+LOG_BATCH_SIZE = 512
+# Below WARNING, records are dropped once the queue is this full, leaving
+# the rest of it for warnings and errors
+LOW_SEVERITY_HIGH_WATER = 0.8
+
+FILE_LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+CONSOLE_LOG_FORMAT = "{time:MMMM D, YYYY - HH:mm:ss} {level} --- <level>{message}</level>"
+
+_CLOSE = object()
+# Whether the request being served was sampled; INFO console logs of
+# requests that weren't are skipped
+_request_sampled = contextvars.ContextVar("request_sampled", default=True)
+
+
+@contextlib.contextmanager
+def requestLogScope(sampled):
+    token = _request_sampled.set(sampled)
+    try:
+        yield
+    finally:
+        _request_sampled.reset(token)
+
+
+def _consoleFilter(record):
+    return record["level"].no >= logging.WARNING or _request_sampled.get()
+
+
+def unsampledHandler(handler):
+    # Serves the RPC of handler with its INFO console logs skipped
+    if handler.unary_unary is not None:
+        behavior = handler.unary_unary
+
+        def unsampled_handler(request, servicer_context):
+            with requestLogScope(False):
+                return behavior(request, servicer_context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            unsampled_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+    if handler.unary_stream is not None:
+        behavior = handler.unary_stream
+
+        def unsampled_stream_handler(request, servicer_context):
+            with requestLogScope(False):
+                yield from behavior(request, servicer_context)
+
+        return grpc.unary_stream_rpc_method_handler(
+            unsampled_stream_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+    return handler
+
+
+def unsampledHandlerAsync(handler):
+    # unsampledHandler for grpc.aio servers
+    if handler.unary_unary is not None:
+        behavior = handler.unary_unary
+
+        async def unsampled_handler(request, servicer_context):
+            with requestLogScope(False):
+                return await behavior(request, servicer_context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            unsampled_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+    if handler.unary_stream is not None:
+        behavior = handler.unary_stream
+
+        async def unsampled_stream_handler(request, servicer_context):
+            with requestLogScope(False):
+                async for response in behavior(request, servicer_context):
+                    yield response
+
+        return grpc.unary_stream_rpc_method_handler(
+            unsampled_stream_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+    return handler
+
+
+class RotatingLogFile:
+    """
+    Log file that is rotated to path.1 .. path.<backups> once it would grow
+    past max_bytes (0 never rotates). Every process of a bank with
+    --workers appends to the same file, so before each write the file is
+    reopened if another process rotated it away.
+    """
+    def __init__(self, path, max_bytes, backups):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+        self.size = 0
+
+    def _open(self):
+        self.file = open(self.path, "ab")
+        self.size = os.fstat(self.file.fileno()).st_size
+
+    def _rotatedAway(self):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.truncate(self.path, 0)
+        self._open()
+
+    def write(self, data):
+        if self.file is None or self._rotatedAway():
+            if self.file is not None:
+                self.file.close()
+            self._open()
+        if self.max_bytes > 0 and self.size > 0 and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class LogPipeline:
+    """
+    Moves all log output off the threads that produce it. Records from
+    stdlib logging (the log file) and messages from loguru (the console) go
+    into one bounded queue, and a background thread writes them in batches:
+    one write and one flush per destination for up to LOG_BATCH_SIZE
+    records.
+
+    Putting a record on the queue never blocks. When the queue is more than
+    LOW_SEVERITY_HIGH_WATER full, records below WARNING are dropped; when
+    it is full, everything is. Dropped records are counted and reported in
+    the log file once there is room again.
+
+    Per-request INFO logs can be sampled with request_sample_rate, the
+    fraction of requests whose routine logs are kept. The logging
+    interceptors decide per request and serve unsampled ones through
+    unsampledHandler. Warnings and errors are always logged.
+    """
+    def __init__(self, log_file, queue_size=DEFAULT_LOG_QUEUE_SIZE, max_bytes=DEFAULT_LOG_MAX_BYTES,
+                 backups=DEFAULT_LOG_BACKUPS, request_sample_rate=1.0):
+        self.log_file = RotatingLogFile(log_file, max_bytes, backups)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.high_water = int(queue_size * LOW_SEVERITY_HIGH_WATER)
+        self.request_sample_rate = request_sample_rate
+        self.formatter = logging.Formatter(FILE_LOG_FORMAT)
+        self.drop_lock = threading.Lock()
+        self.dropped = 0
+        self.writer = None
+
+    def start(self):
+        # Replaces the handlers of the root logger and loguru's sinks. Must
+        # run after any fork, in the process that will log
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+            handler.close()
+        root_logger.addHandler(_PipelineHandler(self))
+        root_logger.setLevel(logging.INFO)
+
+        logger.remove()
+        logger.add(self._putConsole, format=CONSOLE_LOG_FORMAT, filter=_consoleFilter, colorize=sys.stdout.isatty())
+
+        self.writer = threading.Thread(target=self._writeLoop, name="log-writer", daemon=True)
+        self.writer.start()
+        return self
+
+    def sampleRequest(self):
+        # Whether the routine logs of a request should be written
+        return self.request_sample_rate >= 1 or random.random() < self.request_sample_rate
+
+    def put(self, item, level):
+        if level < logging.WARNING and self.queue.qsize() >= self.high_water:
+            self._drop()
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._drop()
+
+    def _drop(self):
+        with self.drop_lock:
+            self.dropped += 1
+
+    def _putConsole(self, message):
+        self.put(message, message.record["level"].no)
+
+    def _writeLoop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = _CLOSE in batch
+            file_lines = []
+            console_lines = []
+            for item in batch:
+                if isinstance(item, logging.LogRecord):
+                    file_lines.append(self.formatter.format(item) + "\n")
+                elif item is not _CLOSE:
+                    console_lines.append(str(item))
+
+            with self.drop_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                file_lines.append(self.formatter.format(logging.makeLogRecord({
+                    "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {dropped} records"
+                })) + "\n")
+
+            try:
+                if file_lines:
+                    self.log_file.write("".join(file_lines).encode("utf-8", "replace"))
+                if console_lines:
+                    sys.stdout.write("".join(console_lines))
+                    sys.stdout.flush()
+            except (OSError, ValueError) as e:
+                sys.stderr.write(f"Could not write logs: {e}\n")
+
+            if closing:
+                return
+
+    def close(self, timeout_s=5):
+        # Writes what is still queued; the pipeline isn't used afterwards
+        if self.writer is None or not self.writer.is_alive():
+            return
+        try:
+            self.queue.put(_CLOSE, timeout=timeout_s)
+        except queue.Full:
+            return
+        self.writer.join(timeout_s)
+        self.log_file.close()
+
+
+class _PipelineHandler(logging.Handler):
+    def __init__(self, pipeline):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def emit(self, record):
+        # Formatting waits for the writer thread; f-string messages are
+        # already complete, and args are resolved here so they can't change.
+        # A traceback is formatted now, before its frames go away
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.pipeline.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        self.pipeline.put(record, record.levelno)
@@ -1,15 +1,93 @@
 import os
+import asyncio
 from concurrent import futures
 from loguru import logger
 import argparse
 import grpc
 import sys
 import json
+import math
+import base64
+import sqlite3
 from pathlib import Path
 import uuid
 import logging
+import time
+import hashlib
+import hmac
+import threading
+import atexit
+from collections import OrderedDict
 
 TIMEOUT_S = 2
+STREAM_TIMEOUT_S = 30   # Deadline for a whole streamed response
+BULK_TIMEOUT_S = 30     # Deadline for crediting one bank's share of a bulk transfer
+BULK_CREDIT_ATTEMPTS = 3        # Tries of one bank's BulkCredit before its legs are reported pending
+BULK_CREDIT_RETRY_DELAY_S = 0.5
+MAX_BULK_TRANSFER_WORKERS = 16
+# err_code of a bulk transfer leg whose BulkCredit never answered, which may or may not have credited it
+LEG_PENDING = 2
+LEG_PENDING_TEXT = "The receiving bank did not confirm the credit; retry with the same idempotency key"
+DEFAULT_BANK_LEASE_S = 6   # How long a bank stays routable after registering or its last heartbeat
+# One long-lived channel per bank, shared by all threads. Keepalive pings
+# notice a dead connection between requests, and reconnect attempts are
+# capped at a short backoff
+BANK_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.initial_reconnect_backoff_ms", 200),
+    ("grpc.max_reconnect_backoff_ms", 2000)
+]
+BANK_CHANNEL_REBUILD_INTERVAL_S = 1   # Fewest seconds between rebuilds of a failing channel
+
+# Gateway state shared by the gateway processes of a host (--state-backend=sqlite)
+STATE_BACKENDS = ["memory", "sqlite"]
+DEFAULT_STATE_DB = Path(__file__).parent / "data" / "gateway_state.sqlite3"
+STATE_POLL_INTERVAL_S = 0.1     # How often a process checks for changes made by the others
+STATE_DB_TIMEOUT_S = 5
+STATE_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    port INTEGER UNIQUE NOT NULL,
+    generation INTEGER NOT NULL,    -- Times the bank registered; a new one means it restarted
+    lease_expiry REAL NOT NULL      -- Unix time
+);
+CREATE TABLE IF NOT EXISTS clients (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    account_number TEXT NOT NULL,
+    bank_id INTEGER NOT NULL REFERENCES banks (id),
+    salt BLOB NOT NULL,
+    password_hash BLOB NOT NULL
+);
+"""
+
+# Transfers between banks, see TransferCoordinator
+DEFAULT_TRANSFER_JOURNAL = Path(__file__).parent / "data" / "gateway_transfers.sqlite3"
+TRANSFER_STALE_S = 10    # A transfer nobody took a step on for this long is finished by recovery
+TRANSFER_RECOVERY_INTERVAL_S = 5
+TRANSFER_RESERVING = "reserving"
+TRANSFER_CREDITING = "crediting"
+TRANSFER_CANCELLED = "The recipient could not be credited; the transfer was cancelled and the amount returned to your account"
+
+# Passwords are kept as salted scrypt hashes (the usual interactive parameters)
+PASSWORD_HASH_N = 2 ** 14
+PASSWORD_HASH_R = 8
+PASSWORD_HASH_P = 1
+PASSWORD_SALT_BYTES = 16
+DEFAULT_AUTH_CACHE_ENTRIES = 10000    # Recently verified logins that skip the hash
+ADMIN_FILE_POLL_INTERVAL_S = 2
+
+# Sessions end after this long without a request, and at the latest this long after login
+DEFAULT_SESSION_IDLE_TTL_S = 30 * 60
+DEFAULT_SESSION_ABSOLUTE_TTL_S = 12 * 60 * 60
+DEFAULT_MAX_SESSIONS = 100000    # The least recently used session is ended beyond this
+SESSION_STATS_INTERVAL_S = 60
+SESSION_EXPIRED_MESSAGE = "Session expired or invalid, please log in again"
+SESSION_TOKEN_MODES = ["store", "signed"]
+SESSION_KEYS_POLL_INTERVAL_S = 2
 
 ROLE_PERMISSIONS = {
     "admin": ["*"],  # Admins can access all RPCs
@@ -20,17 +98,19 @@ ROLE_PERMISSIONS = {
         "/paymentgateway.PaymentGateway/Deposit",
         "/paymentgateway.PaymentGateway/Withdraw",
         "/paymentgateway.PaymentGateway/TransferAmount",
-        "/paymentgateway.PaymentGateway/GetTransactionHistory"
+        "/paymentgateway.PaymentGateway/GetTransactionHistory",
+        "/paymentgateway.PaymentGateway/StreamTransactionHistory",
+        "/paymentgateway.PaymentGateway/BulkTransfer"
     ],
     "bank": [
-        "/paymentgateway.PaymentGateway/RegisterBank"
+        "/paymentgateway.PaymentGateway/RegisterBank",
+        "/paymentgateway.PaymentGateway/BankHeartbeat"
     ],
     "auth": [
         "/paymentgateway.PaymentGateway/Authenticate"
     ]
 }
 
-active_sessions = {}
 
 # Get the absolute path of the current script
 script_dir = Path(__file__).parent
@@ -40,15 +120,17 @@ import bank_pb2
 import bank_pb2_grpc as bank_grpc
 import payment_gateway_pb2
 import payment_gateway_pb2_grpc as payment_gateway_grpc
+from admission_control import (ADMISSION_CONTROL_MODES, DEFAULT_MAX_CONCURRENT_RPCS, DEFAULT_MAX_WORKERS, AdmissionController,
+                               AdmissionControlInterceptor, AsyncAdmissionControlInterceptor, CountingThreadPoolExecutor)
+from log_pipeline import DEFAULT_LOG_BACKUPS, DEFAULT_LOG_MAX_BYTES, DEFAULT_LOG_QUEUE_SIZE, LogPipeline, requestLogScope
+from idempotency import (DEFAULT_IDEMPOTENCY_MAX_ENTRIES, DEFAULT_IDEMPOTENCY_TTL_S, IDEMPOTENCY_IN_PROGRESS, IdempotencyCache,
+                         IdempotencyInProgress, requestFingerprint)
+from transfer_journal import TransferJournal
 
 # =========================================================================================
 # Base code generated by ChatGPT + Modified by me (Prompt 1 in README)
 # =========================================================================================
-logging.basicConfig(
-    filename="./server/logs/payment_gateway_logs.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+LOG_FILE = "./server/logs/payment_gateway_logs.log"
 
 class LoggingInterceptor(grpc.ServerInterceptor):
     def intercept_service(self, continuation, handler_call_details):
@@ -59,29 +141,57 @@ class LoggingInterceptor(grpc.ServerInterceptor):
         # Extract details
         method_name = handler_call_details.method
         session_token = metadata.get("authorization", "Unknown")
-        role, username = active_sessions.get(session_token, ("Unknown", "Unknown"))
         client_ip = metadata.get("ip", "Unknown IP")
         transaction_amount = metadata.get("amount", "N/A")
 
-        logging.info(f"Received request: {method_name}")
-        logging.info(f"Session Token: {session_token}, Role: {role}, Username: {username} Client IP: {client_ip}, Transaction Amount: {transaction_amount}")
+        # Errors are always logged, the rest only for sampled requests
+        sampled = log_pipeline.sampleRequest()
+        if sampled:
+            role, username = getRoleUsername(handler_call_details)
+            if role is None:
+                role, username = "Unknown", "Unknown"
+            logging.info(f"Received request: {method_name}")
+            logging.info(f"Session Token: {session_token}, Role: {role}, Username: {username} Client IP: {client_ip}, Transaction Amount: {transaction_amount}")
         
         # =========================================================================================
         # Base code generated by Claude (Prompt 2 in README)
         # =========================================================================================
         def wrapped_handler(request, servicer_context):
             try:
-                response = handler.unary_unary(request, servicer_context)
+                with requestLogScope(sampled):
+                    response = handler.unary_unary(request, servicer_context)
                 # Now you can access response attributes
                 if hasattr(response, 'err_code') and response.err_code == 1:
                     logging.error(f"Error in response: {response.text if hasattr(response, 'text') else 'No error text'}")
-                else:
+                elif sampled:
                     logging.info(f"Reply: {response.text if hasattr(response, 'text') else 'N/A'}")
                 return response
             except Exception as e:
                 logging.error(f"Error in {method_name}: {str(e)}")
                 raise e
             
+        def wrapped_stream_handler(request, servicer_context):
+            try:
+                num_messages = 0
+                with requestLogScope(sampled):
+                    for response in handler.unary_stream(request, servicer_context):
+                        if hasattr(response, 'err_code') and response.err_code == 1:
+                            logging.error(f"Error in response: {response.text if hasattr(response, 'text') else 'No error text'}")
+                        num_messages += 1
+                        yield response
+                if sampled:
+                    logging.info(f"Reply: streamed {num_messages} messages")
+            except Exception as e:
+                logging.error(f"Error in {method_name}: {str(e)}")
+                raise e
+
+        if handler is not None and handler.unary_stream is not None:
+            return grpc.unary_stream_rpc_method_handler(
+                wrapped_stream_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
         # Return a new unary-unary handler with our wrapped function
         return grpc.unary_unary_rpc_method_handler(
             wrapped_handler,
@@ -90,26 +200,87 @@ class LoggingInterceptor(grpc.ServerInterceptor):
         )
 # =========================================================================================
 
+class AsyncLoggingInterceptor(grpc.aio.ServerInterceptor):
+    # Same as LoggingInterceptor for the grpc.aio gateway
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        metadata = dict(handler_call_details.invocation_metadata)
+
+        # Extract details
+        method_name = handler_call_details.method
+        session_token = metadata.get("authorization", "Unknown")
+        client_ip = metadata.get("ip", "Unknown IP")
+        transaction_amount = metadata.get("amount", "N/A")
+
+        sampled = log_pipeline.sampleRequest()
+        if sampled:
+            role, username = getRoleUsername(handler_call_details)
+            if role is None:
+                role, username = "Unknown", "Unknown"
+            logging.info(f"Received request: {method_name}")
+            logging.info(f"Session Token: {session_token}, Role: {role}, Username: {username} Client IP: {client_ip}, Transaction Amount: {transaction_amount}")
+
+        async def wrapped_handler(request, servicer_context):
+            try:
+                with requestLogScope(sampled):
+                    response = await handler.unary_unary(request, servicer_context)
+                if hasattr(response, 'err_code') and response.err_code == 1:
+                    logging.error(f"Error in response: {response.text if hasattr(response, 'text') else 'No error text'}")
+                elif sampled:
+                    logging.info(f"Reply: {response.text if hasattr(response, 'text') else 'N/A'}")
+                return response
+            except Exception as e:
+                logging.error(f"Error in {method_name}: {str(e)}")
+                raise e
+
+        async def wrapped_stream_handler(request, servicer_context):
+            try:
+                num_messages = 0
+                with requestLogScope(sampled):
+                    async for response in handler.unary_stream(request, servicer_context):
+                        if hasattr(response, 'err_code') and response.err_code == 1:
+                            logging.error(f"Error in response: {response.text if hasattr(response, 'text') else 'No error text'}")
+                        num_messages += 1
+                        yield response
+                if sampled:
+                    logging.info(f"Reply: streamed {num_messages} messages")
+            except Exception as e:
+                logging.error(f"Error in {method_name}: {str(e)}")
+                raise e
+
+        if handler.unary_stream is not None:
+            return grpc.unary_stream_rpc_method_handler(
+                wrapped_stream_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        return grpc.unary_unary_rpc_method_handler(
+            wrapped_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+
 class RegisteredClient:
-    def __init__(self, username, account_number, password):
+    # The password is only kept in credential_store, as a salted hash
+    def __init__(self, username, account_number):
         self.username = username
         self.account_number = account_number
-        self.password = password
         self.bank_id = None
 
     def __eq__(self, value):
-        if type(value) != type(RegisteredClient):
+        if not isinstance(value, RegisteredClient):
             raise ValueError("Only two RegisteredClient classes can be compared")
         if self.username == value.username and \
-           self.account_number == value.account_number and \
-           self.password == value.password:
+           self.account_number == value.account_number:
             return True
         else:
             return False
 
-    def checkPassword(self, password_entered):
-        return self.password == password_entered
-
     def getUsername(self):
         return self.username
     
@@ -123,11 +294,107 @@ class RegisteredClient:
         self.bank_id = id
 
 
+class BankUnavailable(Exception):
+    def __init__(self, bank_id):
+        super().__init__(f"Bank with bank id = {bank_id} is unavailable, try again later")
+
+
+class OutcomeUnknown(Exception):
+    # Carries the response of a request that some bank calls may or may not
+    # have gone through for. The response is not remembered for the
+    # idempotency key, so a retry with the key makes those calls again
+    def __init__(self, response):
+        super().__init__(response.text)
+        self.response = response
+
+
 class RegisteredBank:
     def __init__(self, id, port):
         self.id = id
         self.port = port
         self.registered_clients = []
+        # Requests for the bank fail fast once its lease runs out, until it renews it
+        self.lease_expiry = 0
+        self.healthy = False
+        self.channel_lock = threading.Lock()
+        self.channel = None
+        self.stub = None
+        self.channel_failed = False
+        self.channel_built_at = 0
+        # grpc.aio channel of the --aio gateway, see getAsyncStub()
+        self.async_channel = None
+        self.async_stub = None
+        self.async_channel_stale = False
+        self.async_channel_built_at = 0
+        self.generation = 0     # See SqliteRoutingTable
+
+    def connect(self):
+        # (Re)builds the pooled channel to the bank and starts connecting. A
+        # replaced channel is closed once calls still using it have timed out
+        if use_aio:
+            self.async_channel_stale = True
+            return
+        with self.channel_lock:
+            self._buildChannel()
+
+    def _buildChannel(self):
+        old_channel = self.channel
+        channel = grpc.insecure_channel(f"localhost:{self.port}", options=BANK_CHANNEL_OPTIONS)
+        self.channel = channel
+        self.stub = bank_grpc.BankStub(channel)
+        self.channel_failed = False
+        self.channel_built_at = time.monotonic()
+        channel.subscribe(lambda state: self._onConnectivityChange(channel, state), try_to_connect=True)
+        if old_channel is not None:
+            closer = threading.Timer(2 * STREAM_TIMEOUT_S, old_channel.close)
+            closer.daemon = True
+            closer.start()
+
+    def _onConnectivityChange(self, channel, state):
+        if channel is self.channel and state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            self.channel_failed = True
+
+    def getStub(self):
+        # Stub on the pooled channel. A channel that failed to connect is
+        # rebuilt, at most once per BANK_CHANNEL_REBUILD_INTERVAL_S, so that
+        # a restarted bank is reached without waiting out gRPC's backoff
+        if self.channel_failed and time.monotonic() - self.channel_built_at >= BANK_CHANNEL_REBUILD_INTERVAL_S:
+            with self.channel_lock:
+                if self.channel_failed and time.monotonic() - self.channel_built_at >= BANK_CHANNEL_REBUILD_INTERVAL_S:
+                    logger.info(f"Reconnecting to bank {self.id} at port {self.port}")
+                    self._buildChannel()
+        return self.stub
+
+    def getAsyncStub(self):
+        # getStub() for the --aio gateway. A grpc.aio channel belongs to the
+        # event loop, so it is only built and rebuilt from there: on first
+        # use, after connect() and when it failed to connect
+        now = time.monotonic()
+        failed = self.async_channel is not None and now - self.async_channel_built_at >= BANK_CHANNEL_REBUILD_INTERVAL_S and \
+            self.async_channel.get_state() == grpc.ChannelConnectivity.TRANSIENT_FAILURE
+        if self.async_channel is None or self.async_channel_stale or failed:
+            if failed:
+                logger.info(f"Reconnecting to bank {self.id} at port {self.port}")
+            old_channel = self.async_channel
+            self.async_channel = grpc.aio.insecure_channel(f"localhost:{self.port}", options=BANK_CHANNEL_OPTIONS)
+            self.async_stub = bank_grpc.BankStub(self.async_channel)
+            self.async_channel_stale = False
+            self.async_channel_built_at = now
+            if old_channel is not None:
+                asyncio.get_running_loop().call_later(2 * STREAM_TIMEOUT_S, lambda: asyncio.ensure_future(old_channel.close()))
+        return self.async_stub
+
+    def renewLease(self, lease_s):
+        if not self.healthy:
+            logger.info(f"Bank {self.id} at port {self.port} is available")
+        self.lease_expiry = time.monotonic() + lease_s
+        self.healthy = True
+
+    def isHealthy(self):
+        if self.healthy and time.monotonic() >= self.lease_expiry:
+            self.healthy = False
+            logger.warning(f"Lease of bank {self.id} at port {self.port} expired; failing its requests until it is back")
+        return self.healthy
 
     def getId(self):
         return self.id
@@ -150,10 +417,735 @@ class RegisteredBank:
                 return True
         return False
 
-    def addClient(self, username, account_number, password):
-        new_client = RegisteredClient(username, account_number, password)
+    def addClient(self, username, account_number):
+        # Only through BankRoutingTable.addClient, which indexes the client
+        new_client = RegisteredClient(username, account_number)
         new_client.setBankId(self.id)
         self.registered_clients.append(new_client)
+        return new_client
+
+
+class BankRoutingTable:
+    """
+    Registered banks by id and by port, and registered clients by
+    username, so routing a request is a few dict lookups however many banks
+    and clients there are. Lookups don't lock; registrations take the lock
+    so that a bank or client is added to every index at once, and only
+    once when the same one registers concurrently.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.banks_by_id = {}
+        self.banks_by_port = {}
+        self.clients_by_username = {}
+        self.next_bank_id = 1
+
+    def registerBank(self, port):
+        # Returns the bank at port and whether it is new; new banks get the
+        # next free id. A bank registering again has restarted, so it gets a
+        # new channel either way. It isn't routed to until renewLease()
+        with self.lock:
+            bank = self.banks_by_port.get(port)
+            created = bank is None
+            if created:
+                bank = RegisteredBank(self.next_bank_id, port)
+                self.next_bank_id += 1
+                self.banks_by_id[bank.getId()] = bank
+                self.banks_by_port[port] = bank
+        bank.connect()
+        return bank, created
+
+    def renewLease(self, bank, lease_s):
+        bank.renewLease(lease_s)
+
+    def addClient(self, bank, username, account_number, credential):
+        # Returns the client and whether it is new
+        with self.lock:
+            client = self.clients_by_username.get(username)
+            if client is not None:
+                return client, False
+            client = bank.addClient(username, account_number)
+            self.clients_by_username[username] = client
+        credential_store.addClient(username, credential)
+        return client, True
+
+    def getBank(self, bank_id):
+        return self.banks_by_id.get(bank_id)
+
+    def getBankByPort(self, port):
+        return self.banks_by_port.get(port)
+
+    def getClient(self, username):
+        return self.clients_by_username.get(username)
+
+
+class SqliteRoutingTable(BankRoutingTable):
+    """
+    BankRoutingTable shared by the gateway processes of a host through a
+    SQLite database in WAL mode, so they can all serve one port. Bank and
+    client registrations (with the client's password hash) and bank leases
+    are written to the database. Every process keeps the in-memory indexes
+    as its cache, so routing never waits on the database.
+
+    Changes by other processes are picked up by a thread polling PRAGMA
+    data_version, which changes whenever another connection commits, every
+    STATE_POLL_INTERVAL_S. A lookup that misses checks it right away before
+    giving up. Clients are never removed, so only rows added since the last
+    sync are read; the few bank rows are read in full.
+    """
+    def __init__(self, db_path):
+        super().__init__()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=STATE_DB_TIMEOUT_S, isolation_level=None, check_same_thread=False)
+        self.db_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(STATE_DB_SCHEMA)
+        self.data_version = None
+        self.last_client_seq = 0
+        self.sync()
+        threading.Thread(target=self._pollChanges, name="state-sync", daemon=True).start()
+
+    def _write(self, function):
+        with self.db_lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(self.db)
+                self.db.execute("COMMIT")
+                return result
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def sync(self):
+        with self.sync_lock:
+            with self.db_lock:
+                # Read first: a commit after this point is seen by the next sync
+                self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+                bank_rows = self.db.execute("SELECT id, port, generation, lease_expiry FROM banks").fetchall()
+                client_rows = self.db.execute(
+                    "SELECT seq, username, account_number, bank_id, salt, password_hash FROM clients WHERE seq > ? ORDER BY seq",
+                    (self.last_client_seq,)
+                ).fetchall()
+            for row in bank_rows:
+                self._applyBank(*row)
+            for row in client_rows:
+                self._applyClient(*row)
+
+    def syncIfChanged(self):
+        with self.db_lock:
+            changed = self.db.execute("PRAGMA data_version").fetchone()[0] != self.data_version
+        if changed:
+            self.sync()
+
+    def _pollChanges(self):
+        while True:
+            time.sleep(STATE_POLL_INTERVAL_S)
+            try:
+                self.syncIfChanged()
+            except sqlite3.Error as e:
+                logger.error(f"Could not read gateway state: {e}")
+
+    def _applyBank(self, bank_id, port, generation, lease_expiry):
+        with self.lock:
+            bank = self.banks_by_id.get(bank_id)
+            if bank is None:
+                bank = RegisteredBank(bank_id, port)
+                self.banks_by_id[bank_id] = bank
+                self.banks_by_port[port] = bank
+        if bank.generation != generation:
+            bank.generation = generation
+            bank.connect()
+        # Leases are kept in Unix time in the database and monotonic time in memory
+        remaining_s = lease_expiry - time.time()
+        if remaining_s > 0 and time.monotonic() + remaining_s > bank.lease_expiry:
+            bank.renewLease(remaining_s)
+
+    def _applyClient(self, seq, username, account_number, bank_id, salt, password_hash):
+        with self.lock:
+            if username not in self.clients_by_username:
+                self.clients_by_username[username] = self.banks_by_id[bank_id].addClient(username, account_number)
+        credential_store.addClient(username, Credential("client", salt, password_hash))
+        self.last_client_seq = seq
+
+    def registerBank(self, port):
+        def register(db):
+            row = db.execute("SELECT id FROM banks WHERE port = ?", (port,)).fetchone()
+            if row is None:
+                return db.execute("INSERT INTO banks (port, generation, lease_expiry) VALUES (?, 1, 0)", (port,)).lastrowid, True
+            db.execute("UPDATE banks SET generation = generation + 1 WHERE id = ?", (row[0],))
+            return row[0], False
+
+        bank_id, created = self._write(register)
+        # Connects to the bank, as a change of its generation does in the other processes
+        self.sync()
+        return self.banks_by_id[bank_id], created
+
+    def renewLease(self, bank, lease_s):
+        self._write(lambda db: db.execute("UPDATE banks SET lease_expiry = ? WHERE id = ?", (time.time() + lease_s, bank.getId())))
+        bank.renewLease(lease_s)
+
+    def addClient(self, bank, username, account_number, credential):
+        added = self._write(lambda db: db.execute(
+            "INSERT OR IGNORE INTO clients (username, account_number, bank_id, salt, password_hash) VALUES (?, ?, ?, ?, ?)",
+            (username, account_number, bank.getId(), credential.salt, credential.password_hash)
+        ).rowcount == 1)
+        self.sync()
+        return self.clients_by_username[username], added
+
+    def getBank(self, bank_id):
+        bank = self.banks_by_id.get(bank_id)
+        if bank is None:
+            self.syncIfChanged()
+            bank = self.banks_by_id.get(bank_id)
+        return bank
+
+    def getBankByPort(self, port):
+        bank = self.banks_by_port.get(port)
+        if bank is None:
+            self.syncIfChanged()
+            bank = self.banks_by_port.get(port)
+        return bank
+
+    def getClient(self, username):
+        client = self.clients_by_username.get(username)
+        if client is None:
+            self.syncIfChanged()
+            client = self.clients_by_username.get(username)
+        return client
+
+
+def hashPassword(password, salt):
+    return hashlib.scrypt(password.encode(), salt=salt, n=PASSWORD_HASH_N, r=PASSWORD_HASH_R, p=PASSWORD_HASH_P)
+
+
+class Credential:
+    def __init__(self, role, salt, password_hash):
+        self.role = role
+        self.salt = salt
+        self.password_hash = password_hash
+
+    @classmethod
+    def fromPassword(cls, role, password):
+        salt = os.urandom(PASSWORD_SALT_BYTES)
+        return cls(role, salt, hashPassword(password, salt))
+
+    def checkPassword(self, password_entered):
+        return hmac.compare_digest(hashPassword(password_entered, self.salt), self.password_hash)
+
+
+class CredentialStore:
+    """
+    Credentials of every client and admin by username, so a login is one
+    dict lookup however many users there are. Passwords are stored as
+    salted scrypt hashes. Hashing is deliberately slow, so logins verified
+    recently are remembered in a bounded LRU cache. The cache is keyed by
+    an HMAC of username and password under a per-process secret, so it
+    never holds the password itself. An entry only counts while it points
+    at the current Credential; changing a password invalidates it.
+    """
+    def __init__(self, cache_entries=DEFAULT_AUTH_CACHE_ENTRIES):
+        self.lock = threading.Lock()
+        self.credentials = {}
+        self.admin_entries = {}     # username -> entry of the admin file it was loaded from
+        self.cache_entries = cache_entries
+        self.verified = OrderedDict()
+        self.cache_secret = os.urandom(32)
+
+    def addClient(self, username, credential):
+        with self.lock:
+            self.credentials[username] = credential
+
+    def setAdmins(self, admins):
+        # Entries are {"username", "password"} or {"username", "password_hash"}
+        # with password_hash = "scrypt$<salt hex>$<hash hex>"; only entries
+        # that changed are hashed again
+        credentials = {}
+        for admin in admins:
+            username = admin["username"]
+            previous = self.credentials.get(username)
+            if self.admin_entries.get(username) == admin and previous is not None:
+                credentials[username] = previous
+            elif "password_hash" in admin:
+                _, salt, password_hash = admin["password_hash"].split("$")
+                credentials[username] = Credential("admin", bytes.fromhex(salt), bytes.fromhex(password_hash))
+            else:
+                credentials[username] = Credential.fromPassword("admin", admin["password"])
+
+        with self.lock:
+            for username in self.admin_entries:
+                if username not in credentials and self.credentials[username].role == "admin":
+                    del self.credentials[username]
+            for username, credential in credentials.items():
+                # Clients registered under the same name keep precedence, as before
+                current = self.credentials.get(username)
+                if current is None or current.role == "admin":
+                    self.credentials[username] = credential
+            self.admin_entries = {admin["username"]: admin for admin in admins}
+
+    def isRegistered(self, username):
+        return username in self.credentials
+
+    def authenticate(self, username, password):
+        # Returns the role of the user or None if the credentials are wrong
+        credential = self.credentials.get(username)
+        if credential is None:
+            return None
+
+        cache_key = hmac.new(self.cache_secret, f"{username}\0{password}".encode(), hashlib.sha256).digest()
+        with self.lock:
+            if self.verified.get(cache_key) is credential:
+                self.verified.move_to_end(cache_key)
+                return credential.role
+
+        if not credential.checkPassword(password):
+            return None
+        with self.lock:
+            self.verified[cache_key] = credential
+            self.verified.move_to_end(cache_key)
+            while len(self.verified) > self.cache_entries:
+                self.verified.popitem(last=False)
+        return credential.role
+
+
+class Session:
+    __slots__ = ("role", "username", "created_at", "last_used_at")
+
+    def __init__(self, role, username, now):
+        self.role = role
+        self.username = username
+        self.created_at = now
+        self.last_used_at = now
+
+
+class SessionStore:
+    """
+    Sessions by token, in least recently used order. Every lookup moves the
+    session to the end, so the sessions idle for longest are at the front:
+    expired ones are swept from there on each call, which costs O(1)
+    amortized, and when the store is full the front one is evicted. A
+    session past its absolute TTL is ended when it is next used.
+    """
+    def __init__(self, idle_ttl_s=DEFAULT_SESSION_IDLE_TTL_S, absolute_ttl_s=DEFAULT_SESSION_ABSOLUTE_TTL_S,
+                 max_sessions=DEFAULT_MAX_SESSIONS):
+        self.idle_ttl_s = idle_ttl_s
+        self.absolute_ttl_s = absolute_ttl_s
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _sweep(self, now):
+        while self.sessions:
+            token, session = next(iter(self.sessions.items()))
+            if now - session.last_used_at < self.idle_ttl_s:
+                break
+            del self.sessions[token]
+            self.expired += 1
+
+    def create(self, role, username):
+        # Returns the token of a new session
+        token = str(uuid.uuid4())
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            while len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+            self.sessions[token] = Session(role, username, now)
+            self.created += 1
+        return token
+
+    def lookup(self, token):
+        # Returns (role, username) of a live session, or (None, None)
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            session = self.sessions.get(token)
+            if session is None:
+                return None, None
+            if now - session.created_at >= self.absolute_ttl_s:
+                del self.sessions[token]
+                self.expired += 1
+                return None, None
+            session.last_used_at = now
+            self.sessions.move_to_end(token)
+            return session.role, session.username
+
+    def getStats(self):
+        with self.lock:
+            self._sweep(time.monotonic())
+            count = len(self.sessions)
+            # Tokens and Session objects; usernames are shared with the rest of the gateway
+            sample = next(iter(self.sessions.items()), None)
+            entry_bytes = 0 if sample is None else sys.getsizeof(sample[0]) + sys.getsizeof(sample[1])
+            return {
+                "sessions": count,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "memory_bytes": sys.getsizeof(self.sessions) + count * entry_bytes
+            }
+
+    def reportPeriodically(self):
+        last_stats = None
+        while True:
+            time.sleep(SESSION_STATS_INTERVAL_S)
+            stats = self.getStats()
+            if stats == last_stats:
+                continue
+            logger.info(f"Sessions: {stats['sessions']} active (~{math.ceil(stats['memory_bytes'] / 1024)} KiB), "
+                        f"{stats['created']} created, {stats['expired']} expired, {stats['evicted']} evicted")
+            last_stats = stats
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SignedSessionTokens:
+    """
+    Sessions carried entirely by their token, so that any gateway sharing
+    the keys file can verify a session issued by another one. A token is
+    <key id>.<payload>.<signature>: the payload holds role, username,
+    issue and expiry time and a token id, and the signature is an
+    HMAC-SHA256 over key id and payload.
+
+    The keys file (JSON) names the key new tokens are signed with and every
+    key still accepted, so a key is rotated by adding a new one, making it
+    current and dropping the old one once its tokens have expired. It also
+    holds the revocation list: token ids (with their expiry, after which
+    they are forgotten) and, per username, a time before which all tokens
+    of that user are rejected. The file is reloaded when it changes.
+
+    Only the absolute TTL applies, there is no state to track idle time.
+    Same interface as SessionStore.
+    """
+    def __init__(self, keys_file, absolute_ttl_s=DEFAULT_SESSION_ABSOLUTE_TTL_S):
+        self.keys_file = Path(keys_file)
+        self.absolute_ttl_s = absolute_ttl_s
+        self.current_key_id = None
+        self.keys = {}
+        self.revoked_ids = {}
+        self.revoked_before = {}
+        self.stats_lock = threading.Lock()
+        self.created = 0
+        self.rejected = 0
+        self.load()
+
+    def load(self):
+        with self.keys_file.open("r", encoding="utf-8") as file:
+            config = json.load(file)
+        keys = {key_id: bytes.fromhex(secret) for key_id, secret in config["keys"].items()}
+        if config["current"] not in keys:
+            raise KeyError(f"Current session key {config['current']} is not among the keys")
+        now = time.time()
+        revoked_ids = {entry["jti"]: entry["exp"] for entry in config.get("revoked", []) if entry["exp"] > now}
+        # Swapped in whole, so a request sees either the old or the new settings
+        self.keys = keys
+        self.current_key_id = config["current"]
+        self.revoked_ids = revoked_ids
+        self.revoked_before = dict(config.get("revoked_before", {}))
+
+    def _sign(self, key, signed_part):
+        return hmac.digest(key, signed_part.encode(), "sha256")
+
+    def create(self, role, username):
+        now = time.time()
+        token_id = uuid.uuid4().hex
+        payload = json.dumps({"r": role, "u": username, "iat": int(now), "exp": int(now + self.absolute_ttl_s), "jti": token_id},
+                             separators=(",", ":")).encode()
+        key_id = self.current_key_id
+        signed_part = f"{key_id}.{_b64encode(payload)}"
+        with self.stats_lock:
+            self.created += 1
+        logger.info(f"Issued session token {token_id} for {username}")
+        return f"{signed_part}.{_b64encode(self._sign(self.keys[key_id], signed_part))}"
+
+    def lookup(self, token):
+        # Returns (role, username) of a valid, unexpired and unrevoked token, or (None, None)
+        try:
+            signed_part, signature = token.rsplit(".", 1)
+            key_id, payload = signed_part.split(".", 1)
+            key = self.keys.get(key_id)
+            if key is None or not hmac.compare_digest(self._sign(key, signed_part), _b64decode(signature)):
+                raise ValueError("Bad signature")
+            claims = json.loads(_b64decode(payload))
+            now = time.time()
+            if now >= claims["exp"] or claims["jti"] in self.revoked_ids or \
+               claims["iat"] < self.revoked_before.get(claims["u"], 0):
+                raise ValueError("Expired or revoked")
+            return claims["r"], claims["u"]
+        except (AttributeError, ValueError, KeyError, TypeError):
+            with self.stats_lock:
+                self.rejected += 1
+            return None, None
+
+    def getStats(self):
+        with self.stats_lock:
+            return {
+                "created": self.created,
+                "rejected": self.rejected,
+                "keys": len(self.keys),
+                "revoked": len(self.revoked_ids) + len(self.revoked_before)
+            }
+
+    def reportPeriodically(self):
+        last_stats = None
+        while True:
+            time.sleep(SESSION_STATS_INTERVAL_S)
+            stats = self.getStats()
+            if stats == last_stats:
+                continue
+            logger.info(f"Signed sessions: {stats['created']} issued, {stats['rejected']} rejected, "
+                        f"{stats['keys']} keys, {stats['revoked']} revocations")
+            last_stats = stats
+
+
+class TransferCoordinator:
+    """
+    Runs transfers between two banks as sagas kept in a TransferJournal.
+    The amount is reserved at the sender's bank (TRANSFER_RESERVING), then
+    credited at the receiver's bank (TRANSFER_CREDITING), then the
+    reservation is committed. If the receiver's bank refuses the credit,
+    the reservation is aborted, which gives the money back.
+
+    Every step is journaled before it is taken and every bank call is
+    idempotent. The receiver's bank keeps the transfer id of each credit in
+    its log and snapshots, so a credit sent again is never applied twice,
+    whatever its idempotency cache evicted. A transfer cut short by a crash or an unreachable bank is
+    picked up by recoverPeriodically(), in this or another gateway process
+    sharing the journal, once nobody took a step on it for TRANSFER_STALE_S.
+    Recovery finishes transfers that got as far as the credit and aborts
+    the others. Transfers never wait for each other: each runs in its own
+    request, and their journal writes are committed together.
+    """
+    def __init__(self, journal, stale_s=TRANSFER_STALE_S):
+        self.journal = journal
+        self.stale_s = stale_s
+        # Transfers this process is driving right now, which recovery leaves alone
+        self.active_lock = threading.Lock()
+        self.active = set()
+
+    def _activate(self, transfer_id):
+        with self.active_lock:
+            if transfer_id in self.active:
+                return False
+            self.active.add(transfer_id)
+            return True
+
+    def _deactivate(self, transfer_id):
+        with self.active_lock:
+            self.active.discard(transfer_id)
+
+    def transfer(self, request_obj, transfer_id):
+        """
+        Moves request_obj.amount from the sender to the receiver and returns
+        the response for the client, or None if the sender's bank doesn't
+        support reservations. Raises IdempotencyInProgress if the transfer
+        is being driven elsewhere. Bank errors are raised too; the journal
+        keeps the transfer, and a retry or recovery carries it on.
+        """
+        request_obj.transfer_id = transfer_id
+        request_obj.idempotency_key = f"{transfer_id}/credit"
+        if not self._activate(transfer_id):
+            raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+        try:
+            state = TRANSFER_RESERVING
+            if not self.journal.begin(transfer_id, state, request_obj.SerializeToString()):
+                # A retry of a transfer that didn't finish carries on from its last step
+                entry = self.journal.get(transfer_id) if self.journal.claim(transfer_id, time.time() - self.stale_s) else None
+                if entry is None:
+                    raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+                state, request = entry
+                request_obj = bank_pb2.AmountTransferRequest.FromString(request)
+            return self._drive(transfer_id, state, request_obj)
+        finally:
+            self._deactivate(transfer_id)
+
+    def _drive(self, transfer_id, state, request_obj):
+        if state == TRANSFER_RESERVING:
+            try:
+                response = bankStub(request_obj.sender_bank_id).Reserve(request_obj, timeout=TIMEOUT_S)
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                self.journal.finish(transfer_id)
+                return None
+            if response.err_code == 1:
+                logger.error(response.text)
+                self.journal.finish(transfer_id)
+                return response
+            logger.info(f"Reserved amount of transfer {transfer_id}, balance = {response.balance}")
+            if not self.journal.advance(transfer_id, TRANSFER_CREDITING):
+                # Recovery in another process took it over and may be aborting it
+                raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+        return self._settle(transfer_id, request_obj)
+
+    def _settle(self, transfer_id, request_obj):
+        # Credits the receiver, then commits the reservation, or aborts it if the credit is refused
+        reservation = bank_pb2.ReservationRequest(transfer_id=transfer_id)
+        response = bankStub(request_obj.receiver_bank_id).Credit(request_obj, timeout=TIMEOUT_S)
+        if response.err_code == 1:
+            logger.error(response.text)
+            abort = bankStub(request_obj.sender_bank_id).AbortReservation(reservation, timeout=TIMEOUT_S)
+            if abort.err_code == 1:
+                logger.error(f"Could not abort transfer {transfer_id}: {abort.text}")
+            self.journal.finish(transfer_id)
+            return bank_pb2.AmountTransferResponse(err_code=1, text=TRANSFER_CANCELLED, balance=abort.balance)
+        logger.info(f"Credited successful final balance = {response.balance}")
+
+        commit = bankStub(request_obj.sender_bank_id).CommitReservation(reservation, timeout=TIMEOUT_S)
+        if commit.err_code == 1:
+            # The reservation is gone, so retrying can't help
+            logger.error(f"Could not commit transfer {transfer_id}: {commit.text}")
+        self.journal.finish(transfer_id)
+        response.balance = commit.balance
+        return response
+
+    def _abandon(self, transfer_id, request_obj):
+        # Undoes a transfer that may have been reserved but was not credited
+        try:
+            response = bankStub(request_obj.sender_bank_id).AbortReservation(bank_pb2.ReservationRequest(transfer_id=transfer_id), timeout=TIMEOUT_S)
+            if response.err_code == 1:
+                logger.error(f"Could not abort transfer {transfer_id}: {response.text}")
+        except grpc.RpcError as e:
+            # A bank without reservations can't have reserved anything
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+        self.journal.finish(transfer_id)
+
+    def recover(self):
+        # One pass over the transfers nobody is driving
+        for transfer_id, state, request in self.journal.stale(time.time() - self.stale_s):
+            if not self._activate(transfer_id):
+                continue
+            try:
+                if not self.journal.claim(transfer_id, time.time() - self.stale_s):
+                    continue
+                logger.info(f"Recovering transfer {transfer_id} from step {state}")
+                request_obj = bank_pb2.AmountTransferRequest.FromString(request)
+                if state == TRANSFER_RESERVING:
+                    self._abandon(transfer_id, request_obj)
+                else:
+                    self._settle(transfer_id, request_obj)
+            except (grpc.RpcError, BankUnavailable) as e:
+                logger.warning(f"Transfer {transfer_id} can't be finished yet: {e}")
+            finally:
+                self._deactivate(transfer_id)
+
+    def recoverPeriodically(self, interval_s=TRANSFER_RECOVERY_INTERVAL_S):
+        while True:
+            time.sleep(interval_s)
+            try:
+                self.recover()
+            except sqlite3.Error as e:
+                logger.error(f"Could not read transfer journal: {e}")
+
+
+class AsyncTransferCoordinator(TransferCoordinator):
+    # TransferCoordinator for the --aio gateway, calling banks over grpc.aio
+
+    async def transfer(self, request_obj, transfer_id):
+        request_obj.transfer_id = transfer_id
+        request_obj.idempotency_key = f"{transfer_id}/credit"
+        if not self._activate(transfer_id):
+            raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+        try:
+            state = TRANSFER_RESERVING
+            if not await self.journal.beginAsync(transfer_id, state, request_obj.SerializeToString()):
+                entry = None
+                if await self.journal.claimAsync(transfer_id, time.time() - self.stale_s):
+                    entry = await asyncio.get_running_loop().run_in_executor(None, self.journal.get, transfer_id)
+                if entry is None:
+                    raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+                state, request = entry
+                request_obj = bank_pb2.AmountTransferRequest.FromString(request)
+            return await self._drive(transfer_id, state, request_obj)
+        finally:
+            self._deactivate(transfer_id)
+
+    async def _drive(self, transfer_id, state, request_obj):
+        if state == TRANSFER_RESERVING:
+            try:
+                response = await bankStubAsync(request_obj.sender_bank_id).Reserve(request_obj, timeout=TIMEOUT_S)
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                self.journal.finish(transfer_id)
+                return None
+            if response.err_code == 1:
+                logger.error(response.text)
+                self.journal.finish(transfer_id)
+                return response
+            logger.info(f"Reserved amount of transfer {transfer_id}, balance = {response.balance}")
+            if not await self.journal.advanceAsync(transfer_id, TRANSFER_CREDITING):
+                raise IdempotencyInProgress(IDEMPOTENCY_IN_PROGRESS)
+        return await self._settle(transfer_id, request_obj)
+
+    async def _settle(self, transfer_id, request_obj):
+        reservation = bank_pb2.ReservationRequest(transfer_id=transfer_id)
+        response = await bankStubAsync(request_obj.receiver_bank_id).Credit(request_obj, timeout=TIMEOUT_S)
+        if response.err_code == 1:
+            logger.error(response.text)
+            abort = await bankStubAsync(request_obj.sender_bank_id).AbortReservation(reservation, timeout=TIMEOUT_S)
+            if abort.err_code == 1:
+                logger.error(f"Could not abort transfer {transfer_id}: {abort.text}")
+            self.journal.finish(transfer_id)
+            return bank_pb2.AmountTransferResponse(err_code=1, text=TRANSFER_CANCELLED, balance=abort.balance)
+        logger.info(f"Credited successful final balance = {response.balance}")
+
+        commit = await bankStubAsync(request_obj.sender_bank_id).CommitReservation(reservation, timeout=TIMEOUT_S)
+        if commit.err_code == 1:
+            logger.error(f"Could not commit transfer {transfer_id}: {commit.text}")
+        self.journal.finish(transfer_id)
+        response.balance = commit.balance
+        return response
+
+    async def _abandon(self, transfer_id, request_obj):
+        try:
+            response = await bankStubAsync(request_obj.sender_bank_id).AbortReservation(
+                bank_pb2.ReservationRequest(transfer_id=transfer_id), timeout=TIMEOUT_S)
+            if response.err_code == 1:
+                logger.error(f"Could not abort transfer {transfer_id}: {response.text}")
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+        self.journal.finish(transfer_id)
+
+    async def recover(self):
+        loop = asyncio.get_running_loop()
+        for transfer_id, state, request in await loop.run_in_executor(None, self.journal.stale, time.time() - self.stale_s):
+            if not self._activate(transfer_id):
+                continue
+            try:
+                if not await self.journal.claimAsync(transfer_id, time.time() - self.stale_s):
+                    continue
+                logger.info(f"Recovering transfer {transfer_id} from step {state}")
+                request_obj = bank_pb2.AmountTransferRequest.FromString(request)
+                if state == TRANSFER_RESERVING:
+                    await self._abandon(transfer_id, request_obj)
+                else:
+                    await self._settle(transfer_id, request_obj)
+            except (grpc.RpcError, BankUnavailable) as e:
+                logger.warning(f"Transfer {transfer_id} can't be finished yet: {e}")
+            finally:
+                self._deactivate(transfer_id)
+
+    async def recoverPeriodically(self, interval_s=TRANSFER_RECOVERY_INTERVAL_S):
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self.recover()
+            except sqlite3.Error as e:
+                logger.error(f"Could not read transfer journal: {e}")
 
 
 class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
@@ -163,8 +1155,7 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
 
         if role is not None:
             logger.info(f"User authenticated; role = {role}")
-            session_token = str(uuid.uuid4())
-            active_sessions[session_token] = (role, request.username)
+            session_token = session_store.create(role, request.username)
 
             # Attach session token to response metadata
             context.send_initial_metadata([("authorization", session_token)])
@@ -194,35 +1185,34 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
             response_obj.text = "Username already taken"
             return response_obj
         
-        with grpc.insecure_channel(f"localhost:{getBankPortById(bank_id=request.new_client_bank_id)}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(request.new_client_bank_id)
 
-            request_obj = bank_pb2.CreateNewClientRequest()
-            request_obj.username = request.new_client_username
-            request_obj.password = request.new_client_password
-            request_obj.initial_balance = request.initial_balance
+        request_obj = bank_pb2.CreateNewClientRequest()
+        request_obj.username = request.new_client_username
+        request_obj.password = request.new_client_password
+        request_obj.initial_balance = request.initial_balance
 
-            response = bank_stub.CreateNewClient(request_obj, timeout=TIMEOUT_S)
-            response_obj.err_code = response.err_code
-            response_obj.text = response.text
-            response_obj.account_number = response.account_number
+        response = bank_stub.CreateNewClient(request_obj, timeout=TIMEOUT_S)
+        response_obj.err_code = response.err_code
+        response_obj.text = response.text
+        response_obj.account_number = response.account_number
 
-            if response.err_code == 1:
-                logger.error("Failed to create new client")
+        if response.err_code == 1:
+            logger.error("Failed to create new client")
+        else:
+            logger.info("New client successfully created")
+            register_client_request = payment_gateway_pb2.RegisterClientRequest()
+            register_client_request.username = request.new_client_username
+            register_client_request.account_number = response.account_number
+            register_client_request.password = request.new_client_password
+            register_client_request.bank_id = request.new_client_bank_id
+            register_client_response = self.RegisterClient(request=register_client_request, context=context)
+            if register_client_response.err_code == 1:
+                logger.error(register_client_response.text)
             else:
-                logger.info("New client successfully created")
-                register_client_request = payment_gateway_pb2.RegisterClientRequest()
-                register_client_request.username = request.new_client_username
-                register_client_request.account_number = response.account_number
-                register_client_request.password = request.new_client_password
-                register_client_request.bank_id = request.new_client_bank_id
-                register_client_response = self.RegisterClient(request=register_client_request, context=context)
-                if register_client_response.err_code == 1:
-                    logger.error(register_client_response.text)
-                else:
-                    logger.info("New Client registered successfully")
+                logger.info("New Client registered successfully")
 
-            return response_obj
+        return response_obj
 
     def AdminAccessAddBalance(self, request, context):
         logger.info("Add balance request received")
@@ -236,21 +1226,19 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
             return response_obj
         
         client_bank_id = client.getBankId()
-        client_bank_port = getBankPortById(client_bank_id)
 
-        with grpc.insecure_channel(f"localhost:{client_bank_port}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(client_bank_id)
 
-            response = bank_stub.AddBalance(request, timeout=TIMEOUT_S)
+        response = bank_stub.AddBalance(request, timeout=TIMEOUT_S)
 
-            response_obj = response
+        response_obj = response
 
-            if response.err_code == 1:
-                logger.error("Balance not added")
-            else:
-                logger.info("Balance added successfully")
+        if response.err_code == 1:
+            logger.error("Balance not added")
+        else:
+            logger.info("Balance added successfully")
 
-            return response_obj
+        return response_obj
 
     def RegisterClient(self, request, context):
         logger.info("Registration request for client received")
@@ -269,133 +1257,166 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
             return response_obj
         
         else:
-            bank_port = getBankPortById(bank_id=request.bank_id)
-            with grpc.insecure_channel(f"localhost:{bank_port}") as channel:
-                bank_stub = bank_grpc.BankStub(channel)
-
-                request_obj = bank_pb2.ClientInformationRequest()
-                request_obj.account_number = str(request.account_number)
-                request_obj.username = str(request.username)
-                request_obj.password = str(request.password)
-
-                response = bank_stub.VerifyClientInfo(request_obj, timeout=TIMEOUT_S)
-
-                if response.present:
-                    bank = [bank for bank in registered_banks if bank.getId() == request.bank_id][0]
-                    bank.addClient(request.username, request.account_number, request.password)
-                    response_obj.err_code = 0
-                    response_obj.text = f"Client {request.username} registered successfully"
-                    logger.info(f"Client {request.username} registered successfully")
-                    return response_obj
-                else:
-                    response_obj.err_code = 1
-                    response_obj.text = f"Client {request.username} not registered with bank bank_id = {request.bank_id}"
-                    logger.error(f"Client {request.username} not registered with bank bank_id = {request.bank_id}")
-                    return response_obj
+            bank_stub = bankStub(request.bank_id)
+
+            request_obj = bank_pb2.ClientInformationRequest()
+            request_obj.account_number = str(request.account_number)
+            request_obj.username = str(request.username)
+            request_obj.password = str(request.password)
+
+            response = bank_stub.VerifyClientInfo(request_obj, timeout=TIMEOUT_S)
+
+            if response.present:
+                # Hashed before the client becomes visible, so that it can log in right away
+                credential = Credential.fromPassword("client", request.password)
+                routing_table.addClient(getBank(request.bank_id), request.username, request.account_number, credential)
+                response_obj.err_code = 0
+                response_obj.text = f"Client {request.username} registered successfully"
+                logger.info(f"Client {request.username} registered successfully")
+                return response_obj
+            else:
+                response_obj.err_code = 1
+                response_obj.text = f"Client {request.username} not registered with bank bank_id = {request.bank_id}"
+                logger.error(f"Client {request.username} not registered with bank bank_id = {request.bank_id}")
+                return response_obj
     
     def RegisterBank(self, request, context):
         logger.info("Registration request for bank received")
         response_obj = payment_gateway_pb2.RegisterBankResponse()
         try:
-            if not isBankRegistered(bank_port=request.port):
-                if registered_banks == []:
-                    new_id = 1
-                else:
-                    new_id = max([bank.getId() for bank in registered_banks]) + 1
-                
-                new_bank = RegisteredBank(new_id, request.port)
-                registered_banks.append(new_bank)
+            # A bank restarted on the same port keeps its id and clients
+            bank, created = routing_table.registerBank(request.port)
+            routing_table.renewLease(bank, bank_lease_s)
 
-                response_obj.err_code = 0
+            response_obj.err_code = 0
+            response_obj.id = bank.getId()
+            response_obj.lease_s = bank_lease_s
+            if created:
                 response_obj.text = "Bank successfully registered"
-                response_obj.id = new_id
-                logger.info(f"New bank registered successfully with id = {new_id}")
-                return response_obj
+                logger.info(f"New bank registered successfully with id = {bank.getId()}")
             else:
-                response_obj.err_code = 0
                 response_obj.text = f"Bank at port {request.port} already registered"
-                for bank in registered_banks:
-                    if bank.getPort() == request.port:
-                        response_obj.id = bank.getId()
-                        break
                 logger.info(f"Bank at port {request.port} was already registered")
-                return response_obj
+            return response_obj
         except Exception as e:
             response_obj.err_code = 1
             response_obj.text = f"Exception: {e}"
             logger.error(f"Exception: {e}")
             return response_obj
 
+    def BankHeartbeat(self, request, context):
+        response_obj = payment_gateway_pb2.BankHeartbeatResponse()
+        bank = getBank(request.id)
+        if bank is None or bank.getPort() != request.port:
+            response_obj.err_code = 1
+            response_obj.text = f"No bank with id = {request.id} at port {request.port}"
+            logger.warning(response_obj.text)
+            return response_obj
+
+        routing_table.renewLease(bank, bank_lease_s)
+        response_obj.err_code = 0
+        response_obj.lease_s = bank_lease_s
+        return response_obj
+
     def CheckBalance(self, request, context):
         logger.info("Check Balance request received")
         response_obj = payment_gateway_pb2.CheckBalanceResponse()
         
         client = getClient(username=getActiveSessionUsername(context))
 
-        with grpc.insecure_channel(f"localhost:{getBankPortById(client.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(client.getBankId())
 
-            request_obj = bank_pb2.FetchBalanceRequest()
-            request_obj.account_number = client.getAccountNumber()
+        request_obj = bank_pb2.FetchBalanceRequest()
+        request_obj.account_number = client.getAccountNumber()
 
-            response = bank_stub.FetchBalance(request_obj, timeout=TIMEOUT_S)
+        response = bank_stub.FetchBalance(request_obj, timeout=TIMEOUT_S)
 
-            if response.err_code == 1:
-                logger.error(response.text)
-                response_obj.err_code = 1
-                response_obj.text = response.text
-            else:
-                logger.info(f"Balance = {response.balance}")
-                response_obj.err_code = 0
-                response_obj.balance = response.balance
-            
-            return response_obj
+        if response.err_code == 1:
+            logger.error(response.text)
+            response_obj.err_code = 1
+            response_obj.text = response.text
+        else:
+            logger.info(f"Balance = {response.balance}")
+            response_obj.err_code = 0
+            response_obj.balance = response.balance
+        
+        return response_obj
 
     def Deposit(self, request, context):
+        return self.runIdempotent(request, context, self.applyDeposit)
+
+    def Withdraw(self, request, context):
+        return self.runIdempotent(request, context, self.applyWithdraw)
+
+    def TransferAmount(self, request, context):
+        return self.runIdempotent(request, context, self.applyTransferAmount)
+
+    def runIdempotent(self, request, context, apply, response_class=payment_gateway_pb2.TransferAmountResponse):
+        # A retry with the idempotency key of an earlier request gets that
+        # request's response instead of moving money again
+        if request.idempotency_key == "":
+            try:
+                return apply(request, context)
+            except OutcomeUnknown as e:
+                return e.response
+
+        # Keys are per user, so nobody can replay someone else's response
+        key = f"{getActiveSessionUsername(context)}/{request.idempotency_key}"
+        try:
+            return idempotency_cache.execute(key, requestFingerprint(request), lambda: apply(request, context))
+        except ValueError as e:
+            logger.error(str(e))
+            return response_class(err_code=1, text=str(e))
+        except IdempotencyInProgress as e:
+            context.abort(grpc.StatusCode.ABORTED, str(e))
+        except OutcomeUnknown as e:
+            return e.response
+
+    def applyDeposit(self, request, context):
         logger.info("Deposit Request Received")
         username = getActiveSessionUsername(context)
         client = getClient(username)
 
-        with grpc.insecure_channel(f"localhost:{getBankPortById(client.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(client.getBankId())
 
-            request_obj = bank_pb2.AmountTransferRequest()
-            request_obj.receiver_username = username
-            request_obj.amount = request.amount
-            request_obj.type = "deposit"
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.receiver_username = username
+        request_obj.amount = request.amount
+        request_obj.type = "deposit"
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "credit")
 
-            response = bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+        response = bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
 
-            if response.err_code == 1:
-                logger.error(response.text)
-            else:
-                logger.info(f"Deposit successful final balance = {response.balance}")
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Deposit successful final balance = {response.balance}")
             
         return response
     
-    def Withdraw(self, request, context):
+    def applyWithdraw(self, request, context):
         logger.info("Withdraw Request Received")
         username = getActiveSessionUsername(context)
         client = getClient(username)
 
-        with grpc.insecure_channel(f"localhost:{getBankPortById(client.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(client.getBankId())
 
-            request_obj = bank_pb2.AmountTransferRequest()
-            request_obj.sender_username = username
-            request_obj.amount = request.amount
-            request_obj.type = "withdraw"
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.sender_username = username
+        request_obj.amount = request.amount
+        request_obj.type = "withdraw"
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "debit")
 
-            response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+        response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
 
-            if response.err_code == 1:
-                logger.error(response.text)
-            else:
-                logger.info(f"Withdrawn successful final balance = {response.balance}")
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Withdrawn successful final balance = {response.balance}")
             
         return response
 
-    def TransferAmount(self, request, context):
+    def applyTransferAmount(self, request, context):
         logger.info("Transfer Request Received")
         response_obj = bank_pb2.AmountTransferResponse()
 
@@ -414,6 +1435,11 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
 
         final_balance = 0
 
+        if request.receiver_bank_id == my_client_obj.getBankId():
+            response = self.transferWithinBank(request_obj, request, context)
+            if response is not None:
+                return response
+
         # Check if receiver exists
         if not check_client_exist(request.receiver_bank_id, request.receiver_username, request.receiver_acc_no):
             logger.error("Recepient not found")
@@ -421,197 +1447,1034 @@ class PaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
             response_obj.text = "Recepient not found"
             return response_obj
 
+        response = transfer_coordinator.transfer(request_obj, transferId(request, context))
+        if response is not None:
+            return response
+
+        # The sender's bank has no reservations: debit, credit, and refund a failed credit
         debit_successful = False
 
         # First debiting the amount
-        with grpc.insecure_channel(f"localhost:{getBankPortById(my_client_obj.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(my_client_obj.getBankId())
 
-            response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "debit")
+        response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
 
-            if response.err_code == 1:
-                logger.error(response.text)
-                return response
-            else:
-                debit_successful = True
-                logger.info(f"Debited successful final balance = {response.balance}")
-                final_balance = response.balance
+        if response.err_code == 1:
+            logger.error(response.text)
+            return response
+        else:
+            debit_successful = True
+            logger.info(f"Debited successful final balance = {response.balance}")
+            final_balance = response.balance
         
         if debit_successful:
             # First debiting the amount
-            with grpc.insecure_channel(f"localhost:{getBankPortById(request.receiver_bank_id)}") as channel:
-                bank_stub = bank_grpc.BankStub(channel)
+            bank_stub = bankStub(request.receiver_bank_id)
 
-                response = bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+            request_obj.idempotency_key = bankIdempotencyKey(request, context, "credit")
+            response = bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
 
-                if response.err_code == 1:
-                    logger.error(response.text)
-                else:
-                    logger.info(f"Credited successful final balance = {response.balance}")
-                    response.balance = final_balance
-                    return response
+            if response.err_code == 1:
+                logger.error(response.text)
+            else:
+                logger.info(f"Credited successful final balance = {response.balance}")
+                response.balance = final_balance
+                return response
         
         # Credit failed, returning money to sender's account
-        with grpc.insecure_channel(f"localhost:{getBankPortById(my_client_obj.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
-            request_obj.type = "reimbursement"
-            response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+        bank_stub = bankStub(my_client_obj.getBankId())
+
+        refund_obj = bank_pb2.AmountTransferRequest()
+        refund_obj.receiver_username = my_username
+        refund_obj.amount = request.amount
+        refund_obj.type = "reimbursement"
+        refund_obj.idempotency_key = bankIdempotencyKey(request, context, "refund")
+        response = bank_stub.Credit(refund_obj, timeout=TIMEOUT_S)
         response_obj.err_code = 1
         response_obj.text = "Failed to tranfer the money, if any money is debited from your account it should be credited soon."
 
         return response_obj
 
+    def transferWithinBank(self, request_obj, request, context):
+        # Sender and receiver share a bank, which checks the recipient and
+        # moves the money in one call. None if the bank predates Transfer
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "transfer")
+        try:
+            response = bankStub(request_obj.sender_bank_id).Transfer(request_obj, timeout=TIMEOUT_S)
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+            return None
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Transferred within bank {request_obj.sender_bank_id}, final balance = {response.balance}")
+        return response
+
     def GetTransactionHistory(self, request, context):
         logger.info("Get transaction history request received")
         
         client = getClient(username=getActiveSessionUsername(context))
 
-        with grpc.insecure_channel(f"localhost:{getBankPortById(client.getBankId())}") as channel:
-            bank_stub = bank_grpc.BankStub(channel)
+        bank_stub = bankStub(client.getBankId())
 
-            request_obj = bank_pb2.TransactionsRequest()
-            request_obj.username = client.getUsername()
+        request_obj = bank_pb2.TransactionsRequest()
+        request_obj.username = client.getUsername()
 
-            response = bank_stub.GetTransactions(request_obj, timeout=TIMEOUT_S)
+        response = bank_stub.GetTransactions(request_obj, timeout=TIMEOUT_S)
 
-            if response.err_code == 1:
-                logger.error(response.text)
-            else:
-                logger.info(f"Successfully retrieved transaction history")
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Successfully retrieved transaction history")
             
         return response
 
 
-class AuthenticationInterceptor(grpc.ServerInterceptor):
-    def intercept_service(self, continuation, handler_call_details):
-        role, _ = getRoleUsername(handler_call_details)
+    def StreamTransactionHistory(self, request, context):
+        logger.info("Stream transaction history request received")
 
-        allowed_methods = ROLE_PERMISSIONS.get(role)
-        if "*" not in allowed_methods and handler_call_details.method not in allowed_methods:
-            return self._deny_access("Permission denied")
-            
-        return continuation(handler_call_details)
+        client = getClient(username=getActiveSessionUsername(context))
 
-    def deny_access(self, message):
-        def abort(ignored_request, context):
-            context.abort(grpc.StatusCode.PERMISSION_DENIED, message)
-        return abort
+        bank_stub = bankStub(client.getBankId())
 
+        request_obj = bank_pb2.TransactionsPageRequest()
+        request_obj.username = client.getUsername()
+        request_obj.cursor = request.cursor
+        request_obj.page_size = request.page_size
 
-def check_client_exist(bank_id, username, acc_no):
-    with grpc.insecure_channel(f"localhost:{getBankPortById(bank_id)}") as channel:
-        bank_stub = bank_grpc.BankStub(channel)
+        # Relay each page as soon as the bank sends it, without buffering the history
+        num_pages = 0
+        for page in bank_stub.StreamTransactions(request_obj, timeout=STREAM_TIMEOUT_S):
+            if page.err_code == 1:
+                logger.error(page.text)
+            num_pages += 1
+            yield payment_gateway_pb2.TransactionHistoryPage(
+                err_code=page.err_code,
+                text=page.text,
+                transactions=page.transactions,
+                next_cursor=page.next_cursor,
+                has_more=page.has_more
+            )
 
-        request_obj = bank_pb2.CheckClientExistRequest()
-        request_obj.username = username
-        request_obj.acc_no = acc_no
+        logger.info(f"Successfully streamed transaction history in {num_pages} pages")
 
-        response = bank_stub.CheckClientExist(request_obj, timeout=TIMEOUT_S)
 
-        if response.err_code == 1:
-            logger.error(response.text)
-            return False
-        else:
-            logger.info(f"Client {username} in bank {bank_id} exists.")
-            return True
+    def BulkTransfer(self, request, context):
+        return self.runIdempotent(request, context, self.applyBulkTransfer, payment_gateway_pb2.BulkTransferResponse)
 
+    def applyBulkTransfer(self, request, context):
+        logger.info(f"Bulk transfer request received with {len(request.legs)} legs")
+        response_obj = payment_gateway_pb2.BulkTransferResponse()
 
-def getActiveSessionUsername(context):
-    metadata = dict(context.invocation_metadata())
-    session_token = metadata.get("authorization")
-    role, username = active_sessions.get(session_token, (None, None))
-    return username
+        my_username = getActiveSessionUsername(context)
+        my_client_obj = getClient(my_username)
 
+        # Group valid legs by receiving bank; the rest fail without touching any bank
+        legs_by_bank = {}
+        results = [None] * len(request.legs)
+        total = 0.0
+        for index, leg in enumerate(request.legs):
+            if not (leg.amount > 0 and math.isfinite(leg.amount)):
+                results[index] = (1, "Invalid amount")
+            elif not isBankRegistered(bank_id=leg.receiver_bank_id):
+                results[index] = (1, f"Invalid bank with bank id = {leg.receiver_bank_id}")
+            elif not getBank(leg.receiver_bank_id).isHealthy():
+                results[index] = (1, str(BankUnavailable(leg.receiver_bank_id)))
+            else:
+                legs_by_bank.setdefault(leg.receiver_bank_id, []).append(index)
+                total += leg.amount
 
-def getRoleUsername(handler_call_details):
-    metadata = dict(handler_call_details.invocation_metadata)
-    session_token = metadata.get("authorization")
-    if session_token == "auth":
-        return "auth", "auth"
-    elif session_token == "bank":
-        return "bank", "bank"
-    role, username = active_sessions.get(session_token, (None, None))
-    return role, username
+        if total <= 0:
+            response_obj.err_code = 1
+            response_obj.text = "No valid legs to transfer"
+            response_obj.results.extend(payment_gateway_pb2.TransferLegResult(index=index, err_code=err_code, text=text) for index, (err_code, text) in enumerate(results))
+            logger.error("No valid legs to transfer")
+            return response_obj
 
+        # Every bank call gets a key derived from the request's, so retries,
+        # by the client or below, never move money twice
+        bulk_id = bankIdempotencyKey(request, context, "bulk") or uuid.uuid4().hex
 
-def clear_screen():
-    os.system("cls" if os.name == "nt" else "clear")
+        # Debit the sender once for the whole batch
+        bank_stub = bankStub(my_client_obj.getBankId())
 
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.sender_username = my_username
+        request_obj.amount = total
+        request_obj.type = "bulk_transfer"
+        request_obj.idempotency_key = f"{bulk_id}/debit"
 
-registered_banks = []
+        response = bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+        if response.err_code == 1:
+            logger.error(response.text)
+            response_obj.err_code = 1
+            response_obj.text = response.text
+            return response_obj
+        final_balance = response.balance
+
+        # Credit every bank's share concurrently
+        def credit_bank(bank_id, leg_indices):
+            # Leg results of one bank, or None if it may have credited them without answering
+            request_obj = bank_pb2.BulkCreditRequest()
+            request_obj.sender_username = my_username
+            request_obj.sender_bank_id = my_client_obj.getBankId()
+            request_obj.sender_acc_no = my_client_obj.getAccountNumber()
+            request_obj.idempotency_key = f"{bulk_id}/credit/{bank_id}"
+            for index in leg_indices:
+                leg = request.legs[index]
+                request_obj.legs.add(receiver_username=leg.receiver_username, receiver_acc_no=leg.receiver_acc_no, amount=leg.amount)
+
+            for attempt in range(BULK_CREDIT_ATTEMPTS):
+                if attempt > 0:
+                    time.sleep(BULK_CREDIT_RETRY_DELAY_S)
+                try:
+                    response = bankStub(bank_id).BulkCredit(request_obj, timeout=BULK_TIMEOUT_S)
+                    return [(result.err_code, result.text) for result in response.results]
+                except BankUnavailable:
+                    # Nothing was sent if this is the first try
+                    if attempt == 0:
+                        raise
+                    break
+                except grpc.RpcError as e:
+                    logger.error(f"Bulk credit to bank {bank_id} failed (try {attempt + 1} of {BULK_CREDIT_ATTEMPTS}): {e.code()}")
+            return None
+
+        with futures.ThreadPoolExecutor(max_workers=min(len(legs_by_bank), MAX_BULK_TRANSFER_WORKERS)) as executor:
+            pending = {executor.submit(credit_bank, bank_id, leg_indices): leg_indices for bank_id, leg_indices in legs_by_bank.items()}
+            for future, leg_indices in pending.items():
+                try:
+                    bank_results = future.result()
+                except BankUnavailable as e:
+                    logger.error(f"Bulk credit failed: {e}")
+                    bank_results = [(1, "Receiving bank unavailable")] * len(leg_indices)
+                if bank_results is None:
+                    bank_results = [(LEG_PENDING, LEG_PENDING_TEXT)] * len(leg_indices)
+                for index, result in zip(leg_indices, bank_results):
+                    results[index] = result
+
+        # Refund the sender for every leg that was debited but not credited.
+        # Only once no leg is pending: until then the refund could differ
+        # between retries, and a retry would be refused its key
+        refund = sum(request.legs[index].amount for indices in legs_by_bank.values() for index in indices if results[index][0] == 1)
+        unconfirmed = sum(request.legs[index].amount for indices in legs_by_bank.values() for index in indices if results[index][0] == LEG_PENDING)
+        if unconfirmed > 0:
+            unconfirmed += refund
+            refund = 0
+        elif refund > 0:
+            bank_stub = bankStub(my_client_obj.getBankId())
 
-admins = []
+            request_obj = bank_pb2.AmountTransferRequest()
+            request_obj.receiver_username = my_username
+            request_obj.amount = refund
+            request_obj.type = "reimbursement"
+            request_obj.idempotency_key = f"{bulk_id}/refund"
 
-def read_admins():
-    admin_details_file_realtive_path = "admin_details.json"
-    file_path = script_dir / admin_details_file_realtive_path
-    with file_path.open("r", encoding="utf-8") as file:
-        global admins
-        admins = json.load(file)
+            response = bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+            if response.err_code == 1:
+                logger.error(f"Failed to refund {refund} to {my_username}: {response.text}")
+            else:
+                final_balance = response.balance
 
+        response_obj.err_code = 0
+        response_obj.text = "Bulk transfer processed"
+        response_obj.balance = final_balance
+        response_obj.total_transferred = total - refund - unconfirmed
+        response_obj.total_refunded = refund
+        response_obj.total_pending = unconfirmed
+        response_obj.results.extend(payment_gateway_pb2.TransferLegResult(index=index, err_code=err_code, text=text) for index, (err_code, text) in enumerate(results))
+        if unconfirmed > 0:
+            # Not remembered for the key, so that a retry finishes the transfer
+            response_obj.text = "Bulk transfer incomplete; retry with the same idempotency key"
+            logger.error(f"Bulk transfer incomplete; transferred = {total - unconfirmed}, pending = {unconfirmed}")
+            raise OutcomeUnknown(response_obj)
+        logger.info(f"Bulk transfer done; transferred = {total - refund}, refunded = {refund}")
+        return response_obj
 
-def getClient(username=None):
-    for bank in registered_banks:
-        for client in bank.getAllClients():
-            if client.getUsername() == username:
-                return client
-    return None
 
+class AsyncPaymentGatewayServicer(payment_gateway_grpc.PaymentGatewayServicer):
+    """
+    grpc.aio flavour of PaymentGatewayServicer (--aio). Calls to banks are
+    awaited on their grpc.aio channels, so a slow bank no longer holds a
+    thread, and the credits of a bulk transfer run concurrently on the
+    event loop. Password hashing runs in the default executor. RPCs that
+    never call a bank are served by PaymentGatewayServicer.
+    """
+    def __init__(self):
+        self.servicer = PaymentGatewayServicer()
 
-def isBankRegistered(bank_id=None, bank_port=None):
-    if bank_port is None and bank_id is not None:
-        for bank in registered_banks:
-            if bank.getId() == bank_id:
-                return True
-    elif bank_id is None and bank_port is not None:
-        for bank in registered_banks:
-            if bank.getPort() == bank_port:
-                return True
-    return False
+    async def Authenticate(self, request, context):
+        logger.info("Authentication Request Received")
+        role = await asyncio.get_running_loop().run_in_executor(None, getRole, request.username, request.password)
 
+        if role is not None:
+            logger.info(f"User authenticated; role = {role}")
+            session_token = session_store.create(role, request.username)
 
-def getBankIdForClient(username=None):
-    for bank in registered_banks:
-        for client in bank.getAllClients():
-            if client.getUsername() == username:
-                return bank.getId()
-    return -1
+            # Attach session token to response metadata
+            await context.send_initial_metadata([("authorization", session_token)])
 
+            return payment_gateway_pb2.AuthResponse(err_code=0, text="", role=role)
 
-def isUsernameRegistered(username=None):
-    for bank in registered_banks:
-        for client in bank.getAllClients():
-            if client.getUsername() == username:
-                return True
+        logger.error("Authentication failed")
+        context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+        context.set_details("Invalid credentials")
+        return payment_gateway_pb2.AuthResponse(err_code=1, text="Authentication Failed", role="")
+
+    async def AdminAccessCreateNewClient(self, request, context):
+        logger.info("Create new client request received")
+        response_obj = payment_gateway_pb2.CreateNewClientResponse()
+
+        # Check if the bank exists
+        if not isBankRegistered(request.new_client_bank_id):
+            logger.error(f"Invalid bank with bank id = {request.new_client_bank_id}")
+            response_obj.err_code = 1
+            response_obj.text = f"Invalid bank with bank id = {request.new_client_bank_id}"
+            return response_obj
+
+        # Check if username already exists
+        if isUsernameRegistered(request.new_client_username):
+            logger.error(f"Username already taken")
+            response_obj.err_code = 1
+            response_obj.text = "Username already taken"
+            return response_obj
+
+        bank_stub = bankStubAsync(request.new_client_bank_id)
+
+        request_obj = bank_pb2.CreateNewClientRequest()
+        request_obj.username = request.new_client_username
+        request_obj.password = request.new_client_password
+        request_obj.initial_balance = request.initial_balance
+
+        response = await bank_stub.CreateNewClient(request_obj, timeout=TIMEOUT_S)
+        response_obj.err_code = response.err_code
+        response_obj.text = response.text
+        response_obj.account_number = response.account_number
+
+        if response.err_code == 1:
+            logger.error("Failed to create new client")
+        else:
+            logger.info("New client successfully created")
+            register_client_request = payment_gateway_pb2.RegisterClientRequest()
+            register_client_request.username = request.new_client_username
+            register_client_request.account_number = response.account_number
+            register_client_request.password = request.new_client_password
+            register_client_request.bank_id = request.new_client_bank_id
+            register_client_response = await self.RegisterClient(request=register_client_request, context=context)
+            if register_client_response.err_code == 1:
+                logger.error(register_client_response.text)
+            else:
+                logger.info("New Client registered successfully")
+
+        return response_obj
+
+    async def AdminAccessAddBalance(self, request, context):
+        logger.info("Add balance request received")
+        response_obj = payment_gateway_pb2.AddBalanceResponse()
+
+        client = getClient(request.username)
+        if client is None:
+            logger.error("Client not registered")
+            response_obj.err_code = 1
+            response_obj.text = "Client not registered"
+            return response_obj
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        response = await bank_stub.AddBalance(request, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error("Balance not added")
+        else:
+            logger.info("Balance added successfully")
+
+        return response
+
+    async def RegisterClient(self, request, context):
+        logger.info("Registration request for client received")
+        response_obj = payment_gateway_pb2.RegisterClientResponse()
+
+        if not isBankRegistered(bank_id=request.bank_id):
+            response_obj.err_code = 1
+            response_obj.text = f"No bank with given bank id"
+            logger.error("No bank with given id exists")
+            return response_obj
+
+        if getClient(username=request.username) is not None:
+            response_obj.err_code = 0
+            response_obj.text = f"Client {request.username} already registered"
+            logger.info(f"Client {request.username} already registered")
+            return response_obj
+
+        bank_stub = bankStubAsync(request.bank_id)
+
+        request_obj = bank_pb2.ClientInformationRequest()
+        request_obj.account_number = str(request.account_number)
+        request_obj.username = str(request.username)
+        request_obj.password = str(request.password)
+
+        response = await bank_stub.VerifyClientInfo(request_obj, timeout=TIMEOUT_S)
+
+        if not response.present:
+            response_obj.err_code = 1
+            response_obj.text = f"Client {request.username} not registered with bank bank_id = {request.bank_id}"
+            logger.error(f"Client {request.username} not registered with bank bank_id = {request.bank_id}")
+            return response_obj
+
+        # Hashed before the client becomes visible, so that it can log in right away
+        credential = await asyncio.get_running_loop().run_in_executor(None, Credential.fromPassword, "client", request.password)
+        routing_table.addClient(getBank(request.bank_id), request.username, request.account_number, credential)
+        response_obj.err_code = 0
+        response_obj.text = f"Client {request.username} registered successfully"
+        logger.info(f"Client {request.username} registered successfully")
+        return response_obj
+
+    async def RegisterBank(self, request, context):
+        return self.servicer.RegisterBank(request, context)
+
+    async def BankHeartbeat(self, request, context):
+        return self.servicer.BankHeartbeat(request, context)
+
+    async def CheckBalance(self, request, context):
+        logger.info("Check Balance request received")
+        response_obj = payment_gateway_pb2.CheckBalanceResponse()
+
+        client = getClient(username=getActiveSessionUsername(context))
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        request_obj = bank_pb2.FetchBalanceRequest()
+        request_obj.account_number = client.getAccountNumber()
+
+        response = await bank_stub.FetchBalance(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+            response_obj.err_code = 1
+            response_obj.text = response.text
+        else:
+            logger.info(f"Balance = {response.balance}")
+            response_obj.err_code = 0
+            response_obj.balance = response.balance
+
+        return response_obj
+
+    async def Deposit(self, request, context):
+        return await self.runIdempotent(request, context, self.applyDeposit)
+
+    async def Withdraw(self, request, context):
+        return await self.runIdempotent(request, context, self.applyWithdraw)
+
+    async def TransferAmount(self, request, context):
+        return await self.runIdempotent(request, context, self.applyTransferAmount)
+
+    async def runIdempotent(self, request, context, apply, response_class=payment_gateway_pb2.TransferAmountResponse):
+        # See PaymentGatewayServicer.runIdempotent
+        if request.idempotency_key == "":
+            try:
+                return await apply(request, context)
+            except OutcomeUnknown as e:
+                return e.response
+
+        key = f"{getActiveSessionUsername(context)}/{request.idempotency_key}"
+        try:
+            return await idempotency_cache.executeAsync(key, requestFingerprint(request), lambda: apply(request, context))
+        except ValueError as e:
+            logger.error(str(e))
+            return response_class(err_code=1, text=str(e))
+        except IdempotencyInProgress as e:
+            await context.abort(grpc.StatusCode.ABORTED, str(e))
+        except OutcomeUnknown as e:
+            return e.response
+
+    async def applyDeposit(self, request, context):
+        logger.info("Deposit Request Received")
+        username = getActiveSessionUsername(context)
+        client = getClient(username)
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.receiver_username = username
+        request_obj.amount = request.amount
+        request_obj.type = "deposit"
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "credit")
+
+        response = await bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Deposit successful final balance = {response.balance}")
+
+        return response
+
+    async def applyWithdraw(self, request, context):
+        logger.info("Withdraw Request Received")
+        username = getActiveSessionUsername(context)
+        client = getClient(username)
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.sender_username = username
+        request_obj.amount = request.amount
+        request_obj.type = "withdraw"
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "debit")
+
+        response = await bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Withdrawn successful final balance = {response.balance}")
+
+        return response
+
+    async def applyTransferAmount(self, request, context):
+        # Each step depends on the one before: nothing is debited for a
+        # recipient that doesn't exist, and the refund only follows a failed credit
+        logger.info("Transfer Request Received")
+        response_obj = bank_pb2.AmountTransferResponse()
+
+        my_username = getActiveSessionUsername(context)
+        my_client_obj = getClient(my_username)
+
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.sender_username = my_username
+        request_obj.receiver_username = request.receiver_username
+        request_obj.sender_bank_id = my_client_obj.getBankId()
+        request_obj.receiver_bank_id = request.receiver_bank_id
+        request_obj.sender_acc_no = my_client_obj.getAccountNumber()
+        request_obj.receiver_acc_no = request.receiver_acc_no
+        request_obj.amount = request.amount
+        request_obj.type = "transfer"
+
+        if request.receiver_bank_id == my_client_obj.getBankId():
+            response = await self.transferWithinBank(request_obj, request, context)
+            if response is not None:
+                return response
+
+        # Check if receiver exists
+        if not await check_client_exist_async(request.receiver_bank_id, request.receiver_username, request.receiver_acc_no):
+            logger.error("Recepient not found")
+            response_obj.err_code = 1
+            response_obj.text = "Recepient not found"
+            return response_obj
+
+        response = await transfer_coordinator.transfer(request_obj, transferId(request, context))
+        if response is not None:
+            return response
+
+        # The sender's bank has no reservations: debit, credit, and refund a failed credit
+        bank_stub = bankStubAsync(my_client_obj.getBankId())
+
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "debit")
+        response = await bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+            return response
+        logger.info(f"Debited successful final balance = {response.balance}")
+        final_balance = response.balance
+
+        bank_stub = bankStubAsync(request.receiver_bank_id)
+
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "credit")
+        response = await bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Credited successful final balance = {response.balance}")
+            response.balance = final_balance
+            return response
+
+        # Credit failed, returning money to sender's account
+        bank_stub = bankStubAsync(my_client_obj.getBankId())
+
+        refund_obj = bank_pb2.AmountTransferRequest()
+        refund_obj.receiver_username = my_username
+        refund_obj.amount = request.amount
+        refund_obj.type = "reimbursement"
+        refund_obj.idempotency_key = bankIdempotencyKey(request, context, "refund")
+        response = await bank_stub.Credit(refund_obj, timeout=TIMEOUT_S)
+        response_obj.err_code = 1
+        response_obj.text = "Failed to tranfer the money, if any money is debited from your account it should be credited soon."
+
+        return response_obj
+
+    async def transferWithinBank(self, request_obj, request, context):
+        request_obj.idempotency_key = bankIdempotencyKey(request, context, "transfer")
+        try:
+            response = await bankStubAsync(request_obj.sender_bank_id).Transfer(request_obj, timeout=TIMEOUT_S)
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+            return None
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Transferred within bank {request_obj.sender_bank_id}, final balance = {response.balance}")
+        return response
+
+    async def GetTransactionHistory(self, request, context):
+        logger.info("Get transaction history request received")
+
+        client = getClient(username=getActiveSessionUsername(context))
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        request_obj = bank_pb2.TransactionsRequest()
+        request_obj.username = client.getUsername()
+
+        response = await bank_stub.GetTransactions(request_obj, timeout=TIMEOUT_S)
+
+        if response.err_code == 1:
+            logger.error(response.text)
+        else:
+            logger.info(f"Successfully retrieved transaction history")
+
+        return response
+
+    async def StreamTransactionHistory(self, request, context):
+        logger.info("Stream transaction history request received")
+
+        client = getClient(username=getActiveSessionUsername(context))
+
+        bank_stub = bankStubAsync(client.getBankId())
+
+        request_obj = bank_pb2.TransactionsPageRequest()
+        request_obj.username = client.getUsername()
+        request_obj.cursor = request.cursor
+        request_obj.page_size = request.page_size
+
+        # Relay each page as soon as the bank sends it, without buffering the history
+        num_pages = 0
+        async for page in bank_stub.StreamTransactions(request_obj, timeout=STREAM_TIMEOUT_S):
+            if page.err_code == 1:
+                logger.error(page.text)
+            num_pages += 1
+            yield payment_gateway_pb2.TransactionHistoryPage(
+                err_code=page.err_code,
+                text=page.text,
+                transactions=page.transactions,
+                next_cursor=page.next_cursor,
+                has_more=page.has_more
+            )
+
+        logger.info(f"Successfully streamed transaction history in {num_pages} pages")
+
+    async def BulkTransfer(self, request, context):
+        return await self.runIdempotent(request, context, self.applyBulkTransfer, payment_gateway_pb2.BulkTransferResponse)
+
+    async def applyBulkTransfer(self, request, context):
+        logger.info(f"Bulk transfer request received with {len(request.legs)} legs")
+        response_obj = payment_gateway_pb2.BulkTransferResponse()
+
+        my_username = getActiveSessionUsername(context)
+        my_client_obj = getClient(my_username)
+
+        # Group valid legs by receiving bank; the rest fail without touching any bank
+        legs_by_bank = {}
+        results = [None] * len(request.legs)
+        total = 0.0
+        for index, leg in enumerate(request.legs):
+            if not (leg.amount > 0 and math.isfinite(leg.amount)):
+                results[index] = (1, "Invalid amount")
+            elif not isBankRegistered(bank_id=leg.receiver_bank_id):
+                results[index] = (1, f"Invalid bank with bank id = {leg.receiver_bank_id}")
+            elif not getBank(leg.receiver_bank_id).isHealthy():
+                results[index] = (1, str(BankUnavailable(leg.receiver_bank_id)))
+            else:
+                legs_by_bank.setdefault(leg.receiver_bank_id, []).append(index)
+                total += leg.amount
+
+        if total <= 0:
+            response_obj.err_code = 1
+            response_obj.text = "No valid legs to transfer"
+            response_obj.results.extend(payment_gateway_pb2.TransferLegResult(index=index, err_code=err_code, text=text) for index, (err_code, text) in enumerate(results))
+            logger.error("No valid legs to transfer")
+            return response_obj
+
+        # See PaymentGatewayServicer.applyBulkTransfer
+        bulk_id = bankIdempotencyKey(request, context, "bulk") or uuid.uuid4().hex
+
+        # Debit the sender once for the whole batch
+        bank_stub = bankStubAsync(my_client_obj.getBankId())
+
+        request_obj = bank_pb2.AmountTransferRequest()
+        request_obj.sender_username = my_username
+        request_obj.amount = total
+        request_obj.type = "bulk_transfer"
+        request_obj.idempotency_key = f"{bulk_id}/debit"
+
+        response = await bank_stub.Debit(request_obj, timeout=TIMEOUT_S)
+        if response.err_code == 1:
+            logger.error(response.text)
+            response_obj.err_code = 1
+            response_obj.text = response.text
+            return response_obj
+        final_balance = response.balance
+
+        # Credit every bank's share concurrently
+        async def credit_bank(bank_id, leg_indices):
+            # Leg results of one bank, or None if it may have credited them without answering
+            request_obj = bank_pb2.BulkCreditRequest()
+            request_obj.sender_username = my_username
+            request_obj.sender_bank_id = my_client_obj.getBankId()
+            request_obj.sender_acc_no = my_client_obj.getAccountNumber()
+            request_obj.idempotency_key = f"{bulk_id}/credit/{bank_id}"
+            for index in leg_indices:
+                leg = request.legs[index]
+                request_obj.legs.add(receiver_username=leg.receiver_username, receiver_acc_no=leg.receiver_acc_no, amount=leg.amount)
+
+            for attempt in range(BULK_CREDIT_ATTEMPTS):
+                if attempt > 0:
+                    await asyncio.sleep(BULK_CREDIT_RETRY_DELAY_S)
+                try:
+                    response = await bankStubAsync(bank_id).BulkCredit(request_obj, timeout=BULK_TIMEOUT_S)
+                    return [(result.err_code, result.text) for result in response.results]
+                except BankUnavailable:
+                    # Nothing was sent if this is the first try
+                    if attempt == 0:
+                        raise
+                    break
+                except grpc.RpcError as e:
+                    logger.error(f"Bulk credit to bank {bank_id} failed (try {attempt + 1} of {BULK_CREDIT_ATTEMPTS}): {e.code()}")
+            return None
+
+        bank_results = await asyncio.gather(*(credit_bank(bank_id, leg_indices) for bank_id, leg_indices in legs_by_bank.items()),
+                                            return_exceptions=True)
+        for leg_indices, result in zip(legs_by_bank.values(), bank_results):
+            if isinstance(result, BankUnavailable):
+                logger.error(f"Bulk credit failed: {result}")
+                result = [(1, "Receiving bank unavailable")] * len(leg_indices)
+            elif isinstance(result, BaseException):
+                raise result
+            elif result is None:
+                result = [(LEG_PENDING, LEG_PENDING_TEXT)] * len(leg_indices)
+            for index, leg_result in zip(leg_indices, result):
+                results[index] = leg_result
+
+        # Refund the sender for every leg that was debited but not credited,
+        # once no leg is pending
+        refund = sum(request.legs[index].amount for indices in legs_by_bank.values() for index in indices if results[index][0] == 1)
+        unconfirmed = sum(request.legs[index].amount for indices in legs_by_bank.values() for index in indices if results[index][0] == LEG_PENDING)
+        if unconfirmed > 0:
+            unconfirmed += refund
+            refund = 0
+        elif refund > 0:
+            bank_stub = bankStubAsync(my_client_obj.getBankId())
+
+            request_obj = bank_pb2.AmountTransferRequest()
+            request_obj.receiver_username = my_username
+            request_obj.amount = refund
+            request_obj.type = "reimbursement"
+            request_obj.idempotency_key = f"{bulk_id}/refund"
+
+            response = await bank_stub.Credit(request_obj, timeout=TIMEOUT_S)
+            if response.err_code == 1:
+                logger.error(f"Failed to refund {refund} to {my_username}: {response.text}")
+            else:
+                final_balance = response.balance
+
+        response_obj.err_code = 0
+        response_obj.text = "Bulk transfer processed"
+        response_obj.balance = final_balance
+        response_obj.total_transferred = total - refund - unconfirmed
+        response_obj.total_refunded = refund
+        response_obj.total_pending = unconfirmed
+        response_obj.results.extend(payment_gateway_pb2.TransferLegResult(index=index, err_code=err_code, text=text) for index, (err_code, text) in enumerate(results))
+        if unconfirmed > 0:
+            response_obj.text = "Bulk transfer incomplete; retry with the same idempotency key"
+            logger.error(f"Bulk transfer incomplete; transferred = {total - unconfirmed}, pending = {unconfirmed}")
+            raise OutcomeUnknown(response_obj)
+        logger.info(f"Bulk transfer done; transferred = {total - refund}, refunded = {refund}")
+        return response_obj
+
+
+class AuthenticationInterceptor(grpc.ServerInterceptor):
+    def intercept_service(self, continuation, handler_call_details):
+        role, _ = getRoleUsername(handler_call_details)
+
+        allowed_methods = ROLE_PERMISSIONS.get(role)
+        if allowed_methods is None:
+            # Unknown token, or its session expired or was evicted
+            return self._deny_access(continuation(handler_call_details), grpc.StatusCode.UNAUTHENTICATED, SESSION_EXPIRED_MESSAGE)
+        if "*" not in allowed_methods and handler_call_details.method not in allowed_methods:
+            return self._deny_access(continuation(handler_call_details), grpc.StatusCode.PERMISSION_DENIED, "Permission denied")
             
-    for admin in admins:
-        if admin["username"] == username:
-            return True
+        return continuation(handler_call_details)
+
+    def _deny_access(self, handler, code, message):
+        if handler is None:
+            return None
+
+        def abort(ignored_request, context):
+            context.abort(code, message)
+
+        def abort_stream(ignored_request, context):
+            context.abort(code, message)
+            yield
+
+        if handler.unary_stream is not None:
+            return grpc.unary_stream_rpc_method_handler(abort_stream, request_deserializer=handler.request_deserializer)
+        return grpc.unary_unary_rpc_method_handler(abort, request_deserializer=handler.request_deserializer)
+
+
+class BankUnavailableInterceptor(grpc.ServerInterceptor):
+    # Answers UNAVAILABLE right away when a handler needs a bank whose lease
+    # has expired, instead of letting the call to it time out
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        if handler.unary_stream is not None:
+            def stream_handler(request, servicer_context):
+                try:
+                    yield from handler.unary_stream(request, servicer_context)
+                except BankUnavailable as e:
+                    servicer_context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+
+            return grpc.unary_stream_rpc_method_handler(
+                stream_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        def unary_handler(request, servicer_context):
+            try:
+                return handler.unary_unary(request, servicer_context)
+            except BankUnavailable as e:
+                servicer_context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+
+class AsyncAuthenticationInterceptor(grpc.aio.ServerInterceptor):
+    # AuthenticationInterceptor for the grpc.aio gateway
+    async def intercept_service(self, continuation, handler_call_details):
+        role, _ = getRoleUsername(handler_call_details)
+
+        allowed_methods = ROLE_PERMISSIONS.get(role)
+        if allowed_methods is None:
+            return self._deny_access(await continuation(handler_call_details), grpc.StatusCode.UNAUTHENTICATED, SESSION_EXPIRED_MESSAGE)
+        if "*" not in allowed_methods and handler_call_details.method not in allowed_methods:
+            return self._deny_access(await continuation(handler_call_details), grpc.StatusCode.PERMISSION_DENIED, "Permission denied")
+
+        return await continuation(handler_call_details)
+
+    def _deny_access(self, handler, code, message):
+        if handler is None:
+            return None
+
+        async def abort(ignored_request, context):
+            await context.abort(code, message)
+
+        async def abort_stream(ignored_request, context):
+            await context.abort(code, message)
+            yield
+
+        if handler.unary_stream is not None:
+            return grpc.unary_stream_rpc_method_handler(abort_stream, request_deserializer=handler.request_deserializer)
+        return grpc.unary_unary_rpc_method_handler(abort, request_deserializer=handler.request_deserializer)
+
+
+class AsyncBankUnavailableInterceptor(grpc.aio.ServerInterceptor):
+    # BankUnavailableInterceptor for the grpc.aio gateway
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        if handler.unary_stream is not None:
+            async def stream_handler(request, servicer_context):
+                try:
+                    async for response in handler.unary_stream(request, servicer_context):
+                        yield response
+                except BankUnavailable as e:
+                    await servicer_context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+
+            return grpc.unary_stream_rpc_method_handler(
+                stream_handler,
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer
+            )
+
+        async def unary_handler(request, servicer_context):
+            try:
+                return await handler.unary_unary(request, servicer_context)
+            except BankUnavailable as e:
+                await servicer_context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+
+        return grpc.unary_unary_rpc_method_handler(
+            unary_handler,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+
+def check_client_exist(bank_id, username, acc_no):
+    bank_stub = bankStub(bank_id)
+
+    request_obj = bank_pb2.CheckClientExistRequest()
+    request_obj.username = username
+    request_obj.acc_no = acc_no
+
+    response = bank_stub.CheckClientExist(request_obj, timeout=TIMEOUT_S)
+
+    if response.err_code == 1:
+        logger.error(response.text)
+        return False
+    else:
+        logger.info(f"Client {username} in bank {bank_id} exists.")
+        return True
+
+
+async def check_client_exist_async(bank_id, username, acc_no):
+    bank_stub = bankStubAsync(bank_id)
+
+    request_obj = bank_pb2.CheckClientExistRequest()
+    request_obj.username = username
+    request_obj.acc_no = acc_no
+
+    response = await bank_stub.CheckClientExist(request_obj, timeout=TIMEOUT_S)
+
+    if response.err_code == 1:
+        logger.error(response.text)
+        return False
+    else:
+        logger.info(f"Client {username} in bank {bank_id} exists.")
+        return True
+
+
+def bankIdempotencyKey(request, context, step):
+    # Key of one bank call made for a client request, so that retrying the
+    # request repeats none of the calls that already went through
+    if request.idempotency_key == "":
+        return ""
+    return f"{getActiveSessionUsername(context)}/{request.idempotency_key}/{step}"
+
+
+def transferId(request, context):
+    # Journal id of a transfer between banks; retries of the request get the same one
+    return bankIdempotencyKey(request, context, "transfer") or uuid.uuid4().hex
+
+
+def getActiveSessionUsername(context):
+    metadata = dict(context.invocation_metadata())
+    session_token = metadata.get("authorization")
+    role, username = session_store.lookup(session_token)
+    return username
+
+
+def getRoleUsername(handler_call_details):
+    metadata = dict(handler_call_details.invocation_metadata)
+    session_token = metadata.get("authorization")
+    if session_token == "auth":
+        return "auth", "auth"
+    elif session_token == "bank":
+        return "bank", "bank"
+    role, username = session_store.lookup(session_token)
+    return role, username
+
+
+def clear_screen():
+    os.system("cls" if os.name == "nt" else "clear")
+
+
+routing_table = BankRoutingTable()
+use_aio = False     # --aio
+
+admin_details_file_realtive_path = "admin_details.json"
+admin_file_path = script_dir / admin_details_file_realtive_path
+
+def read_admins():
+    with admin_file_path.open("r", encoding="utf-8") as file:
+        credential_store.setAdmins(json.load(file))
+
+
+def watch_file(file_path, reload, name, interval_s):
+    # Calls reload() whenever the file changes, so that e.g. admins can be
+    # added or session keys rotated without restarting the gateway
+    last_change = None
+    while True:
+        try:
+            stat = Path(file_path).stat()
+            change = (stat.st_mtime_ns, stat.st_size)
+            if last_change is not None and change != last_change:
+                last_change = change
+                reload()
+                logger.info(f"{name} reloaded")
+            last_change = change
+        except (OSError, ValueError, KeyError) as e:
+            # Keep what was loaded last until the file is fixed
+            logger.error(f"Could not reload {name.lower()}: {e}")
+        time.sleep(interval_s)
+
+
+def getClient(username=None):
+    return routing_table.getClient(username)
+
+
+def isBankRegistered(bank_id=None, bank_port=None):
+    if bank_port is None and bank_id is not None:
+        return routing_table.getBank(bank_id) is not None
+    elif bank_id is None and bank_port is not None:
+        return routing_table.getBankByPort(bank_port) is not None
     return False
 
 
+def getBankIdForClient(username=None):
+    client = routing_table.getClient(username)
+    if client is None:
+        return -1
+    return client.getBankId()
+
+
+def isUsernameRegistered(username=None):
+    return credential_store.isRegistered(username)
+
+
+def getBank(bank_id):
+    return routing_table.getBank(bank_id)
+
+
+def bankStub(bank_id):
+    # Stub on the pooled channel to a bank; raises BankUnavailable while its lease is expired
+    bank = getBank(bank_id)
+    if bank is None or not bank.isHealthy():
+        raise BankUnavailable(bank_id)
+    return bank.getStub()
+
+
+def bankStubAsync(bank_id):
+    # bankStub() for the --aio gateway, on the bank's grpc.aio channel
+    bank = getBank(bank_id)
+    if bank is None or not bank.isHealthy():
+        raise BankUnavailable(bank_id)
+    return bank.getAsyncStub()
+
+
 def getBankPortById(bank_id=None):
-    for bank in registered_banks:
-        if bank.getId() == bank_id:
-            return bank.getPort()
-    return None
+    bank = routing_table.getBank(bank_id)
+    if bank is None:
+        return None
+    return bank.getPort()
 
 
 def getRole(username, password):
-    for bank in registered_banks:
-        for client in bank.getAllClients():
-            if client.getUsername() == username and client.checkPassword(password):
-                return "client"
-    for admin in admins:
-        if admin["username"] == username and admin["password"] == password:
-            return "admin"
-    return None
+    return credential_store.authenticate(username, password)
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), interceptors=[LoggingInterceptor(), AuthenticationInterceptor()])
-    payment_gateway_grpc.add_PaymentGatewayServicer_to_server(PaymentGatewayServicer(), server)
-    
+def serverCredentials():
     # Secure with SSL/TLS
     private_key_realtive_path = "server.key"
     file_path = script_dir / private_key_realtive_path
@@ -623,28 +2486,120 @@ def serve():
     with open(file_path, "rb") as f:
         certificate_chain = f.read()
 
-    server_credentials = grpc.ssl_server_credentials(
+    return grpc.ssl_server_credentials(
         [(private_key, certificate_chain)]
     )
-    server.add_secure_port(f"localhost:{port}", server_credentials)
+
+
+def serverOptions():
+    # Gateway processes sharing state also share the port; the kernel spreads connections across them
+    return [("grpc.so_reuseport", 1)] if isinstance(routing_table, SqliteRoutingTable) else None
+
+
+def serve():
+    executor = CountingThreadPoolExecutor(max_workers)
+    admission = AdmissionController("Gateway", admission_control_mode, max_concurrent_rpcs, min_limit=max_workers, executor=executor)
+    server = grpc.server(executor, interceptors=[AdmissionControlInterceptor(admission), LoggingInterceptor(), AuthenticationInterceptor(), BankUnavailableInterceptor()],
+                         options=serverOptions(), maximum_concurrent_rpcs=admission.hardLimit())
+    payment_gateway_grpc.add_PaymentGatewayServicer_to_server(PaymentGatewayServicer(), server)
+    
+    server.add_secure_port(f"localhost:{port}", serverCredentials())
     
     server.start()
     logger.info(f"Payment Gateway server started at port = {port}")
+    threading.Thread(target=transfer_coordinator.recoverPeriodically, name="transfer-recovery", daemon=True).start()
     server.wait_for_termination()
 
 
-if __name__ == "__main__":
-    logger.remove()
-    logger.add(sys.stdout, format="{time:MMMM D, YYYY - HH:mm:ss} {level} --- <level>{message}</level>")
+async def serve_aio():
+    # Single event loop serving every RPC; see AsyncPaymentGatewayServicer
+    admission = AdmissionController("Gateway", admission_control_mode, max_concurrent_rpcs)
+    server = grpc.aio.server(interceptors=[AsyncAdmissionControlInterceptor(admission), AsyncLoggingInterceptor(), AsyncAuthenticationInterceptor(),
+                                           AsyncBankUnavailableInterceptor()],
+                             options=serverOptions(), maximum_concurrent_rpcs=admission.hardLimit())
+    payment_gateway_grpc.add_PaymentGatewayServicer_to_server(AsyncPaymentGatewayServicer(), server)
+
+    server.add_secure_port(f"localhost:{port}", serverCredentials())
 
+    await server.start()
+    logger.info(f"Payment Gateway server started in asyncio mode at port = {port}")
+    # Referenced until the server stops, so the task isn't garbage collected
+    recovery = asyncio.create_task(transfer_coordinator.recoverPeriodically())
+    await server.wait_for_termination()
+
+
+if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Start the Payment Gateway gRPC Server")
     parser.add_argument("--port", type=int, default=50051, help="Port number to run the gRPC server on")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Threads serving RPCs")
+    parser.add_argument("--aio", action="store_true", help="Serve RPCs with grpc.aio on a single event loop instead of a thread pool")
+    parser.add_argument("--max-concurrent-rpcs", type=int, default=DEFAULT_MAX_CONCURRENT_RPCS, help="Upper bound of RPCs queued or running; excess load is rejected with RESOURCE_EXHAUSTED")
+    parser.add_argument("--admission-control", choices=ADMISSION_CONTROL_MODES, default="adaptive", help="Adapt the concurrency limit to latency, keep it fixed at --max-concurrent-rpcs, or turn it off")
+    parser.add_argument("--bank-lease-s", type=float, default=DEFAULT_BANK_LEASE_S, help="Seconds a bank stays routable without a heartbeat")
+    parser.add_argument("--session-idle-ttl-s", type=float, default=DEFAULT_SESSION_IDLE_TTL_S, help="Seconds a session stays valid without requests")
+    parser.add_argument("--session-absolute-ttl-s", type=float, default=DEFAULT_SESSION_ABSOLUTE_TTL_S, help="Seconds a session stays valid after login at most")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS, help="Most sessions kept; the least recently used is ended first")
+    parser.add_argument("--session-tokens", choices=SESSION_TOKEN_MODES, default="store", help="Keep sessions in this gateway, or issue signed tokens any gateway sharing --session-keys-file can verify")
+    parser.add_argument("--session-keys-file", type=Path, default=None, help="JSON file with the signing keys and revocation list for --session-tokens=signed")
+    parser.add_argument("--state-backend", choices=STATE_BACKENDS, default="memory", help="Keep bank and client registrations in this process, or share them through --state-db with other gateway processes on the host")
+    parser.add_argument("--state-db", type=Path, default=DEFAULT_STATE_DB, help="SQLite database for --state-backend=sqlite")
+    parser.add_argument("--transfer-journal", type=Path, default=DEFAULT_TRANSFER_JOURNAL, help="SQLite database journaling transfers between banks until they finish")
+    parser.add_argument("--auth-cache-entries", type=int, default=DEFAULT_AUTH_CACHE_ENTRIES, help="Recently verified logins remembered so they skip password hashing")
+    parser.add_argument("--idempotency-ttl-s", type=float, default=DEFAULT_IDEMPOTENCY_TTL_S, help="Seconds the response to a money-moving request is kept for replays of its idempotency key")
+    parser.add_argument("--idempotency-max-entries", type=int, default=DEFAULT_IDEMPOTENCY_MAX_ENTRIES, help="Most idempotency keys remembered at once; the oldest are dropped first")
+    parser.add_argument("--log-queue-size", type=int, default=DEFAULT_LOG_QUEUE_SIZE, help="Log records waiting for the writer thread before low-severity ones are dropped")
+    parser.add_argument("--log-max-bytes", type=int, default=DEFAULT_LOG_MAX_BYTES, help="Size at which the log file is rotated (0 to never rotate)")
+    parser.add_argument("--log-backups", type=int, default=DEFAULT_LOG_BACKUPS, help="Rotated log files kept")
+    parser.add_argument("--request-log-sample-rate", type=float, default=1.0, help="Fraction of requests whose INFO logs are written (0 turns them off; errors are always logged)")
 
     args = parser.parse_args()
+    if args.session_tokens == "signed" and args.session_keys_file is None:
+        parser.error("--session-tokens=signed needs --session-keys-file")
+
+    global log_pipeline
+    log_pipeline = LogPipeline(LOG_FILE, args.log_queue_size, args.log_max_bytes, args.log_backups, args.request_log_sample_rate).start()
+    atexit.register(log_pipeline.close)
     
     global port
     port = args.port
+
+    global max_workers, max_concurrent_rpcs, admission_control_mode
+    max_workers = args.max_workers
+    max_concurrent_rpcs = args.max_concurrent_rpcs
+    admission_control_mode = args.admission_control
+    use_aio = args.aio
+
+    global credential_store
+    credential_store = CredentialStore(args.auth_cache_entries)
+
+    # Loads the registrations of the other processes, so after the credential store
+    if args.state_backend == "sqlite":
+        routing_table = SqliteRoutingTable(args.state_db)
+
+    global session_store
+    if args.session_tokens == "signed":
+        session_store = SignedSessionTokens(args.session_keys_file, args.session_absolute_ttl_s)
+        threading.Thread(target=watch_file, args=(args.session_keys_file, session_store.load, "Session keys file", SESSION_KEYS_POLL_INTERVAL_S),
+                         name="session-keys-watcher", daemon=True).start()
+    else:
+        session_store = SessionStore(args.session_idle_ttl_s, args.session_absolute_ttl_s, args.max_sessions)
+    threading.Thread(target=session_store.reportPeriodically, name="session-stats", daemon=True).start()
+
+    global bank_lease_s
+    bank_lease_s = args.bank_lease_s
+
+    global idempotency_cache
+    idempotency_cache = IdempotencyCache(args.idempotency_max_entries, args.idempotency_ttl_s)
+
+    global transfer_coordinator
+    transfer_journal = TransferJournal(args.transfer_journal)
+    transfer_coordinator = AsyncTransferCoordinator(transfer_journal) if use_aio else TransferCoordinator(transfer_journal)
     
     clear_screen()
     read_admins()
-    serve()
\ No newline at end of file
+    threading.Thread(target=watch_file, args=(admin_file_path, read_admins, "Admin file", ADMIN_FILE_POLL_INTERVAL_S),
+                     name="admin-file-watcher", daemon=True).start()
+    if use_aio:
+        asyncio.run(serve_aio())
+    else:
+        serve()
\ No newline at end of file
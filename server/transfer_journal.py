@@ -0,0 +1,198 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from loguru import logger
+
+TRANSFER_JOURNAL_TIMEOUT_S = 5
+TRANSFER_JOURNAL_STATS_INTERVAL_S = 60
+TRANSFER_JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    transfer_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,        -- Step the transfer is at, see TransferCoordinator
+    request BLOB NOT NULL,      -- Serialized bank AmountTransferRequest
+    owner TEXT NOT NULL,        -- Gateway process driving the transfer
+    updated_at REAL NOT NULL    -- Unix time the owner last took a step
+);
+"""
+
+
+def _resolveFuture(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class _JournalWrite:
+    def __init__(self, statement, params, loop=None):
+        self.statement = statement
+        self.params = params
+        self.rowcount = None
+        self.done = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+
+class TransferJournal:
+    """
+    Transfers between banks that the gateway has started and not finished,
+    in a SQLite database, so that they can be finished or undone after a
+    crash. Several gateway processes may share the database; each transfer
+    row names the process driving it.
+
+    Writes are queued and a single background thread commits everything
+    queued meanwhile in one transaction, so concurrent transfers share the
+    cost of a sync (group commit) instead of waiting for each other's.
+    If that transaction fails, its writes are retried one at a time, so
+    one bad write doesn't fail the others. Waiting for a write returns the
+    number of rows it changed.
+    """
+    def __init__(self, db_path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=TRANSFER_JOURNAL_TIMEOUT_S, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # A step is only taken once the journal says so, even after a power loss
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.executescript(TRANSFER_JOURNAL_SCHEMA)
+        self.db_lock = threading.Lock()
+        self.owner = uuid.uuid4().hex
+
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.pending = []
+        self.commits = 0
+        self.writes_committed = 0
+        threading.Thread(target=self._commitLoop, name="transfer-journal", daemon=True).start()
+
+    def _queue(self, statement, params, loop=None):
+        write = _JournalWrite(statement, params, loop)
+        with self.lock:
+            self.pending.append(write)
+            self.work_available.notify()
+        return write
+
+    def _wait(self, write):
+        write.done.wait()
+        if isinstance(write.rowcount, Exception):
+            raise write.rowcount
+        return write.rowcount
+
+    async def _waitAsync(self, write):
+        rowcount = await write.future
+        if isinstance(rowcount, Exception):
+            raise rowcount
+        return rowcount
+
+    def _commitLoop(self):
+        last_report_time = time.monotonic()
+        last_report_commits = 0
+        last_report_writes = 0
+
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.work_available.wait()
+                batch = self.pending
+                self.pending = []
+
+            with self.db_lock:
+                try:
+                    self.db.execute("BEGIN IMMEDIATE")
+                    rowcounts = [self.db.execute(write.statement, write.params).rowcount for write in batch]
+                    self.db.execute("COMMIT")
+                except sqlite3.Error as e:
+                    logger.error(f"Could not write transfer journal: {e}")
+                    if self.db.in_transaction:
+                        self.db.execute("ROLLBACK")
+                    rowcounts = [e]
+                    if len(batch) > 1:
+                        # Only the writes that fail on their own get the error
+                        rowcounts = [self._executeAlone(write) for write in batch]
+
+            for write, rowcount in zip(batch, rowcounts):
+                write.rowcount = rowcount
+                write.done.set()
+                if write.loop is not None:
+                    write.loop.call_soon_threadsafe(_resolveFuture, write.future, rowcount)
+
+            self.commits += 1
+            self.writes_committed += len(batch)
+            now = time.monotonic()
+            if now - last_report_time >= TRANSFER_JOURNAL_STATS_INTERVAL_S:
+                elapsed = now - last_report_time
+                logger.info(f"Transfer journal: {(self.commits - last_report_commits) / elapsed:.1f} commits/s, "
+                            f"{(self.writes_committed - last_report_writes) / elapsed:.1f} writes/s")
+                last_report_time = now
+                last_report_commits = self.commits
+                last_report_writes = self.writes_committed
+
+    def _executeAlone(self, write):
+        # Commits one write in its own transaction; returns its rowcount or the error
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+            rowcount = self.db.execute(write.statement, write.params).rowcount
+            self.db.execute("COMMIT")
+            return rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Could not write transfer journal: {e}")
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            return e
+
+    # Each write below comes as a method waiting for it and a coroutine awaiting it
+
+    def _beginWrite(self, transfer_id, state, request, loop=None):
+        return self._queue("INSERT OR IGNORE INTO transfers (transfer_id, state, request, owner, updated_at) VALUES (?, ?, ?, ?, ?)",
+                           (transfer_id, state, request, self.owner, time.time()), loop)
+
+    def begin(self, transfer_id, state, request):
+        # Records a new transfer; False if the transfer id is already journaled
+        return self._wait(self._beginWrite(transfer_id, state, request)) == 1
+
+    async def beginAsync(self, transfer_id, state, request):
+        return await self._waitAsync(self._beginWrite(transfer_id, state, request, asyncio.get_running_loop())) == 1
+
+    def _advanceWrite(self, transfer_id, state, loop=None):
+        return self._queue("UPDATE transfers SET state = ?, updated_at = ? WHERE transfer_id = ? AND owner = ?",
+                           (state, time.time(), transfer_id, self.owner), loop)
+
+    def advance(self, transfer_id, state):
+        # Moves a transfer of this process to its next step; False if another process took it over
+        return self._wait(self._advanceWrite(transfer_id, state)) == 1
+
+    async def advanceAsync(self, transfer_id, state):
+        return await self._waitAsync(self._advanceWrite(transfer_id, state, asyncio.get_running_loop())) == 1
+
+    def _claimWrite(self, transfer_id, stale_before, loop=None):
+        return self._queue("UPDATE transfers SET owner = ?, updated_at = ? WHERE transfer_id = ? AND (owner = ? OR updated_at < ?)",
+                           (self.owner, time.time(), transfer_id, self.owner, stale_before), loop)
+
+    def claim(self, transfer_id, stale_before):
+        # Makes this process the owner of a transfer that is already its own
+        # or whose owner took no step since stale_before (Unix time)
+        return self._wait(self._claimWrite(transfer_id, stale_before)) == 1
+
+    async def claimAsync(self, transfer_id, stale_before):
+        return await self._waitAsync(self._claimWrite(transfer_id, stale_before, asyncio.get_running_loop())) == 1
+
+    def finish(self, transfer_id):
+        # Nothing waits for this: a finished transfer found again after a
+        # crash is only driven through its last steps once more, and the
+        # receiver's bank remembers the credit in its reservation table
+        self._queue("DELETE FROM transfers WHERE transfer_id = ? AND owner = ?", (transfer_id, self.owner))
+
+    def get(self, transfer_id):
+        # (state, request) of a journaled transfer, or None
+        with self.db_lock:
+            return self.db.execute("SELECT state, request FROM transfers WHERE transfer_id = ?", (transfer_id,)).fetchone()
+
+    def stale(self, stale_before):
+        # (transfer id, state, request) of transfers nobody took a step on since stale_before
+        with self.db_lock:
+            return self.db.execute("SELECT transfer_id, state, request FROM transfers WHERE updated_at < ?", (stale_before,)).fetchall()
+
+    def __len__(self):
+        with self.db_lock:
+            return self.db.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]